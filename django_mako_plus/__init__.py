@@ -15,11 +15,11 @@ from .version import __version__
 
 # the router, middleware, and view function decorator
 from .middleware import RequestInitMiddleware
-from .router import view_function, app_resolver, dmp_path
+from .router import view_function, app_resolver, dmp_path, dispatch_resolver
 
 
 # converter decorator
-from .converter import parameter_converter
+from .converter import parameter_converter, Fetch, Cached, QueryParam, PostParam, HeaderParam
 
 
 # the middleware and template
@@ -41,7 +41,7 @@ from .exceptions import ConverterException
 from .filters import django_syntax, jinja2_syntax, alternate_syntax
 from .templatetags.django_mako_plus import dmp_include
 # used internally for autoescaping
-from .template import ExpressionPostProcessor
+from .template import ExpressionPostProcessor, expression_text, expression_filter
 
 # the http responses
 from .http import HttpResponseJavascriptRedirect
@@ -63,6 +63,7 @@ from .convenience import get_template_loader_for_path
 
 # the utilities
 from .util import merge_dicts
+from .warmup import warmup
 
 
 # the urls
@@ -73,6 +74,7 @@ from .util import merge_dicts
 
 # html content shortcuts
 from .provider import links
+from .template import flush
 from .provider import template_links, template_obj_links
 # html content providers
 from .provider.base import BaseProvider
@@ -1,12 +1,21 @@
 from django.apps import apps, AppConfig
 from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.core.exceptions import ImproperlyConfigured
 from django.template import engines
 
 from .defaults import DEFAULT_OPTIONS
+from .provider.base import BaseProvider
 from .provider.runner import ProviderRun
+from .router.data import route_file_changed
+from .router.discover import view_file_changed, NOT_FOUND_VIEWS
 from .signals import dmp_signal_register_app
+from .template import TEMPLATE_REGISTRY
+from .template.adapter import reset_context_processor_output
+from .usage import USAGE_PROFILE
+from .watcher import FILE_WATCHER
 
+import os, os.path
 import threading
 
 
@@ -38,6 +47,9 @@ class Config(AppConfig):
         ]
         self.template_imports.extend(self.options['DEFAULT_TEMPLATE_IMPORTS'])
 
+        # budget of the in-memory template cache
+        TEMPLATE_REGISTRY.configure(self.options['TEMPLATES_CACHE_SIZE'], self.options['TEMPLATES_CACHE_MEMORY'])
+
         # initialize the list of providers
         ProviderRun.initialize_providers()
 
@@ -45,6 +57,43 @@ class Config(AppConfig):
         from .converter.base import ParameterConverter
         ParameterConverter._sort_converters(app_ready=True)
 
+        # cache-backed model parameters
+        from .converter.cache import MODEL_CACHE
+        MODEL_CACHE.configure(self.options['MODEL_CACHE'], self.options['MODEL_CACHE_ALIAS'], self.options['MODEL_CACHE_LOCK_TIMEOUT'])
+        from .converter.formats import DATETIME_INPUT_FORMATS, DATE_INPUT_FORMATS
+        DATETIME_INPUT_FORMATS.prepare()
+        DATE_INPUT_FORMATS.prepare()
+
+        # the per-request context processor output is stale after a login or logout
+        user_logged_in.connect(reset_context_processor_output, dispatch_uid='dmp_reset_context_processor_output')
+        user_logged_out.connect(reset_context_processor_output, dispatch_uid='dmp_reset_context_processor_output')
+
+        # failed view discoveries
+        NOT_FOUND_VIEWS.configure(self.options['VIEW_NOT_FOUND_CACHE_SIZE'], self.options['VIEW_NOT_FOUND_CACHE_TTL'])
+
+        # in debug mode, keep the caches on and invalidate them when files change
+        FILE_WATCHER.add_listener(TEMPLATE_REGISTRY.file_changed)
+        FILE_WATCHER.add_listener(BaseProvider.file_changed)
+        FILE_WATCHER.add_listener(view_file_changed)
+        FILE_WATCHER.add_listener(route_file_changed)   # after view_file_changed
+        for template_dir in self.options['TEMPLATES_DIRS']:
+            FILE_WATCHER.add_directory(template_dir)
+        if settings.DEBUG and self.options['FILE_WATCHER']:
+            FILE_WATCHER.start(self.options['FILE_WATCHER_INTERVAL'])
+
+        # load everything now (before a pre-forking server forks its workers)
+        profile = os.path.join(settings.BASE_DIR, self.options['USAGE_PROFILE']) if self.options['USAGE_PROFILE'] else None
+        if self.options['WARMUP']:
+            from .warmup import warmup
+            if profile is not None and os.path.exists(profile):
+                warmup(profile=profile, size=self.options['WARMUP_SIZE'])
+            else:
+                warmup()
+
+        # record usage for the next warmup
+        if profile is not None:
+            USAGE_PROFILE.configure(profile, self.options['USAGE_PROFILE_INTERVAL'])
+
 
     def register_app(self, app=None):
         '''
@@ -69,6 +118,9 @@ class Config(AppConfig):
             # first time for this app, so add to our dictionary
             self.registered_apps[app.name] = app
 
+            # templates, views, and static files of the app (only used when the watcher is active)
+            FILE_WATCHER.add_directory(app.path)
+
             # set up the template, script, and style renderers
             # these create and cache just by accessing them
             self.engine.get_template_loader(app, 'templates', create=True)
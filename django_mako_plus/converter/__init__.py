@@ -1,8 +1,9 @@
 
 # public items in this package
-from .parameter import ViewParameter
+from .parameter import ViewParameter, Fetch, ParameterSource, QueryParam, PostParam, HeaderParam
 from .decorators import parameter_converter
 from .base import ParameterConverter
+from .cache import Cached, MODEL_CACHE
 
 
 # import the default converters
@@ -1,14 +1,45 @@
 from django.core.exceptions import ImproperlyConfigured
 
-from ..util import log
+from ..util import log, run_in_thread
 from ..exceptions import ConverterHttp404, ConverterException
 from .parameter import ViewParameter
 from .info import ConverterFunctionInfo
 
 import logging
 import inspect
+import typing
+from collections import namedtuple
 from operator import attrgetter
 import functools
+try:
+    from typing import get_origin, get_args
+except ImportError:  # Python < 3.8
+    def get_origin(tp):
+        return getattr(tp, '__origin__', None)
+    def get_args(tp):
+        return getattr(tp, '__args__', ())
+try:
+    from types import UnionType
+except ImportError:  # Python < 3.10 doesn't have `int | None`
+    UnionType = typing.Union
+
+
+# one step of a binding plan (see ParameterConverter._build_plan)
+#     parameter:      the ViewParameter
+#     args_index:     index of this parameter's value when it is given in *args
+#     convert:        function(value, parameter, request), or None to pass the value through unconverted
+#     prefetch:       the converter's prefetch function (see parameter_converter), or None
+#     source:         where the value comes from if not the urlparams (see ParameterSource), or None
+ParameterBinding = namedtuple('ParameterBinding', [ 'parameter', 'args_index', 'convert', 'prefetch', 'source' ])
+
+
+class BindingPlan(tuple):
+    '''
+    A tuple of ParameterBindings.  `blocking` is True when one of its converters
+    might block (see parameter_converter), which tells aconvert_parameters() to
+    convert in a worker thread.
+    '''
+    blocking = False
 
 
 class ParameterConverter(object):
@@ -29,8 +60,11 @@ class ParameterConverter(object):
 
         convert_value(): where individual parameters are converted.
 
-        __call__(): the controller that iterates the parameter values
-        and calls convert_value().
+        convert_parameters(): the controller that iterates the parameter values
+        and converts them.
+
+    When convert_value() is not overridden, the converter function for each parameter
+    is looked up once (per view function) rather than on every request.
     '''
 
     # the registry of converters (populated by the @converter_function decorator)
@@ -38,6 +72,8 @@ class ParameterConverter(object):
     # this variable prevents sorting until Django is ready (because during sorting
     # we switch "myapp.MyModel" to the actual model instance)
     _sorting_enabled = False
+    # incremented when the converters change, which tells instances to rebuild their binding plans
+    _converters_version = 0
 
     def __init__(self, view_function):
         self.view_function = view_function
@@ -57,6 +93,92 @@ class ParameterConverter(object):
             if 'get' in self.view_parameters and 'head' not in self.view_parameters:
                 self.view_parameters['head'] = self.view_parameters['get']
 
+        # the binding plans (built from view_parameters)
+        self._build_plans()
+
+
+    def _build_plans(self):
+        '''
+        Builds a binding plan for each entry in view_parameters: the parameters to bind
+        (skipping the request, *args, and **kwargs), each with its converter function
+        already looked up.  Called again if the registered converters change.
+        '''
+        self._plans_version = ParameterConverter._converters_version
+        self.plans = {}
+        plans_by_id = {}
+        for key, parameters in self.view_parameters.items():
+            if id(parameters) not in plans_by_id:  # `head` shares the plan of `get`
+                plans_by_id[id(parameters)] = self._build_plan(parameters)
+            self.plans[key] = plans_by_id[id(parameters)]
+
+
+    def _build_plan(self, parameters):
+        '''Returns the binding plan for a sequence of ViewParameters'''
+        # subclasses that customize convert_value() get it called for every parameter
+        custom_convert = type(self).convert_value is not ParameterConverter.convert_value
+        plan = []
+        blocking = custom_convert
+        for parameter_i, parameter in enumerate(parameters):
+            # skip request object, *args, **kwargs
+            if parameter_i == 0 or parameter.kind is inspect.Parameter.VAR_POSITIONAL or parameter.kind is inspect.Parameter.VAR_KEYWORD:
+                continue
+            prefetch = None
+            if custom_convert:
+                convert = self.convert_value
+            elif parameter.type is inspect.Parameter.empty:
+                # we don't convert anything without type hints
+                convert = None
+            else:
+                convert, prefetch, converter_blocking = self._bind_converter(parameter)
+                blocking = blocking or converter_blocking or prefetch is not None
+            # List[type] parameters convert each item
+            if convert is not None and parameter.container is not None:
+                convert = _convert_items(convert)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('parameter `%s` of %s will be converted with %s', parameter.name, self.view_function, convert)
+            plan.append(ParameterBinding(parameter, parameter_i - 1, convert, prefetch, parameter.source))
+        plan = BindingPlan(plan)
+        plan.blocking = blocking
+        return plan
+
+
+    def _bind_converter(self, parameter):
+        '''
+        Returns ( convert, prefetch, blocking ) for the parameter's type, where convert is a
+        function(value, parameter, request) that converts values with the matching
+        converter function (see convert_value() for the rules), prefetch is the
+        converter's prefetch function or None, and blocking is the converter's blocking flag.
+        '''
+        try:
+            ci = self._find_converter(parameter.type)
+        except Exception as e:
+            # raise when the parameter is converted (just like convert_value does)
+            error = e
+            def convert(value, parameter, request):
+                return self._call_converter(functools.partial(_raise, error), value, parameter)
+            return convert, None, False
+        convert_func = ci.convert_func
+        if ci.takes_request:
+            def convert(value, parameter, request):
+                return self._call_converter(convert_func, value, parameter, request)
+        else:
+            def convert(value, parameter, request):
+                return self._call_converter(convert_func, value, parameter)
+        return convert, ci.prefetch_func, ci.blocking
+
+
+    def _find_converter(self, convert_type):
+        '''
+        Returns the ConverterFunctionInfo for the given type.
+        I'm iterating through the list to find the most specific match first
+        The list is sorted by specificity so subclasses come before their superclasses
+        '''
+        for ci in self.converters:
+            if issubclass(convert_type, ci.convert_type):
+                return ci
+        # if we get here, there wasn't a converter or this type
+        raise ImproperlyConfigured('No parameter converter exists for type: {}. Do you need to add an @parameter_converter function for the type?'.format(convert_type))
+
 
     def _collect_parameters(self, func, class_based=False):
         func_parameters = list(inspect.signature(func).parameters.values())
@@ -68,21 +190,38 @@ class ParameterConverter(object):
 
         params = []
         for i, p in enumerate(func_parameters):
+            # Annotated[type, x, ...] converts by type, and x, ... go to the converter as metadata
+            annotation, metadata, default, container = p.annotation, (), p.default, None
+            if hasattr(annotation, '__metadata__'):
+                annotation, metadata = annotation.__origin__, tuple(annotation.__metadata__)
+            # Optional[type] converts by type, with a default of None
+            if get_origin(annotation) in ( typing.Union, UnionType ):
+                types = [ t for t in get_args(annotation) if t is not type(None) ]
+                if len(types) == 1 and len(get_args(annotation)) == 2:
+                    annotation = types[0]
+                    if default is inspect.Parameter.empty:
+                        default = None
+            # List[type] converts each item by type
+            if get_origin(annotation) is list and len(get_args(annotation)) == 1:
+                annotation, container = get_args(annotation)[0], list
             params.append(ViewParameter(
                 name=p.name,
                 position=i,
                 kind=p.kind,
-                type=p.annotation,
-                default=p.default,
+                type=annotation,
+                default=default,
+                metadata=metadata,
+                container=container,
             ))
         return tuple(params)
 
 
     @classmethod
-    def _register_converter(cls, conv_func, conv_type):
+    def _register_converter(cls, conv_func, conv_type, prefetch_func=None, blocking=True):
         '''Triggered by the @converter_function decorator'''
-        cls.converters.append(ConverterFunctionInfo(conv_func, conv_type, len(cls.converters)))
+        cls.converters.append(ConverterFunctionInfo(conv_func, conv_type, len(cls.converters), prefetch_func, blocking))
         cls._sort_converters()
+        ParameterConverter._converters_version += 1
 
 
     @classmethod
@@ -95,6 +234,7 @@ class ParameterConverter(object):
             for converter in cls.converters:
                 converter.prepare_sort_key()
             cls.converters.sort(key=attrgetter('sort_key'))
+            ParameterConverter._converters_version += 1
 
 
     def convert_parameters(self, request, *args, **kwargs):
@@ -106,33 +246,93 @@ class ParameterConverter(object):
         args = list(args)
         urlparam_i = 0
 
-        parameters = self.view_parameters.get(request.method.lower()) or self.view_parameters.get(None)
-        if parameters is not None:
-            # add urlparams into the arguments and convert the values
-            for parameter_i, parameter in enumerate(parameters):
-                # skip request object, *args, **kwargs
-                if parameter_i == 0 or parameter.kind is inspect.Parameter.VAR_POSITIONAL or parameter.kind is inspect.Parameter.VAR_KEYWORD:
-                    pass
+        # rebuild if a converter was registered since the plans were built
+        if self._plans_version != ParameterConverter._converters_version:
+            self._build_plans()
+
+        plan = self.plans.get(request.method.lower()) or self.plans.get(None)
+        if plan:
+            urlparams = request.dmp.urlparams
+            # find the value for each parameter
+            bound = []
+            prefetches = None
+            for binding in plan:
+                parameter = binding.parameter
+                name = parameter.name
                 # value in kwargs?
-                elif parameter.name in kwargs:
-                    kwargs[parameter.name] = self.convert_value(kwargs[parameter.name], parameter, request)
+                if name in kwargs:
+                    target, value = name, kwargs[name]
                 # value in args?
-                elif parameter_i - 1 < len(args):
-                    args[parameter_i - 1] = self.convert_value(args[parameter_i - 1], parameter, request)
-                # urlparam value?
-                elif urlparam_i < len(request.dmp.urlparams):
-                    kwargs[parameter.name] = self.convert_value(request.dmp.urlparams[urlparam_i], parameter, request)
-                    urlparam_i += 1
-                # can we assign a default value?
-                elif parameter.default is not inspect.Parameter.empty:
-                    kwargs[parameter.name] = self.convert_value(parameter.default, parameter, request)
-                # fallback is None
+                elif binding.args_index < len(args):
+                    target, value = binding.args_index, args[binding.args_index]
                 else:
-                    kwargs[parameter.name] = self.convert_value(None, parameter, request)
+                    target = name
+                    # value in request.GET, request.POST, headers, etc.?
+                    if binding.source is not None:
+                        value = binding.source.get_value(request, parameter)
+                    # urlparam value?
+                    elif urlparam_i < len(urlparams):
+                        value = urlparams[urlparam_i]
+                        urlparam_i += 1
+                    else:
+                        value = None
+                    # can we assign a default value? (fallback is None)
+                    if value is None and parameter.default is not inspect.Parameter.empty:
+                        value = parameter.default
+                # List[type] urlparams are comma-separated
+                if parameter.container is not None and isinstance(value, str):
+                    value = value.split(',') if value else []
+                bound.append(( binding, target, value ))
+                if binding.prefetch is not None:
+                    if prefetches is None:
+                        prefetches = {}
+                    values, parameters = prefetches.setdefault(binding.prefetch, ( [], [] ))
+                    if parameter.container is not None and isinstance(value, (list, tuple)):
+                        values.extend(value)
+                        parameters.extend([ parameter ] * len(value))
+                    else:
+                        values.append(value)
+                        parameters.append(parameter)
+
+            if prefetches is None:
+                self._convert_bound(bound, args, kwargs, request)
+            else:
+                # convert the values that aren't prefetched first, so a bad one fails before any database work
+                self._convert_bound([ item for item in bound if item[0].prefetch is None ], args, kwargs, request)
+                # let converters load their values together (e.g. one query per model)
+                for prefetch, ( values, parameters ) in prefetches.items():
+                    prefetch(values, parameters, request)
+                self._convert_bound([ item for item in bound if item[0].prefetch is not None ], args, kwargs, request)
 
         return args, kwargs
 
 
+    def _convert_bound(self, bound, args, kwargs, request):
+        '''Converts a list of ( binding, target, value ) and adds the values into the arguments'''
+        for binding, target, value in bound:
+            if binding.convert is not None:
+                value = binding.convert(value, binding.parameter, request)
+            if target.__class__ is int:
+                args[target] = value
+            else:
+                kwargs[target] = value
+
+
+    async def aconvert_parameters(self, request, *args, **kwargs):
+        '''
+        Async version of convert_parameters(), used for `async def` views.
+        When one of the view's converters might block (such as the Model
+        converter, which queries the database), the parameters are converted
+        in a worker thread.  Otherwise they're converted in the event loop.
+        '''
+        if self._plans_version != ParameterConverter._converters_version:
+            self._build_plans()
+        plan = self.plans.get(request.method.lower()) or self.plans.get(None)
+        if plan and plan.blocking:
+            return await run_in_thread(self.convert_parameters, request, *args, **kwargs)
+        return self.convert_parameters(request, *args, **kwargs)
+
+
     def convert_value(self, value, parameter, request):
         '''
         Converts a parameter value in the view function call.
@@ -162,24 +362,33 @@ class ParameterConverter(object):
             InternalRedirectException: redirects processing internally (see DMP docs)
             Http404: returns a Django Http404 response
         '''
+        # we don't convert anything without type hints
+        if parameter.type is inspect.Parameter.empty:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('skipping conversion of parameter `%s` because it has no type hint', parameter.name)
+            return value
+
+        # find the converter method for this type
+        try:
+            ci = self._find_converter(parameter.type)
+        except Exception as e:
+            convert_func, takes_request = functools.partial(_raise, e), False
+        else:
+            convert_func, takes_request = ci.convert_func, ci.takes_request
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('converting parameter `%s` using %s', parameter.name, convert_func)
+        if takes_request:
+            return self._call_converter(convert_func, value, parameter, request)
+        return self._call_converter(convert_func, value, parameter)
+
+
+    def _call_converter(self, convert_func, value, parameter, *request):
+        '''
+        Calls a converter function, translating exceptions as described in convert_value().
+        The request is passed on only to converter functions that take it.
+        '''
         try:
-            # we don't convert anything without type hints
-            if parameter.type is inspect.Parameter.empty:
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug('skipping conversion of parameter `%s` because it has no type hint', parameter.name)
-                return value
-
-            # find the converter method for this type
-            # I'm iterating through the list to find the most specific match first
-            # The list is sorted by specificity so subclasses come before their superclasses
-            for ci in self.converters:
-                if issubclass(parameter.type, ci.convert_type):
-                    if log.isEnabledFor(logging.DEBUG):
-                        log.debug('converting parameter `%s` using %s', parameter.name, ci.convert_func)
-                    return ci.convert_func(value, parameter)
-
-            # if we get here, there wasn't a converter or this type
-            raise ImproperlyConfigured(message='No parameter converter exists for type: {}. Do you need to add an @parameter_converter function for the type?'.format(parameter.type))
+            return convert_func(value, parameter, *request)
 
         except ValueError as e:
             log.info('ValueError raised during conversion of parameter %s (%s): %s', parameter.position, parameter.name, e)
@@ -188,3 +397,20 @@ class ParameterConverter(object):
         except Exception as e:
             log.info('Exception raised during conversion of parameter %s (%s): %s', parameter.position, parameter.name, e)
             raise ConverterException(value, parameter, 'A parameter could not be converted - see the logs for more detail') from e
+
+
+
+def _convert_items(convert):
+    '''Wraps a convert function for List[type] parameters so it converts each item of the list'''
+    def convert_items(value, parameter, request):
+        if isinstance(value, (list, tuple)):
+            return [ convert(item, parameter, request) for item in value ]
+        if value is None and parameter.default is inspect.Parameter.empty:
+            return []       # missing, without a default
+        return value        # the parameter default
+    return convert_items
+
+
+def _raise(error, value, parameter):
+    '''Converter function stand-in for a type that couldn't be matched to a converter'''
+    raise error
@@ -0,0 +1,221 @@
+from django.apps import apps
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from ..util import log
+
+import hashlib
+import threading
+import time
+
+
+#########################################################
+###   Cache-backed model conversion
+###
+###   Pages keyed by a model id in the url (/catalog/product/1234/) load
+###   the same objects over and over.  Model parameters can opt in to
+###   loading their objects through a Django cache:
+###
+###     - per model, with the MODEL_CACHE option: { 'catalog.Product': 300 }
+###     - per parameter, with a Cached hint: Annotated[Product, Cached(timeout=300)]
+###
+###   Each object has one cache entry (keyed by model label and pk) that holds
+###   a dict of the object as loaded for each Fetch hint.  The entry is deleted
+###   on post_save and post_delete, and again when the transaction commits.
+###   Saving a proxy or multi-table child deletes the entries of the models it
+###   shares rows with.  Fetch hints that load related objects aren't cached since
+###   their entries would go stale when the related objects change.
+###
+###   When an object isn't in the cache, the first process to miss adds a
+###   short-lived lock key and loads it; the others wait for the entry to
+###   appear rather than all querying the database at once.
+
+
+class Cached(object):
+    '''
+    Type hint metadata that loads a Model parameter through the model cache:
+
+        from typing import Annotated
+
+        @view_function
+        def process_request(request, product:Annotated[Product, Cached(timeout=300)]):
+            ...
+
+    timeout:  Seconds to keep objects in the cache.  The default is the cache's default
+              timeout.  None keeps them until they change.
+    '''
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+
+    def __eq__(self, other):
+        return isinstance(other, Cached) and self.timeout == other.timeout
+
+    def __hash__(self):
+        return hash(self.timeout)
+
+    def __repr__(self):
+        return '<Cached timeout={}>'.format(self.timeout)
+
+
+
+class ModelCache(object):
+    '''
+    Loads model objects through a Django cache, keyed by model label and pk.
+
+    Changes are only seen for models in the MODEL_CACHE option and models this process
+    has cached through a Cached hint.  If objects are saved by a process that never
+    loads the views with the hints (such as a management command), list the model
+    in MODEL_CACHE instead.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = {}            # model class -> Cached, from the MODEL_CACHE option
+        self.watched = set()        # model classes whose changes invalidate the cache
+        self.alias = 'default'
+        self.lock_timeout = 5
+        self.poll_interval = 0.05
+        self.reset_stats()
+
+
+    def configure(self, models=None, alias='default', lock_timeout=5):
+        '''
+        Sets the models to cache ({ 'app.Model': timeout }), the Django cache alias,
+        and the seconds a process can hold the lock on a missing object.
+        Triggered by DMP's ready() with the MODEL_CACHE options.
+        '''
+        resolved = {}
+        for label, timeout in (models or {}).items():
+            try:
+                resolved[apps.get_model(label)] = Cached(timeout)
+            except (LookupError, ValueError) as e:
+                raise ImproperlyConfigured('"{}" in the MODEL_CACHE option is not a valid model: {}'.format(label, e))
+        with self.lock:
+            self.models = resolved
+            self.watched.update(resolved)
+            self.alias = alias
+            self.lock_timeout = lock_timeout
+        post_save.connect(self.object_changed, dispatch_uid='django_mako_plus.model_cache.post_save')
+        post_delete.connect(self.object_changed, dispatch_uid='django_mako_plus.model_cache.post_delete')
+
+
+    def reset_stats(self):
+        '''Resets the counters'''
+        # number of objects found in the cache
+        self.hits = 0
+        # number of objects loaded from the database (and added to the cache)
+        self.misses = 0
+        # number of objects loaded from the database after waiting too long on another process's lock
+        self.timeouts = 0
+        # number of objects deleted from the cache because they changed
+        self.invalidations = 0
+
+
+    def get_settings(self, model, parameter):
+        '''Returns the Cached settings for a parameter, or None if its objects aren't cached'''
+        cached = parameter.get_metadata(Cached)
+        if cached is None:
+            return self.models.get(model)
+        if model not in self.watched:
+            with self.lock:
+                self.watched.add(model)
+        return cached
+
+
+    def make_key(self, model, pk):
+        '''Returns the cache key for an object'''
+        return 'dmp-model:{}:{}'.format(model._meta.label_lower, pk)
+
+
+    def get_many(self, queryset, pks, cached, fetch=None):
+        '''
+        Returns a dict of pk -> object for the given pks, from the cache where possible.
+        Objects that don't exist are left out (and aren't cached).
+        '''
+        if fetch is not None and (fetch.select_related or fetch.prefetch_related):
+            return queryset.in_bulk(pks)
+        model = queryset.model
+        cache = caches[self.alias]
+        variant = hashlib.md5(repr(fetch).encode('utf8')).hexdigest()[:12] if fetch is not None else ''
+        keys = { self.make_key(model, pk): pk for pk in pks }
+        entries = cache.get_many(list(keys))
+        objects = {}
+        missing = []
+        for key, pk in keys.items():
+            if variant in entries.get(key, ()):
+                objects[pk] = entries[key][variant]
+            else:
+                missing.append(key)
+        self.hits += len(objects)
+        if not missing:
+            return objects
+
+        # load the objects we get the lock for; wait for the others
+        lock_suffix = ':{}:lock'.format(variant)
+        locked = [ key for key in missing if cache.add(key + lock_suffix, 1, self.lock_timeout) ]
+        if locked:
+            try:
+                loaded = queryset.in_bulk([ keys[key] for key in locked ])
+                self.misses += len(locked)
+                updates = {}
+                for key in locked:
+                    if keys[key] in loaded:
+                        entry = dict(entries.get(key, ()))
+                        entry[variant] = loaded[keys[key]]
+                        updates[key] = entry
+                cache.set_many(updates, cached.timeout)
+                objects.update(loaded)
+            finally:
+                cache.delete_many([ key + lock_suffix for key in locked ])
+        waiting = [ key for key in missing if key not in locked ]
+        deadline = time.monotonic() + self.lock_timeout
+        while waiting:
+            time.sleep(self.poll_interval)
+            entries = cache.get_many(waiting)
+            found = [ key for key in waiting if variant in entries.get(key, ()) ]
+            objects.update(( keys[key], entries[key][variant] ) for key in found)
+            self.hits += len(found)
+            # objects whose lock is gone without an entry (it doesn't exist, or it changed) come from the database
+            waiting = [ key for key in waiting if key not in found ]
+            locks = cache.get_many([ key + lock_suffix for key in waiting ])
+            released = [ key for key in waiting if key + lock_suffix not in locks ]
+            waiting = [ key for key in waiting if key + lock_suffix in locks ]
+            if waiting and time.monotonic() >= deadline:
+                log.info('timed out waiting for %s objects to be cached by another process', len(waiting))
+                self.timeouts += len(waiting)
+                released.extend(waiting)
+                waiting = []
+            if released:
+                objects.update(queryset.in_bulk([ keys[key] for key in released ]))
+        return objects
+
+
+    def object_changed(self, sender, instance, **kwargs):
+        '''
+        Deletes a changed object from the cache (a post_save and post_delete receiver).
+        The object's row is also cached under its proxy models and multi-table parents
+        and children (which have the same pk), so those entries are deleted too.
+        '''
+        tables = get_tables(sender)
+        keys = [ self.make_key(model, instance.pk) for model in list(self.watched) if not tables.isdisjoint(get_tables(model)) ]
+        if not keys:
+            return
+        cache = caches[self.alias]
+        cache.delete_many(keys)
+        # a concurrent request might cache the old object before the transaction commits
+        transaction.on_commit(lambda: cache.delete_many(keys))
+        self.invalidations += len(keys)
+
+
+
+def get_tables(model):
+    '''Returns the concrete models whose tables hold a model's rows: its concrete model and the parents of it'''
+    concrete = model._meta.concrete_model
+    return frozenset(( concrete, *concrete._meta.get_parent_list() ))
+
+
+
+# the cache used by the Model converter (configured in apps.py from the MODEL_CACHE options)
+MODEL_CACHE = ModelCache()
@@ -1,9 +1,11 @@
 from django.db.models import Model
-from django.conf import settings
-from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
+from django.core.exceptions import ValidationError
 from django.http import HttpRequest
 
+from .cache import MODEL_CACHE
 from .decorators import parameter_converter
+from .formats import DATETIME_INPUT_FORMATS, DATE_INPUT_FORMATS
+from .parameter import Fetch
 
 import inspect
 import datetime
@@ -13,7 +15,7 @@ import decimal
 
 ###   object (fallback if nothing else matches)  ###
 
-@parameter_converter(object)
+@parameter_converter(object, blocking=False)
 def convert_object(value, parameter):
     '''
     Fallback converter when nothing else matches:
@@ -25,7 +27,7 @@ def convert_object(value, parameter):
 
 ###  str (a passthrough)  ###
 
-@parameter_converter(str)
+@parameter_converter(str, blocking=False)
 def convert_str(value, parameter):
     '''
     Converts to string:
@@ -37,7 +39,7 @@ def convert_str(value, parameter):
 
 ###  int  ###
 
-@parameter_converter(int)
+@parameter_converter(int, blocking=False)
 def convert_int(value, parameter):
     '''
     Converts to int or float:
@@ -55,7 +57,7 @@ def convert_int(value, parameter):
 
 ###  float  ###
 
-@parameter_converter(float)
+@parameter_converter(float, blocking=False)
 def convert_float(value, parameter):
     '''
     Converts to int or float:
@@ -73,7 +75,7 @@ def convert_float(value, parameter):
 
 ###  decimal.Decimal  ###
 
-@parameter_converter(decimal.Decimal)
+@parameter_converter(decimal.Decimal, blocking=False)
 def convert_decimal(value, parameter):
     '''
     Converts to decimal.Decimal:
@@ -91,7 +93,7 @@ def convert_decimal(value, parameter):
 
 ###  bool  ###
 
-@parameter_converter(bool)
+@parameter_converter(bool, blocking=False)
 def convert_boolean(value, parameter, default=False):
     '''
     Converts to boolean (only the first char of the value is used):
@@ -109,7 +111,7 @@ def convert_boolean(value, parameter, default=False):
 
 ###  datetime.datetime  ###
 
-@parameter_converter(datetime.datetime)
+@parameter_converter(datetime.datetime, blocking=False)
 def convert_datetime(value, parameter):
     '''
     Converts to datetime.datetime:
@@ -119,17 +121,13 @@ def convert_datetime(value, parameter):
     value = _check_default(value, parameter, ( '', '-', None ))
     if value is None or isinstance(value, datetime.datetime):
         return value
-    for fmt in settings.DATETIME_INPUT_FORMATS:
-        try:
-            return datetime.datetime.strptime(value, fmt)
-        except (ValueError, TypeError):
-            continue
-    raise ValueError("`{}` does not match a format in settings.DATETIME_INPUT_FORMATS".format(value))
+    # see formats.py for how the format is found
+    return DATETIME_INPUT_FORMATS.parse(value)
 
 
 ###   datetime.date  ###
 
-@parameter_converter(datetime.date)
+@parameter_converter(datetime.date, blocking=False)
 def convert_date(value, parameter):
     '''
     Converts to datetime.date:
@@ -139,30 +137,70 @@ def convert_date(value, parameter):
     value = _check_default(value, parameter, ( '', '-', None ))
     if value is None or isinstance(value, datetime.date):
         return value
-    for fmt in settings.DATE_INPUT_FORMATS:
-        try:
-            return datetime.datetime.strptime(value, fmt).date()
-        except (ValueError, TypeError):
-            continue
-    raise ValueError("`{}` does not match a format in settings.DATE_INPUT_FORMATS".format(value))
+    # see formats.py for how the format is found
+    return DATE_INPUT_FORMATS.parse(value).date()
 
 
 ###   Model: any Django model by its id  ###
 
-@parameter_converter(Model)  # django models.Model
-def convert_id_to_model(value, parameter):
+# values that convert to the parameter default
+MODEL_EMPTY_VALUES = ( '', '-', '0', None )
+
+def prefetch_models(values, parameters, request):
+    '''
+    Loads the objects for all model parameters of a view call with one
+    `in_bulk()` query per model class (and Fetch hint).  The objects are placed in the
+    request's identity map (request.dmp.identity_map), where convert_id_to_model
+    finds them.  Objects already in the map aren't queried again, and objects
+    of cached models come from the model cache (see cache.py) when they can.
+    '''
+    identity_map = _get_identity_map(request)
+    if identity_map is None:
+        return
+    groups = {}
+    for value, parameter in zip(values, parameters):
+        if value in MODEL_EMPTY_VALUES:
+            continue
+        try:
+            key = _model_key(value, parameter)
+        except ValueError:
+            continue  # convert_id_to_model raises this for the parameter
+        if key is not None and key not in identity_map:
+            group = ( key[0], _get_fetch(key), MODEL_CACHE.get_settings(key[0], parameter) )
+            groups.setdefault(group, {})[key[1]] = key
+    for ( model, fetch, cached ), keys in groups.items():
+        objects = _load_objects(model, list(keys), fetch, cached)
+        for pk, key in keys.items():
+            # None records that the object doesn't exist
+            identity_map[key] = objects.get(pk)
+
+
+@parameter_converter(Model, prefetch=prefetch_models)  # django models.Model
+def convert_id_to_model(value, parameter, request=None):
     '''
     Converts to a Model object.
         '', '-', '0', None convert to parameter default
-        Anything else is assumed an object id and sent to `.get(id=value)`.
+        Anything else is assumed an object id (primary key) and looked up.
+
+    If the type hint has Fetch metadata, e.g. Annotated[Order, Fetch(select_related=['customer'])],
+    the query is shaped with it.  Objects are cached in the request's identity map, so converting the same
+    (model, id) again during the request doesn't query the database.  Models in the MODEL_CACHE
+    option, and parameters with Cached metadata, are loaded through the model cache.
     '''
-    value = _check_default(value, parameter, ( '', '-', '0', None ))
-    if isinstance(value, (int, str)):  # only convert if we have the id
-        try:
-            return parameter.type.objects.get(id=value)
-        except (MultipleObjectsReturned, ObjectDoesNotExist) as e:
-            raise ValueError(str(e))
-    return value
+    value = _check_default(value, parameter, MODEL_EMPTY_VALUES)
+    key = _model_key(value, parameter)
+    if key is None:
+        return value
+    identity_map = _get_identity_map(request)
+    if identity_map is not None and key in identity_map:
+        obj = identity_map[key]
+    else:
+        obj = _load_objects(key[0], [ key[1] ], _get_fetch(key), MODEL_CACHE.get_settings(key[0], parameter)).get(key[1])
+        if identity_map is not None:
+            identity_map[key] = obj
+    if obj is None:
+        raise ValueError('{} matching query does not exist.'.format(parameter.type._meta.object_name))
+    return obj
 
 
 
@@ -177,3 +215,47 @@ def _check_default(value, parameter, default_chars):
             raise ValueError('Value was empty, but no default value is given in view function for parameter: {} ({})'.format(parameter.position, parameter.name))
         return parameter.default
     return value
+
+
+def _model_key(value, parameter):
+    '''
+    Returns the ( model class, pk ) identity of a model parameter value, or None
+    if the value isn't an id (e.g. the parameter default).  Parameters with a
+    Fetch hint are ( model class, pk, fetch ) since their objects are loaded differently.
+    Raises ValueError if the value isn't a valid primary key.
+    '''
+    if not isinstance(value, (int, str)):  # only convert if we have the id
+        return None
+    model = parameter.type
+    try:
+        key = ( model, model._meta.pk.to_python(value) )
+    except ValidationError as e:
+        raise ValueError('; '.join(e.messages))
+    fetch = parameter.get_metadata(Fetch)
+    return key + ( fetch, ) if fetch is not None else key
+
+
+def _get_fetch(key):
+    '''Returns the Fetch hint of a model key, or None'''
+    return key[2] if len(key) > 2 else None
+
+
+def _get_queryset(model, fetch=None):
+    '''Returns the queryset to load objects of the given model from'''
+    if fetch is not None:
+        return fetch.apply(model.objects.all())
+    return model.objects
+
+
+def _load_objects(model, pks, fetch=None, cached=None):
+    '''Returns a dict of pk -> object, loaded through the model cache if cached is a Cached instance'''
+    queryset = _get_queryset(model, fetch)
+    if cached is not None:
+        return MODEL_CACHE.get_many(queryset, pks, cached, fetch)
+    return queryset.in_bulk(pks)
+
+
+def _get_identity_map(request):
+    '''Returns the identity map for the request, or None if the request has no routing data'''
+    dmp = getattr(request, 'dmp', None)
+    return getattr(dmp, 'identity_map', None)
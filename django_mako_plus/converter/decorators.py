@@ -2,12 +2,23 @@ from .base import ParameterConverter
 
 ###  Decorator that denotes a converter function  ###
 
-def parameter_converter(*convert_types):
+def parameter_converter(*convert_types, prefetch=None, blocking=True):
     '''
     Decorator that denotes a function as a url parameter converter.
+
+    The function is called as func(value, parameter), or as func(value, parameter, request)
+    if it has a `request` parameter.
+
+    If given, prefetch is called as prefetch(values, parameters, request) once per view call
+    with the values of all parameters that use this converter, before any of them are
+    converted.  This lets a converter load its values together (see converters.py).
+
+    Set blocking=False when the function never does I/O (database queries, network
+    calls, etc.).  Async views convert such parameters directly in the event loop
+    rather than in a worker thread.
     '''
     def inner(func):
         for ct in convert_types:
-            ParameterConverter._register_converter(func, ct)
+            ParameterConverter._register_converter(func, ct, prefetch, blocking)
         return func
     return inner
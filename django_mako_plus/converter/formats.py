@@ -0,0 +1,124 @@
+from django.conf import settings
+
+import datetime
+import re
+
+
+#########################################################
+###   Date and datetime input formats
+###
+###   The date converters use the first format in settings.DATE_INPUT_FORMATS
+###   (or DATETIME_INPUT_FORMATS) that parses the value.  Trying each format
+###   with strptime() raises and catches an exception per miss, so a value that
+###   matches the tenth format pays for nine failures.
+###
+###   Instead, the formats are compiled into one regular expression with an
+###   alternative per format.  Since alternatives are tried in order, a single
+###   match finds the first format the value could match.  The regex for each
+###   format accepts at least everything strptime() does, so the value is then
+###   parsed with that format (falling back to the later formats in the rare
+###   case that strptime still rejects it, such as a month of 13).
+###
+###   ISO-style formats are parsed with fromisoformat(), which is many times
+###   faster than strptime().
+
+
+# strptime directive -> regex accepting (at least) what strptime accepts
+DIRECTIVE_REGEXES = {
+    'Y': r'\d\d\d\d',
+    'G': r'\d\d\d\d',
+    'y': r'\d\d',
+    'm': r'\s?\d\d?',
+    'd': r'\s?\d\d?',
+    'H': r'\s?\d\d?',
+    'I': r'\s?\d\d?',
+    'M': r'\s?\d\d?',
+    'S': r'\s?\d\d?',
+    'U': r'\s?\d\d?',
+    'W': r'\s?\d\d?',
+    'V': r'\s?\d\d?',
+    'j': r'\d\d?\d?',
+    'w': r'\d',
+    'u': r'\d',
+    'f': r'\d{1,6}',
+    '%': r'%',
+}
+# names, am/pm, time zones, and anything else are locale or platform dependent
+DEFAULT_DIRECTIVE_REGEX = r'.*?'
+
+# formats whose values datetime.fromisoformat() parses the same as strptime()
+ISO_FORMATS = {
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+}
+
+RE_DIRECTIVE = re.compile(r'%(.)|(\s+)')
+
+
+class InputFormats(object):
+    '''
+    Parses values with the first matching format of a settings list
+    (such as DATETIME_INPUT_FORMATS).  The compiled regex is rebuilt if the
+    setting changes.
+    '''
+    def __init__(self, setting_name):
+        self.setting_name = setting_name
+        # ( formats list, compiled regex, list of whether each format is ISO-style )
+        self.compiled = ( None, None, () )
+
+
+    def prepare(self):
+        '''Compiles the formats, if they've changed since the last call. Triggered by DMP's ready().'''
+        formats = getattr(settings, self.setting_name)
+        compiled = self.compiled
+        if formats is not compiled[0]:
+            alternatives = [ '(?P<f{}>{})'.format(i, format_regex(fmt)) for i, fmt in enumerate(formats) ]
+            regex = re.compile('|'.join(alternatives) or '(?!)', re.IGNORECASE)
+            # assigned together so other threads never see a partial update
+            self.compiled = compiled = ( formats, regex, [ fmt in ISO_FORMATS for fmt in formats ] )
+        return compiled
+
+
+    def parse(self, value):
+        '''
+        Returns a datetime.datetime for the value, using the first format that parses it.
+        Raises ValueError if no format matches.
+        '''
+        formats, regex, iso = self.prepare()
+        match = regex.fullmatch(value) if isinstance(value, str) else None
+        if match is not None:
+            i = int(match.lastgroup[1:])
+            if iso[i]:
+                try:
+                    return datetime.datetime.fromisoformat(value)
+                except ValueError:
+                    pass    # e.g. single-digit months, which strptime allows
+            for fmt in formats[i:]:
+                try:
+                    return datetime.datetime.strptime(value, fmt)
+                except (ValueError, TypeError):
+                    continue
+        raise ValueError("`{}` does not match a format in settings.{}".format(value, self.setting_name))
+
+
+def format_regex(fmt):
+    '''Returns a regex (as a string) that matches at least the values strptime() accepts for fmt'''
+    parts = []
+    pos = 0
+    for match in RE_DIRECTIVE.finditer(fmt):
+        parts.append(re.escape(fmt[pos:match.start()]))
+        if match.group(2) is not None:
+            parts.append(r'\s+')    # strptime matches any whitespace for whitespace
+        else:
+            parts.append('(?:{})'.format(DIRECTIVE_REGEXES.get(match.group(1), DEFAULT_DIRECTIVE_REGEX)))
+        pos = match.end()
+    parts.append(re.escape(fmt[pos:]))
+    return ''.join(parts)
+
+
+
+# the formats used by the date and datetime converters
+DATETIME_INPUT_FORMATS = InputFormats('DATETIME_INPUT_FORMATS')
+DATE_INPUT_FORMATS = InputFormats('DATE_INPUT_FORMATS')
@@ -9,11 +9,18 @@ import sys
 
 class ConverterFunctionInfo(object):
     '''Holds information about a converter function'''
-    def __init__(self, convert_func, convert_type, source_order):
+    def __init__(self, convert_func, convert_type, source_order, prefetch_func=None, blocking=True):
         self.convert_func = convert_func
         self.convert_type = convert_type
         self.source_order = source_order
+        self.prefetch_func = prefetch_func
+        self.blocking = blocking
         self.sort_key = 0
+        # converter functions with a `request` parameter are called as convert_func(value, parameter, request)
+        try:
+            self.takes_request = 'request' in inspect.signature(convert_func).parameters
+        except (TypeError, ValueError):  # builtins and other callables without a signature
+            self.takes_request = False
 
 
     def prepare_sort_key(self):
@@ -1,3 +1,6 @@
+import abc
+
+
 
 #####################################
 ###  ViewParameter
@@ -8,7 +11,7 @@ class ViewParameter(object):
     An instance of this class is created for each parameter in a view function
     (except the initial request object argument).
     '''
-    def __init__(self, name, position, kind, type, default):
+    def __init__(self, name, position, kind, type, default, metadata=(), container=None):
         '''
         name:      The name of the parameter.
         position:  The position of this parameter.
@@ -17,12 +20,28 @@ class ViewParameter(object):
                    convert urlparam strings to the right type.
         default:   Any default value, specified in function type hints.  If no default is
                    specified in the function, this is `inspect.Parameter.empty`.
+        metadata:  The extra arguments of an `Annotated[type, ...]` type hint, as a tuple.
+                   Converters can use these to customize conversion (see Fetch below).
+        container: `list` if the type hint is `List[type]`, in which case each item is
+                   converted to `type`.  Otherwise None.
         '''
         self.name = name
         self.position = position
         self.kind = kind
         self.type = type
         self.default = default
+        self.metadata = metadata
+        self.container = container
+        # where the value comes from (see ParameterSource below), or None for the urlparams
+        self.source = self.get_metadata(ParameterSource)
+
+
+    def get_metadata(self, metadata_type, default=None):
+        '''Returns the first metadata item that is an instance of metadata_type'''
+        for item in self.metadata:
+            if isinstance(item, metadata_type):
+                return item
+        return default
 
     def __repr__(self):
         return '<ViewParameter name={}, type={}, default={}>'.format(
@@ -30,3 +49,121 @@ class ViewParameter(object):
             self.type.__qualname__ if self.type is not None else '<not specified>',
             self.default,
         )
+
+
+
+#####################################
+###  Fetch
+
+class Fetch(object):
+    '''
+    Type hint metadata that shapes the query of a Model parameter, so the
+    related objects a template uses are loaded with the parameter:
+
+        from typing import Annotated
+
+        @view_function
+        def process_request(request, order:Annotated[Order, Fetch(select_related=[ 'customer' ], only=[ 'id', 'customer' ])]):
+            ...
+
+    Each argument is a list of field names sent to the QuerySet method of the same name.
+    '''
+    def __init__(self, select_related=(), prefetch_related=(), only=()):
+        self.select_related = _as_tuple(select_related)
+        self.prefetch_related = _as_tuple(prefetch_related)
+        self.only = _as_tuple(only)
+
+    def apply(self, queryset):
+        '''Returns the queryset with these hints applied'''
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+    def _key(self):
+        return ( self.select_related, self.prefetch_related, self.only )
+
+    def __eq__(self, other):
+        return isinstance(other, Fetch) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return '<Fetch select_related={}, prefetch_related={}, only={}>'.format(*self._key())
+
+
+def _as_tuple(names):
+    '''Allows a single field name to be given as a string'''
+    return ( names, ) if isinstance(names, str) else tuple(names)
+
+
+
+#####################################
+###  Parameter sources
+
+class ParameterSource(abc.ABC):
+    '''
+    Type hint metadata that takes a parameter's value from the request rather
+    than the urlparams.  Subclasses implement get_values():
+
+        from typing import Annotated, List, Optional
+
+        @view_function
+        def process_request(request, page:Annotated[int, QueryParam()]=1, tags:Annotated[List[str], QueryParam('tag')]=None):
+            ...
+
+    name:  The name of the value in the request.  The default is the parameter name.
+    '''
+    def __init__(self, name=None):
+        self.name = name
+
+    def get_value(self, request, parameter):
+        '''Returns the value (a list of values if parameter.container is set), or None if the request doesn't have it'''
+        values = self.get_values(request)
+        name = self.name or parameter.name
+        if name not in values:
+            return None
+        if parameter.container is not None:
+            return values.getlist(name)
+        return values.get(name)
+
+    @abc.abstractmethod
+    def get_values(self, request):
+        '''Returns the mapping of values (a QueryDict, except for headers)'''
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, self.name)
+
+
+class QueryParam(ParameterSource):
+    '''Takes the value from request.GET'''
+    def get_values(self, request):
+        return request.GET
+
+
+class PostParam(ParameterSource):
+    '''Takes the value from request.POST'''
+    def get_values(self, request):
+        return request.POST
+
+
+class HeaderParam(ParameterSource):
+    '''
+    Takes the value from a request header, such as HeaderParam('X-Api-Version').
+    The default name is the parameter name (underscores match dashes).
+    '''
+    def get_values(self, request):
+        return request.META
+
+    def get_value(self, request, parameter):
+        key = (self.name or parameter.name).upper().replace('-', '_')
+        if key not in ( 'CONTENT_TYPE', 'CONTENT_LENGTH' ):
+            key = 'HTTP_' + key
+        value = self.get_values(request).get(key)
+        if value is not None and parameter.container is not None:
+            return [ item.strip() for item in value.split(',') ]
+        return value
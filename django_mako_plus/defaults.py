@@ -15,9 +15,80 @@ DEFAULT_OPTIONS = {
         'django_mako_plus.context_processors.settings',         # adds "settings" dictionary
     ],
 
+    # whether the context processors run once per request (on the first render) rather than on every
+    # render. pages that render many partials with request.dmp.render_to_string() save a run per partial.
+    # the output is reset when a user logs in or out; reset it yourself after other changes the processors read.
+    'CONTEXT_PROCESSORS_PER_REQUEST': False,
+
+    # whether to skip context processors whose variables a template (and the templates it inherits,
+    # includes, and imports) never reads. only processors with known variables are skipped: Django's,
+    # DMP's, and those listed in CONTEXT_PROCESSOR_NAMES as { 'dotted.path.to.processor': [ 'name', ... ] }.
+    # this only applies when CONTEXT_PROCESSORS_PER_REQUEST is True.
+    'CONTEXT_PROCESSORS_SKIP_UNUSED': False,
+    'CONTEXT_PROCESSOR_NAMES': {},
+
     # identifies where the Mako template cache will be stored, relative to each template directory
     'TEMPLATES_CACHE_DIR': '__dmpcache__',
 
+    # the budget of the in-memory template cache (shared by all apps); least-recently-used
+    # templates, and the provider instances attached to them, are evicted when either is exceeded.
+    # size is the number of templates, memory is the (estimated) number of bytes. None is unbounded.
+    'TEMPLATES_CACHE_SIZE': 2000,
+    'TEMPLATES_CACHE_MEMORY': None,
+
+    # whether to load all templates, views, and providers of the project apps when DMP starts,
+    # then gc.freeze() them. Use this with pre-forking servers (e.g. gunicorn --preload) so
+    # workers share the loaded state copy-on-write rather than each building it on first request.
+    'WARMUP': False,
+
+    # a file (relative to BASE_DIR) where DMP records the templates, defs, and views that are served,
+    # with hit counts. The counts are merged into the file every USAGE_PROFILE_INTERVAL seconds (and at exit).
+    # When this file exists, WARMUP loads only its WARMUP_SIZE hottest entries (None for all entries).
+    'USAGE_PROFILE': None,
+    'USAGE_PROFILE_INTERVAL': 60,
+    'WARMUP_SIZE': 500,
+
+    # in debug mode, whether to watch the app directories for changes (using watchdog if installed, otherwise
+    # polling every FILE_WATCHER_INTERVAL seconds). this keeps the template, view, and provider caches on in
+    # debug mode, and only the entries that depend on a changed file are invalidated.
+    'FILE_WATCHER': False,
+    'FILE_WATCHER_INTERVAL': 3,
+
+    # urls that match a DMP pattern but have no view (e.g. bots probing for /wp-login/) are remembered
+    # so they don't hit the disk again. this sets the max number remembered (0 to disable) and
+    # how long, in seconds, each is remembered (None for no expiration). the file watcher also clears them.
+    'VIEW_NOT_FOUND_CACHE_SIZE': 10000,
+    'VIEW_NOT_FOUND_CACHE_TTL': 300,
+
+    # whether DMP's urls.py routes all apps with one dispatch table (a lookup on the first path segment
+    # and one regex) rather than a resolver per app. resolve time stays the same as the number of apps grows.
+    'DISPATCH_TABLE': False,
+
+    # the number of characters in each chunk when templates are rendered in streaming mode
+    # (render_to_response(stream=True), request.dmp.render(stream=True), or @view_function(stream=True))
+    'STREAM_CHUNK_SIZE': 16384,
+    # whether streamed templates send the document head (through </head>, with the links from providers)
+    # as soon as it's written, so browsers fetch static files while the body renders
+    'STREAM_EARLY_FLUSH': False,
+    # each streamed template runs in a worker thread (with its own database connection) while the client
+    # reads it. this limits the threads; when they're all busy, templates render in one chunk. None is unlimited.
+    'STREAM_MAX_THREADS': 16,
+
+    # the number of threads that render the tasks of <%dmp:parallel> tags (shared by all requests)
+    'PARALLEL_MAX_WORKERS': 8,
+
+    # the Mako cache plugin for <%def cached="True"> and <%block cached="True">. None uses Mako's
+    # default (Beaker).  'django' keeps the fragments in a Django cache, so all processes share them.
+    'FRAGMENT_CACHE_IMPL': None,
+    # the default cache arguments for the plugin and <%dmp:cached> (tags can override them with cache_*
+    # attributes, such as cache_timeout="60")
+    'FRAGMENT_CACHE_ARGS': {
+        'alias': 'default',     # the Django cache (in settings.CACHES) to keep fragments in
+        'timeout': 300,         # seconds a fragment is fresh
+        'stale': 0,             # seconds an expired fragment is still served while it renders again in the background
+        'vary': '',             # request attributes that get their own copies of the fragment, such as 'user.pk, LANGUAGE_CODE'
+    },
+
     # the default encoding of template files
     'DEFAULT_TEMPLATE_ENCODING': 'utf-8',
 
@@ -31,13 +102,23 @@ DEFAULT_OPTIONS = {
         # 'import os, os.path, re, json',
     ],
 
-    # whether autoescaping of expressions is on or off
+    # whether autoescaping of expressions is on or off (templates are compiled with it, so run dmp_cleanup after changing it)
     'AUTOESCAPE': True,
 
     # the converter class to use for parameter conversion
     # this should be ParameterConverter or a subclass of it
     'PARAMETER_CONVERTER': 'django_mako_plus.converter.ParameterConverter',
 
+    # models whose parameters are loaded through the Django cache, as { 'app.Model': timeout in seconds }
+    # (parameters can also opt in with an Annotated[Model, Cached()] hint)
+    'MODEL_CACHE': {},
+
+    # the Django cache (in settings.CACHES) to keep model objects in
+    'MODEL_CACHE_ALIAS': 'default',
+
+    # seconds other processes wait for the process loading a missing object before loading it themselves
+    'MODEL_CACHE_LOCK_TIMEOUT': 5,
+
     # whether to send the custom DMP signals -- set to False for a slight speed-up in router processing
     # determines whether DMP will send its custom signals during the process
     'SIGNALS': False,
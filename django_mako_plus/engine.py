@@ -145,7 +145,8 @@ class MakoTemplates(BaseEngine):
         call get_template_loader() instead.
 
         Unless use_cache=False, this method caches template loaders in the DMP
-        cache for later use.
+        cache for later use.  Loaders created with use_cache=False also bypass the
+        process-wide template registry, so their templates are always checked on disk.
         '''
         # get from the cache if we are able
         if use_cache:
@@ -155,7 +156,7 @@ class MakoTemplates(BaseEngine):
                 pass  # not there, so we'll create
 
         # create the loader
-        loader = MakoTemplateLoader(path, None)
+        loader = MakoTemplateLoader(path, None, use_registry=use_cache)
 
         # cache if we are allowed
         if use_cache:
@@ -0,0 +1,174 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django_mako_plus.management.mixins import DMPCommandMixIn
+from django_mako_plus.version import __version__
+from django_mako_plus.warmup import DEFAULT_SUBDIRS, DEFAULT_EXTENSIONS, find_template_names
+
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+import os, os.path
+
+
+class Command(DMPCommandMixIn, BaseCommand):
+    help = (
+        'Compiles the Mako templates in your DMP-enabled apps ahead of time. This moves the '
+        'compile cost from the first request after a deploy to build time.'
+    )
+    # needs to be true so Django initializes urls.py (which registers the dmp apps)
+    requires_system_checks = True
+
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+
+        parser.add_argument(
+            'appname',
+            type=str,
+            nargs='*',
+            help='The name of one or more DMP apps. If omitted, all DMP apps are processed.'
+        )
+        parser.add_argument(
+            '--subdir',
+            default=[],
+            dest='subdir',
+            action='append',
+            help='Compile the templates in the given subdirectory of each app (deep search). May be specified multiple times. Defaults to {}.'.format(', '.join(DEFAULT_SUBDIRS))
+        )
+        parser.add_argument(
+            '--extension',
+            default=[],
+            dest='extension',
+            action='append',
+            help='Compile files with the given extension. May be specified multiple times. Defaults to {}.'.format(', '.join(DEFAULT_EXTENSIONS))
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            dest='workers',
+            help='The number of processes to compile with. Defaults to the number of CPUs.'
+        )
+        parser.add_argument(
+            '--manifest',
+            type=str,
+            metavar='FILENAME',
+            default=None,
+            dest='manifest',
+            help='Where to write the JSON manifest of compiled templates. Defaults to BASE_DIR/dmp_precompile.json.'
+        )
+
+
+    def handle(self, *args, **options):
+        dmp = apps.get_app_config('django_mako_plus')
+        self.options = options
+        subdirs = options.get('subdir') or DEFAULT_SUBDIRS
+        extensions = set(( ext.lower() if ext.startswith('.') else '.' + ext.lower() for ext in (options.get('extension') or DEFAULT_EXTENSIONS) ))
+
+        # ensure we have a base directory
+        try:
+            if not os.path.isdir(os.path.abspath(settings.BASE_DIR)):
+                raise CommandError('Your settings.py BASE_DIR setting is not a valid directory.  Please check your settings.py file for the BASE_DIR variable.')
+        except AttributeError:
+            raise CommandError('Your settings.py file is missing the BASE_DIR setting.')
+
+        # the apps to process
+        enapps = []
+        for appname in options.get('appname'):
+            enapps.append(apps.get_app_config(appname))
+        if len(enapps) == 0:
+            enapps = dmp.get_registered_apps()
+
+        # find the templates
+        jobs = []
+        for app in enapps:
+            self.message('Searching `{}` app...'.format(app.name))
+            for subdir in subdirs:
+                for template_name in self.find_templates(os.path.join(app.path, subdir), extensions):
+                    jobs.append(( app.name, subdir, template_name ))
+
+        # compile them in a process pool (or right here if only one worker)
+        workers = max(1, options.get('workers') or 1)
+        self.message('Compiling {} templates with {} worker{}'.format(len(jobs), workers, '' if workers == 1 else 's'))
+        if workers == 1 or len(jobs) <= 1:
+            results = [ compile_template(*job) for job in jobs ]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                results = list(executor.map(compile_template, *zip(*jobs)))
+
+        # report the results
+        errors = [ r for r in results if r['error'] is not None ]
+        for result in results:
+            if result['error'] is None:
+                self.message('compiled {}/{}/{}'.format(result['app'], result['subdir'], result['template']), level=2, tab=1)
+            else:
+                self.stderr.write('Error compiling {}/{}/{}: {}'.format(result['app'], result['subdir'], result['template'], result['error']))
+
+        # write the manifest
+        manifest = options.get('manifest') or os.path.join(settings.BASE_DIR, 'dmp_precompile.json')
+        with open(manifest, 'w') as fout:
+            json.dump({
+                'version': __version__,
+                'created': datetime.datetime.now().isoformat(),
+                'compiled': len(results) - len(errors),
+                'errors': len(errors),
+                'templates': results,
+            }, fout, indent=2)
+        self.message('Manifest written to {}'.format(manifest), level=2)
+
+        # a nonzero exit code if anything failed
+        if len(errors) > 0:
+            raise CommandError('{} of {} templates failed to compile (see {})'.format(len(errors), len(results), manifest))
+        self.message('Compiled {} templates successfully'.format(len(results)))
+
+
+    def find_templates(self, path, extensions):
+        '''
+        Generator of template names (relative to path) in the given directory.
+        Any files or subdirectories starting with double-underscores (e.g. __dmpcache__) are skipped.
+        '''
+        if not os.path.isdir(path):
+            self.message('Skipping {} because it does not exist'.format(path), level=3, tab=1)
+            return
+        yield from find_template_names(path, extensions)
+
+
+
+#####################################################
+###   Functions that run in the worker processes
+
+
+def init_worker():
+    '''
+    Ensures Django is set up in a worker process.  When processes are forked, this
+    is already done.  When they are spawned (e.g. Windows), we need to do it here.
+    '''
+    if not apps.ready:
+        import django
+        django.setup()
+
+
+def compile_template(app_name, subdir, template_name):
+    '''
+    Compiles a template with the normal DMP loader settings for its app and subdir,
+    which writes the compiled module to the cache directory.  The loader is not
+    taken from the cache so templates already in memory are still checked on disk.
+    Returns a dictionary entry for the manifest.  Any exception is recorded
+    as a failure so one bad template doesn't stop the rest (or the manifest).
+    '''
+    result = {
+        'app': app_name,
+        'subdir': subdir,
+        'template': template_name,
+        'module': None,
+        'error': None,
+    }
+    dmp = apps.get_app_config('django_mako_plus')
+    try:
+        loader = dmp.engine.get_template_loader_for_path(os.path.join(apps.get_app_config(app_name).path, subdir), use_cache=False)
+        template = loader.get_mako_template(template_name)
+        result['module'] = getattr(template.module, '__file__', None)
+    except Exception as e:
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    return result
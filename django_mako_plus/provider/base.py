@@ -2,11 +2,17 @@ from django.apps import apps
 from django.conf import settings
 import os, inspect
 import logging
+import collections
+import weakref
 from ..util import log
+from ..watcher import FILE_WATCHER
 
 
 TEMPLATE_ATTR_NAME = '_dmp_provider_cache_'
 
+# when the file watcher is active: filename -> templates with providers that depend on the file
+WATCHED_FILES = collections.defaultdict(weakref.WeakSet)
+
 ##############################################################
 ###   Abstract Provider Base
 
@@ -56,9 +62,21 @@ class BaseProvider(object):
         instance = cls(template, options)
         if not settings.DEBUG:
             provider_cache[options['_template_cache_key']] = instance
+        elif FILE_WATCHER.active:
+            # in debug mode, cache only if the watcher will tell us when the files change
+            provider_cache[options['_template_cache_key']] = instance
+            for filename in instance.watched_files():
+                WATCHED_FILES[os.path.abspath(filename)].add(template)
         return instance
 
 
+    @staticmethod
+    def file_changed(filename):
+        '''Clears the providers of templates that depend on the given file (a file watcher listener)'''
+        for template in list(WATCHED_FILES.pop(filename, ())):
+            template.__dict__.pop(TEMPLATE_ATTR_NAME, None)
+
+
     def __init__(self, template, options):
         self.template = template
         self.options = options
@@ -94,6 +112,14 @@ class BaseProvider(object):
         return self.options['group']
 
 
+    def watched_files(self):
+        '''
+        Returns the files this instance depends on.  In debug mode with the file watcher
+        active, the instance is recreated when any of them are created, changed, or deleted.
+        '''
+        return []
+
+
     def start(self, provider_run, data):
         '''
         Called on the *main* template's provider list as the run starts.
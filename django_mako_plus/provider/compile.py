@@ -16,7 +16,8 @@ class CompileProvider(BaseProvider):
     timestamp is older than the source file. In production mode, this check
     is done only once (the first time a template is run) per server start.
 
-    When settings.DEBUG=True, checks for a recompile every request.
+    When settings.DEBUG=True, checks for a recompile every request (or when the
+    source file changes if the file watcher is active).
     When settings.DEBUG=False, checks for a recompile only once per server run.
     '''
     def __init__(self, template, options):
@@ -37,6 +38,9 @@ class CompileProvider(BaseProvider):
         if log.isEnabledFor(logging.DEBUG):
             log.debug('%s created for %s: [%s]', repr(self), self.sourcepath, msg)
 
+    def watched_files(self):
+        return [ self.sourcepath ]
+
     DEFAULT_OPTIONS = {
         'group': 'styles',
 
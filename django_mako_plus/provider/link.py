@@ -61,6 +61,10 @@ class LinkProvider(BaseProvider):
             log.debug('%s created for %s: [%s]', repr(self), self.filepath, 'will link' if self.mtime > 0 else 'will skip nonexistent file')
 
 
+    def watched_files(self):
+        return [ self.filepath ]
+
+
     ### Source Filepath Building Methods ###
 
     def build_source_filepath(self):
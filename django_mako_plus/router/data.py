@@ -1,12 +1,77 @@
 from django.apps import apps
+from django.conf import settings
 
 from ..decorators import BaseDecorator
+from ..usage import USAGE_PROFILE
 from ..util import URLParamList
-from .discover import get_view_function
+from ..watcher import FILE_WATCHER
+from .discover import get_view_function, CACHED_VIEW_FUNCTIONS
 
+from collections import namedtuple
 from urllib.parse import unquote
 
 
+########################################################
+###   Route prototypes
+###
+###   The parts of the routing data that depend only on the app, page, and
+###   function are resolved once and cached.  Each request copies these
+###   values into its RoutingData and binds its own urlparams.
+
+RoutePrototype = namedtuple('RoutePrototype', [ 'app', 'page', 'function', 'module', 'callable', 'view_type', 'fallback_template' ])
+ROUTE_PROTOTYPES = {}
+
+
+def get_route_prototype(app, page, function):
+    '''
+    Returns the prototype for the given (url) app, page, and function names, creating it if needed.
+    Raises ViewDoesNotExist if the view can't be found.
+    '''
+    key = ( app, page, function )
+    try:
+        proto = ROUTE_PROTOTYPES[key]
+    except KeyError:
+        pass
+    else:
+        # the view is taken from the prototype, so get_view_function() doesn't see this hit
+        if USAGE_PROFILE.enabled:
+            USAGE_PROFILE.record('view', proto.module, proto.function, proto.app, proto.fallback_template)
+        return proto
+
+    # period and dash cannot be in python names, but we allow dash in app, dash in page, and dash/period in function
+    app_name = app.replace('-', '_')
+    page_name = page.replace('-', '_')
+    if function and function != 'process_request':
+        function_name = function.replace('.', '_').replace('-', '_')
+        fallback_template = '{}.{}.html'.format(page, function)
+    else:
+        function_name = 'process_request'
+        fallback_template = '{}.html'.format(page)
+
+    # the return of get_view_function might be a function, a class-based view, or a template
+    module = '.'.join([ app_name, 'views', page_name ])
+    func = get_view_function(module, function_name, app_name, fallback_template)
+    proto = RoutePrototype(app_name, page_name, function_name, module, func, func.view_type, fallback_template)
+    # cached under the same rules as view functions
+    if not settings.DEBUG or FILE_WATCHER.active:
+        ROUTE_PROTOTYPES[key] = proto
+    return proto
+
+
+def route_file_changed(filename):
+    '''
+    Drops the prototypes whose view functions were dropped for a changed file (a file
+    watcher listener).  This must run after the router's listener (see apps.py).
+    '''
+    for key, proto in list(ROUTE_PROTOTYPES.items()):
+        if CACHED_VIEW_FUNCTIONS.get(( proto.module, proto.function )) is not proto.callable:
+            ROUTE_PROTOTYPES.pop(key, None)
+
+
+########################################################
+###   Per-request routing data
+
+
 class RoutingData(object):
     '''
     The routing information for a request.  This is created during url resolution when a pattern
@@ -22,6 +87,14 @@ class RoutingData(object):
         request.dmp.view_type   The type of view: function, class, or template.
         request.dmp.urlparams   A list of the remaining url parts, as a list of strings. Parameter conversion
                                 uses the values in this list.
+        request.dmp.identity_map
+                                A dict of ( model class, pk ) -> model object (or None if the object doesn't
+                                exist) holding the objects loaded by parameter conversion during this request.
+                                Objects loaded with a Fetch hint are keyed ( model class, pk, fetch ).
+        request.dmp.context_processor_output
+                                The output of the context processors when they run once per request (on the first
+                                render, see the CONTEXT_PROCESSORS_PER_REQUEST option).  Set it to None to run them
+                                again after changing something they read.
 
     '''
     def __init__(self, app=None, page=None, function=None, urlparams=None):
@@ -29,35 +102,57 @@ class RoutingData(object):
         # the request object is set later by the middleware so the render methods work
         self.request = None
 
-        # period and dash cannot be in python names, but we allow dash in app, dash in page, and dash/period in function
-        self.app = app.replace('-', '_') if app is not None else None
-        self.page = page.replace('-', '_') if page is not None else None
-        if function and function != 'process_request':
-            self.function = function.replace('.', '_').replace('-', '_')
-            fallback_template = '{}.{}.html'.format(page, function)
-        else:
-            self.function = 'process_request'
-            fallback_template = '{}.html'.format(page)
-
-        # set the module and function
-        # the return of get_router_function might be a function, a class-based view, or a template
-        if self.app is not None and self.page is not None:
-            self.module = '.'.join([ self.app, 'views', self.page ])
-            self.callable = get_view_function(self.module, self.function, self.app, fallback_template)
+        # the parts that depend only on the app, page, and function come from a cached prototype
+        if app is not None and page is not None:
+            self.app, self.page, self.function, self.module, self.callable, self.view_type, _ = get_route_prototype(app, page, function)
         else:
+            self.app = app.replace('-', '_') if app is not None else None
+            self.page = page.replace('-', '_') if page is not None else None
+            self.function = function.replace('.', '_').replace('-', '_') if function and function != 'process_request' else 'process_request'
             self.module = None
             self.callable = None
-        self.view_type = self.callable.view_type if self.callable is not None else None
-
-        # parse the urlparams
-        # note that I'm not using unquote_plus because the + switches to a space *after* the question mark (in the regular parameters)
-        # in the normal url, spaces should be quoted with %20.  Thanks Rosie for the tip.
-        if isinstance(urlparams, (list, tuple)):
-            self.urlparams = URLParamList(urlparams)
-        elif urlparams:
-            self.urlparams = URLParamList(( unquote(s) for s in urlparams.split('/') ))
-        else:
-            self.urlparams = URLParamList()
+            self.view_type = None
+
+        # the urlparams are parsed the first time they are used
+        self._urlparams_source = urlparams
+        self._urlparams = None
+        # created the first time a model parameter is converted
+        self._identity_map = None
+        # set by the first template render of the request (see template/adapter.py)
+        self.context_processor_output = None
+
+
+    @property
+    def urlparams(self):
+        '''The remaining url parts, as a URLParamList of (unquoted) strings'''
+        if self._urlparams is None:
+            # note that I'm not using unquote_plus because the + switches to a space *after* the question mark (in the regular parameters)
+            # in the normal url, spaces should be quoted with %20.  Thanks Rosie for the tip.
+            urlparams = self._urlparams_source
+            if isinstance(urlparams, (list, tuple)):
+                self._urlparams = URLParamList(urlparams)
+            elif urlparams:
+                self._urlparams = URLParamList(( unquote(s) for s in urlparams.split('/') ))
+            else:
+                self._urlparams = URLParamList()
+        return self._urlparams
+
+    @urlparams.setter
+    def urlparams(self, value):
+        self._urlparams_source = None
+        self._urlparams = value
+
+
+    @property
+    def identity_map(self):
+        '''
+        The model objects converted during this request, as ( model class, pk ) -> object.
+        This lives as long as the request (including internal redirects), so each
+        object is queried at most once per request.
+        '''
+        if self._identity_map is None:
+            self._identity_map = {}
+        return self._identity_map
 
 
     def __repr__(self):
@@ -84,14 +179,21 @@ class RoutingData(object):
             )))
 
 
-    def render(self, template, context=None, def_name=None, subdir='templates', content_type=None, status=None, charset=None):
-        '''App-specific render function that renders templates in the *current app*, attached to the request for convenience'''
+    def render(self, template, context=None, def_name=None, subdir='templates', content_type=None, status=None, charset=None, stream=None, early_flush=None):
+        '''
+        App-specific render function that renders templates in the *current app*, attached to the request for convenience.
+        If stream or early_flush is None, it comes from the view's decorator: @view_function(stream=True, early_flush=True).
+        '''
         if self.request is None:
             raise ValueError("RoutingData.render() can only be called after the view middleware is run. Check that `django_mako_plus.middleware` is in MIDDLEWARE.")
         dmp = apps.get_app_config('django_mako_plus')
         template_loader = dmp.engine.get_template_loader(self.app, subdir)
         template_adapter = template_loader.get_template(template)
-        return getattr(template_adapter, 'render_to_response')(context=context, request=self.request, def_name=def_name, content_type=content_type, status=status, charset=charset)
+        if stream is None:
+            stream = getattr(self.callable, 'stream', False)
+        if early_flush is None:
+            early_flush = getattr(self.callable, 'early_flush', None)
+        return getattr(template_adapter, 'render_to_response')(context=context, request=self.request, def_name=def_name, content_type=content_type, status=status, charset=charset, stream=stream, early_flush=early_flush)
 
 
     def render_to_string(self, template, context=None, def_name=None, subdir='templates'):
@@ -102,3 +204,21 @@ class RoutingData(object):
         template_loader = dmp.engine.get_template_loader(self.app, subdir)
         template_adapter = template_loader.get_template(template)
         return getattr(template_adapter, 'render')(context=context, request=self.request, def_name=def_name)
+
+
+    async def arender(self, template, context=None, def_name=None, subdir='templates', content_type=None, status=None, charset=None, thread=None):
+        '''Async version of render(), for `async def` views (see MakoTemplateAdapter.arender)'''
+        if self.request is None:
+            raise ValueError("RoutingData.arender() can only be called after the view middleware is run. Check that `django_mako_plus.middleware` is in MIDDLEWARE.")
+        dmp = apps.get_app_config('django_mako_plus')
+        template_adapter = dmp.engine.get_template_loader(self.app, subdir).get_template(template)
+        return await template_adapter.arender_to_response(context=context, request=self.request, def_name=def_name, content_type=content_type, status=status, charset=charset, thread=thread)
+
+
+    async def arender_to_string(self, template, context=None, def_name=None, subdir='templates', thread=None):
+        '''Async version of render_to_string(), for `async def` views (see MakoTemplateAdapter.arender)'''
+        if self.request is None:
+            raise ValueError("RoutingData.arender_to_string() can only be called after the view middleware is run. Check that `django_mako_plus.middleware` is in MIDDLEWARE.")
+        dmp = apps.get_app_config('django_mako_plus')
+        template_adapter = dmp.engine.get_template_loader(self.app, subdir).get_template(template)
+        return await template_adapter.arender(context=context, request=self.request, def_name=def_name, thread=thread)
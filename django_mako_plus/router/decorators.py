@@ -4,7 +4,7 @@ from django.http import HttpResponse, StreamingHttpResponse, Http404, HttpRespon
 
 from ..decorators import BaseDecorator
 from ..signals import dmp_signal_post_process_request, dmp_signal_pre_process_request, dmp_signal_internal_redirect_exception, dmp_signal_redirect_exception
-from ..util import import_qualified, log
+from ..util import import_qualified, log, is_async_view, markcoroutinefunction, run_async, run_in_thread
 from ..exceptions import InternalRedirectException, RedirectException
 
 import inspect
@@ -34,6 +34,13 @@ class view_function(BaseDecorator):
         @view_function(...)
         function process_request(request):
             ...
+
+    With @view_function(stream=True), request.dmp.render() streams the template
+    (see MakoTemplateAdapter.stream) unless stream=False is given in the call.
+    Add early_flush=True to send the document head as soon as it's written.
+    Streamed templates run in a worker thread with its own database connection,
+    so a view inside a transaction (such as with ATOMIC_REQUESTS) gets its page
+    in one chunk instead.
     '''
     # singleton set of decorated functions
     DECORATED_FUNCTIONS = set()
@@ -43,6 +50,9 @@ class view_function(BaseDecorator):
         '''Create a new wrapper around the decorated function'''
         super().__init__(decorator_function, *args, **kwargs)
         real_func = inspect.unwrap(decorator_function)
+        # whether request.dmp.render() streams by default in this view
+        self.stream = bool(self.decorator_kwargs.get('stream', False))
+        self.early_flush = self.decorator_kwargs.get('early_flush')
 
         # flag the function as an endpoint. doing it on the actual function because
         # we don't know the order of decorators on the function. order only matters if
@@ -86,9 +96,17 @@ class RequestViewWrapper(object):
         self.routing_data = routing_data
         # take name and attributes of the view function
         functools.update_wrapper(self, self.routing_data.callable)
+        # `async def` views get an awaitable wrapper, so ASGI handlers run them in the event loop
+        self.is_async = getattr(self.routing_data.callable, 'view_is_async', None)
+        if self.is_async is None:   # internal redirects don't go through discover.py
+            self.is_async = is_async_view(self.routing_data.callable)
+        if self.is_async:
+            markcoroutinefunction(self)
 
 
     def __call__(self, request, *args, **kwargs):
+        if self.is_async:
+            return self.acall(request, *args, **kwargs)
         log.info('%s', self.routing_data)
         dmp = apps.get_app_config('django_mako_plus')
 
@@ -106,47 +124,111 @@ class RequestViewWrapper(object):
                 args, kwargs = converter.convert_parameters(request, *args, **kwargs)
 
             # send the pre-signal
-            if dmp.options['SIGNALS']:
-                for receiver, ret_response in dmp_signal_pre_process_request.send(sender=sys.modules[__name__], request=request, view_args=args, view_kwargs=kwargs):
-                    if isinstance(ret_response, (HttpResponse, StreamingHttpResponse)):
-                        return ret_response
+            response = self.send_pre_signal(dmp, request, args, kwargs)
+            if response is not None:
+                return response
 
             # call the view function
             response = self.routing_data.callable(request, *args, **kwargs)
-            if not isinstance(response, (HttpResponse, StreamingHttpResponse)):
-                log.info('%s failed to return an HttpResponse (or the post-signal overwrote it).  Returning 500 error.', self.routing_data.callable)
-                return HttpResponseServerError('Invalid response received from server.')
-
-            # send the post-signal
-            if dmp.options['SIGNALS']:
-                for receiver, ret_response in dmp_signal_post_process_request.send(sender=sys.modules[__name__], request=request, response=response, view_args=args, view_kwargs=kwargs):
-                    if ret_response is not None:
-                        response = ret_response # sets it to the last non-None in the signal receiver chain
 
-            return response
+            # check the response and send the post-signal
+            return self.send_post_signal(dmp, request, response, args, kwargs)
 
         except InternalRedirectException as ivr:
-            # send the signal
-            if dmp.options['SIGNALS']:
-                dmp_signal_internal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=ivr)
-            # update the RoutingData object
-            request.dmp.module = ivr.redirect_module
-            request.dmp.function = ivr.redirect_function
-            try:
-                request.dmp.callable = getattr(import_qualified(request.dmp.module), request.dmp.function)
-            except (ImportError, AttributeError):
-                log.info('could not fulfill InternalViewRedirect because %s.%s does not exist.', request.dmp.module, request.dmp.function)
-                raise Http404()
-            # recurse with this routing data
-            log.info('received an InternalViewRedirect to %s.%s', request.dmp.module, request.dmp.function)
-            return RequestViewWrapper(self.routing_data)(request, *args, **kwargs)
+            wrapper = self.internal_redirect(dmp, request, ivr)
+            if wrapper.is_async:
+                return run_async(wrapper.acall, request, *args, **kwargs)
+            return wrapper(request, *args, **kwargs)
 
         except RedirectException as e: # redirect to another page
-            log.info('view %s.%s redirected processing to %s', request.dmp.module, request.dmp.function, e.redirect_to)
-            # send the signal
-            if dmp.options['SIGNALS']:
-                dmp_signal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=e)
-            # send the browser the redirect command
-            return e.get_response(request)
+            return self.redirect(dmp, request, e)
 
         # the code should never get here
+
+
+    async def acall(self, request, *args, **kwargs):
+        '''
+        The wrapper for `async def` views, which runs the same steps as __call__().
+        Blocking parameter conversions and signal receivers run in a worker thread.
+        '''
+        log.info('%s', self.routing_data)
+        dmp = apps.get_app_config('django_mako_plus')
+        request.dmp = self.routing_data
+        try:
+
+            # convert the parameters
+            converter = getattr(self.routing_data.callable, CONVERTER_ATTRIBUTE_NAME, None)
+            if converter is not None:
+                args, kwargs = await converter.aconvert_parameters(request, *args, **kwargs)
+
+            # send the pre-signal
+            if dmp.options['SIGNALS'] and dmp_signal_pre_process_request.has_listeners():
+                response = await run_in_thread(self.send_pre_signal, dmp, request, args, kwargs)
+                if response is not None:
+                    return response
+
+            # await the view function
+            response = await self.routing_data.callable(request, *args, **kwargs)
+
+            # check the response and send the post-signal
+            if dmp.options['SIGNALS'] and dmp_signal_post_process_request.has_listeners():
+                return await run_in_thread(self.send_post_signal, dmp, request, response, args, kwargs)
+            return self.send_post_signal(dmp, request, response, args, kwargs)
+
+        except InternalRedirectException as ivr:
+            wrapper = self.internal_redirect(dmp, request, ivr)
+            if wrapper.is_async:
+                return await wrapper.acall(request, *args, **kwargs)
+            return await run_in_thread(wrapper, request, *args, **kwargs)
+
+        except RedirectException as e: # redirect to another page
+            return self.redirect(dmp, request, e)
+
+
+    def send_pre_signal(self, dmp, request, args, kwargs):
+        '''Sends the pre-signal. Returns the first response a receiver returns, or None.'''
+        if dmp.options['SIGNALS']:
+            for receiver, ret_response in dmp_signal_pre_process_request.send(sender=sys.modules[__name__], request=request, view_args=args, view_kwargs=kwargs):
+                if isinstance(ret_response, (HttpResponse, StreamingHttpResponse)):
+                    return ret_response
+        return None
+
+
+    def send_post_signal(self, dmp, request, response, args, kwargs):
+        '''Checks the view's response and sends the post-signal. Returns the final response.'''
+        if not isinstance(response, (HttpResponse, StreamingHttpResponse)):
+            log.info('%s failed to return an HttpResponse (or the post-signal overwrote it).  Returning 500 error.', self.routing_data.callable)
+            return HttpResponseServerError('Invalid response received from server.')
+        if dmp.options['SIGNALS']:
+            for receiver, ret_response in dmp_signal_post_process_request.send(sender=sys.modules[__name__], request=request, response=response, view_args=args, view_kwargs=kwargs):
+                if ret_response is not None:
+                    response = ret_response # sets it to the last non-None in the signal receiver chain
+        return response
+
+
+    def internal_redirect(self, dmp, request, ivr):
+        '''Points the routing data at the target of an InternalRedirectException. Returns a wrapper for the new view.'''
+        # send the signal
+        if dmp.options['SIGNALS']:
+            dmp_signal_internal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=ivr)
+        # update the RoutingData object
+        request.dmp.module = ivr.redirect_module
+        request.dmp.function = ivr.redirect_function
+        try:
+            request.dmp.callable = getattr(import_qualified(request.dmp.module), request.dmp.function)
+        except (ImportError, AttributeError):
+            log.info('could not fulfill InternalViewRedirect because %s.%s does not exist.', request.dmp.module, request.dmp.function)
+            raise Http404()
+        # recurse with this routing data
+        log.info('received an InternalViewRedirect to %s.%s', request.dmp.module, request.dmp.function)
+        return RequestViewWrapper(self.routing_data)
+
+
+    def redirect(self, dmp, request, e):
+        '''Returns the browser redirect response for a RedirectException'''
+        log.info('view %s.%s redirected processing to %s', request.dmp.module, request.dmp.function, e.redirect_to)
+        # send the signal
+        if dmp.options['SIGNALS']:
+            dmp_signal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=e)
+        # send the browser the redirect command
+        return e.get_response(request)
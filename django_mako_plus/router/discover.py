@@ -5,10 +5,15 @@ from django.template import TemplateDoesNotExist
 from django.views.generic import View
 
 from .decorators import view_function, CONVERTER_ATTRIBUTE_NAME
-from ..util import import_qualified, log
+from ..usage import USAGE_PROFILE
+from ..util import import_qualified, split_app, log, is_async_view
+from ..watcher import FILE_WATCHER
 
+from collections import OrderedDict
 import inspect
+import os, os.path
 import threading
+import time
 from importlib import import_module
 from importlib.util import find_spec
 
@@ -21,32 +26,183 @@ CACHED_VIEW_FUNCTIONS = {}
 rlock = threading.RLock()
 
 
+class NotFoundCache(object):
+    '''
+    A bounded, least-recently-used cache of ( module, function ) keys that failed
+    discovery, with the ViewDoesNotExist message for each.
+
+    URLs like /wp-login/ or /admin.php match the DMP patterns, so without this,
+    every probe from a bot runs find_spec() and a template lookup on disk.
+    Entries expire after `ttl` seconds (None for never) and are dropped by the
+    file watcher when a file in the app changes.
+    '''
+    def __init__(self, max_size=10000, ttl=300):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # key -> ( expires, message )
+        self.configure(max_size, ttl)
+        self.reset_stats()
+
+
+    def configure(self, max_size=10000, ttl=300):
+        '''Sets the size (None or 0 disables the cache) and time-to-live in seconds (None for no expiration)'''
+        with self.lock:
+            self.max_size = max_size or 0
+            self.ttl = ttl
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+    def reset_stats(self):
+        '''Resets the counters'''
+        # number of discoveries avoided because the key was known to be missing
+        self.hits = 0
+        # number of failed discoveries that were added
+        self.misses = 0
+        # number of entries removed to stay within max_size
+        self.evictions = 0
+        # number of entries that had expired when looked up
+        self.expirations = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def get(self, key):
+        '''Returns the ViewDoesNotExist message for the key, or None if not cached (or expired)'''
+        with self.lock:
+            try:
+                expires, message = self.entries[key]
+            except KeyError:
+                return None
+            if expires is not None and time.monotonic() >= expires:
+                del self.entries[key]
+                self.expirations += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return message
+
+
+    def add(self, key, message):
+        '''Records a failed discovery'''
+        with self.lock:
+            if self.max_size <= 0:
+                return
+            self.entries[key] = ( time.monotonic() + self.ttl if self.ttl is not None else None, message )
+            self.entries.move_to_end(key)
+            self.misses += 1
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def discard_if(self, affected):
+        '''Removes the entries where affected(key) is True'''
+        with self.lock:
+            for key in [ k for k in self.entries if affected(k) ]:
+                del self.entries[key]
+
+
+    def clear(self):
+        '''Removes all entries and resets the counters'''
+        with self.lock:
+            self.entries.clear()
+            self.reset_stats()
+
+
+    def stats(self):
+        '''Returns a dictionary of cache statistics'''
+        return {
+            'entries': len(self.entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+# failed discoveries (configured in apps.py from the VIEW_NOT_FOUND_CACHE_SIZE and VIEW_NOT_FOUND_CACHE_TTL options)
+NOT_FOUND_VIEWS = NotFoundCache()
+
+
 def get_view_function(module_name, function_name, fallback_app=None, fallback_template=None, verify_decorator=True):
     '''
     Retrieves a view function from the cache, finding it if the first time.
     Raises ViewDoesNotExist if not found.  This is called by resolver.py.
     '''
+    if USAGE_PROFILE.enabled:
+        USAGE_PROFILE.record('view', module_name, function_name, fallback_app, fallback_template)
     # first check the cache (without doing locks)
     key = ( module_name, function_name )
     try:
         return CACHED_VIEW_FUNCTIONS[key]
     except KeyError:
-        with rlock:
-            # try again now that we're locked
-            try:
-                return CACHED_VIEW_FUNCTIONS[key]
-            except KeyError:
-                # if we get here, we need to load the view function
-                func = find_view_function(module_name, function_name, fallback_app, fallback_template, verify_decorator)
-                # cache in production mode
-                if not settings.DEBUG:
-                    CACHED_VIEW_FUNCTIONS[key] = func
-                return func
+        pass
+
+    # cache in production mode (or in debug mode when the watcher tells us about changes)
+    caching = not settings.DEBUG or FILE_WATCHER.active
+
+    # did it fail last time? (checked outside the lock so 404 probes don't wait on each other)
+    if caching:
+        message = NOT_FOUND_VIEWS.get(key)
+        if message is not None:
+            raise ViewDoesNotExist(message)
+
+    with rlock:
+        # try again now that we're locked
+        try:
+            return CACHED_VIEW_FUNCTIONS[key]
+        except KeyError:
+            pass
+        # if we get here, we need to load the view function
+        try:
+            func = find_view_function(module_name, function_name, fallback_app, fallback_template, verify_decorator)
+        except ViewDoesNotExist as e:
+            if caching:
+                NOT_FOUND_VIEWS.add(key, str(e))
+            raise
+        if caching:
+            CACHED_VIEW_FUNCTIONS[key] = func
+        return func
 
     # the code should never be able to get here
     raise Exception("Django-Mako-Plus error: get_view_function() should not have been able to get to this point.  Please notify the owner of the DMP project.  Thanks.")
 
 
+def view_file_changed(filename):
+    '''
+    Drops the cached view functions (and failed discoveries) affected by a changed file
+    (a file watcher listener).  A .py file affects the views in its module and its submodules.
+    Any other file in the app might be (or might now replace) the template of a template view,
+    so those are dropped.  Code isn't reloaded here: runserver restarts the process when
+    Python files change, and the next lookup after the restart imports the new code.
+    '''
+    app, relpath = split_app(filename)
+    if app is None:
+        return
+    if filename.endswith('.py'):
+        module_name = '.'.join([ app.name ] + os.path.splitext(relpath)[0].split(os.path.sep))
+        if module_name.endswith('.__init__'):
+            module_name = module_name[:-len('.__init__')]
+        affected = lambda key, func: key[0] == module_name or key[0].startswith(module_name + '.')
+    else:
+        prefix = app.name + '.'
+        affected = lambda key, func: key[0].startswith(prefix) and (func is None or func.view_type == 'template')
+    with rlock:
+        for key, func in list(CACHED_VIEW_FUNCTIONS.items()):
+            if affected(key, func):
+                del CACHED_VIEW_FUNCTIONS[key]
+        # a new view module or template might fix a failed discovery
+        NOT_FOUND_VIEWS.discard_if(lambda key: affected(key, None))
+
+
 def find_view_function(module_name, function_name, fallback_app=None, fallback_template=None, verify_decorator=True):
     '''
     Finds a view function, class-based view, or template view.
@@ -87,6 +243,9 @@ def find_view_function(module_name, function_name, fallback_app=None, fallback_t
     elif verify_decorator and not view_function.is_decorated(func):
         raise ViewDoesNotExist("view {}.{} was found successfully, but it must be decorated with @view_function or be a subclass of django.views.generic.View.".format(module_name, function_name))
 
+    # `async def` views are awaited by RequestViewWrapper
+    func.view_is_async = is_async_view(func)
+
     # attach a converter to the view function
     if dmp.options['PARAMETER_CONVERTER'] is not None:
         try:
@@ -113,4 +272,5 @@ def create_view_for_template(app_name, template_name):
         template = dmp.engine.get_template_loader(app_name).get_template(template_name)
         return template.render_to_response(request=request, context=kwargs)
     template_view.view_type = 'template'
+    template_view.view_is_async = False
     return template_view
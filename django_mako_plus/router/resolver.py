@@ -19,6 +19,8 @@ from .data import RoutingData
 from .decorators import RequestViewWrapper
 
 from collections import namedtuple
+import inspect
+import re
 
 
 
@@ -194,11 +196,12 @@ class PagePattern(URLPattern):
                     match.kwargs.pop('dmp_function', None) or 'process_request',
                     match.kwargs.pop('dmp_urlparams', '').strip(),
                 )
-                return ResolverMatch(
+                return resolver_match(
                     RequestViewWrapper(routing_data),
                     match.args,
                     match.kwargs,
                     match.url_name,
+                    route=getattr(match, 'route', None),
                 )
             except ViewDoesNotExist as vdne:
                 # we had a pattern match, but we couldn't get a callable using kwargs from the pattern
@@ -215,5 +218,125 @@ class PagePattern(URLPattern):
 
 
 
+
+
+#############################################
+###  Single dispatch table for all apps
+
+# the five conventions of dmp_paths_for_app() combined into one regex:
+#     page.function/urlparams, page.function, page/urlparams, page, and empty
+RE_DISPATCH = re.compile(
+    r'^(?:(?P<dmp_page>[_a-zA-Z0-9\-]+)(?:\.(?P<dmp_function>[_a-zA-Z0-9\.\-]+))?(?:/(?P<dmp_urlparams>.+?))?/?)?$'
+)
+
+
+def dispatch_resolver(app_names, default_app=True):
+    '''
+    Creates one pattern that routes the DMP conventions for all of the given apps
+    (and the DEFAULT_APP if default_app is True).  This is an alternative to calling
+    app_resolver() for each app: Django tries those one after another, so resolve time
+    grows with the number of apps.  This pattern looks up the first path segment
+    in a dictionary of app names and then matches the rest with a single regex,
+    so resolve time is the same for 5 or 200 apps.
+
+    The RoutingData, pattern names, and fallback to the default app are the same
+    as with app_resolver().  The one difference is that an app name must be a full
+    path segment (app_resolver() also matches /homepagexyz/ as /homepage/xyz/).
+
+    DMP's urls.py uses this when the DISPATCH_TABLE option is True.
+    '''
+    return DispatchPattern(app_names, default_app)
+
+
+class DispatchPattern(URLPattern):
+    '''
+    A DMP-style, convention-based pattern for many apps at once.
+    Call `dispatch_resolver()` to instantiate this class.
+    '''
+    def __init__(self, app_names, default_app=True):
+        self.dmp = apps.get_app_config('django_mako_plus')
+        # first path segment -> app name
+        self.app_names = {}
+        for app_name in app_names:
+            self.dmp.register_app(app_name)
+            self.app_names[app_name] = app_name
+        self.default_app = self.dmp.options['DEFAULT_APP'] if default_app else None
+        if self.default_app:
+            self.dmp.register_app(self.default_app)
+        regex = RegexPattern(r'^', name='DMP dispatch', is_endpoint=False) if RegexPattern is not None else r'^'
+        # the super constructor needs a view function, but resolve() doesn't use it
+        def no_op_view(request):
+            raise Http404()
+        super().__init__(regex, no_op_view, None, name='DMP dispatch')
+
+
+    def resolve(self, path):
+        '''
+        Matches the path against the app named by its first segment, then against the default app.
+        Returns None if no convention matches.
+        '''
+        candidates = []
+        segment, slash, rest = path.partition('/')
+        app_name = self.app_names.get(segment)
+        if app_name is not None:
+            candidates.append(( app_name, app_name, rest ))
+        if self.default_app:
+            candidates.append(( self.default_app, None, path ))
+
+        tried = []
+        for app_name, pretty_app_name, subpath in candidates:
+            match = RE_DISPATCH.match(subpath)
+            if match is None:
+                continue
+            page, function, urlparams = match.group('dmp_page', 'dmp_function', 'dmp_urlparams')
+            pretty_app_name = pretty_app_name or '<default app>'
+            # the same names as dmp_paths_for_app()
+            if page is None:
+                url_name = 'DMP /{}'.format(pretty_app_name)
+            else:
+                url_name = 'DMP /{}/page{}{}'.format(pretty_app_name, '.function' if function else '', '/urlparams' if urlparams else '')
+            try:
+                routing_data = RoutingData(
+                    app_name,
+                    page or self.dmp.options['DEFAULT_PAGE'],
+                    function or 'process_request',
+                    (urlparams or '').strip(),
+                )
+            except ViewDoesNotExist as vdne:
+                # same as PagePattern: show the dev what happened on the 404 page
+                msg = "◉︵◉ Pattern matched, but discovery failed: {}".format(vdne)
+                log.debug("%s %s", url_name, msg)
+                tried.append([ PatternStub(url_name, msg, PatternStub(url_name, msg, None)) ])
+                continue
+            return resolver_match(
+                RequestViewWrapper(routing_data),
+                (),
+                {},
+                url_name,
+                [ pretty_app_name ],
+                [ pretty_app_name ],
+                route=RE_DISPATCH.pattern if subpath is path else '{}/{}'.format(segment, RE_DISPATCH.pattern.lstrip('^')),
+            )
+
+        if len(tried) > 0:
+            raise Resolver404({ 'tried': tried, 'path': path })
+        return None
+
+
+
+##################################################
+###  Helpers
+
+# Django 2.2+ keeps the matched route on ResolverMatch, and Django 3.2+ joins it
+# to the including resolver's route (so it can't be None)
+RESOLVER_MATCH_HAS_ROUTE = 'route' in inspect.signature(ResolverMatch).parameters
+
+def resolver_match(func, args, kwargs, url_name, app_names=None, namespaces=None, route=None):
+    '''Creates a ResolverMatch, with the route on Django versions that have it'''
+    if RESOLVER_MATCH_HAS_ROUTE:
+        return ResolverMatch(func, args, kwargs, url_name, app_names, namespaces, route=route or '')
+    return ResolverMatch(func, args, kwargs, url_name, app_names, namespaces)
+
+
 from collections import namedtuple
 PatternStub = namedtuple('PatternStub', [ 'name', 'pattern', 'regex' ])
@@ -1,5 +1,8 @@
 from mako.runtime import supports_caller
 
+from .template.fragment_cache import cache_tag
+from .template.parallel import start_parallel, end_parallel, render_task
+
 ###
 ###  Mako-style tags that DMP provides
 ###
@@ -56,3 +59,85 @@ def autoescape_off(context):
     '''
     toggle_autoescape(context, False)
     return ''
+
+
+
+#########################################################
+###  Parallel rendering (see template/parallel.py)
+
+@supports_caller
+def parallel(context):
+    '''
+    Renders the defs of the <%dmp:task> tags inside it at the same time (in a
+    thread pool of PARALLEL_MAX_WORKERS threads), then writes everything in
+    document order.  Use it for sections that each wait on their own I/O.
+
+    Example use in template:
+        <%namespace name="dmp" module="django_mako_plus.tags"/>
+
+        <%dmp:parallel>
+            <div class="col"><%dmp:task name="orders"/></div>
+            <div class="col"><%dmp:task name="news" count="${ 5 }"/></div>
+        </%dmp:parallel>
+
+        <%def name="orders()"> ... </%def>
+        <%def name="news(count)"> ... </%def>
+
+    The defs are rendered with the variables the template was rendered with, plus
+    the arguments given to the task tag.  They don't see local variables.
+    '''
+    run, previous = start_parallel(context)
+    context._push_buffer()
+    try:
+        context['caller'].body()
+    except Exception:
+        run.cancel()
+        raise
+    finally:
+        content = context._pop_buffer().getvalue()
+        end_parallel(context, previous)
+    context.write(run.stitch(content))
+    return ''
+
+
+def task(context, name, **kwargs):
+    '''
+    Renders the named <%def> (with kwargs as its arguments).  Inside <%dmp:parallel>,
+    it renders in the thread pool.  Anywhere else, it renders right away.
+    '''
+    return render_task(context, name, kwargs)
+
+
+
+#########################################################
+###  Fragment caching (see template/fragment_cache.py)
+
+@supports_caller
+def cached(context, key=None, name=None, timeout=None, vary=None, alias=None):
+    '''
+    Caches the output of its body in the Django cache.  The key combines the given
+    key (any value, or a list of them; models give their label, pk, and updated_at),
+    the tag's position, and a digest of the template and every template it inherits,
+    includes, or imports.  Nested tags make Russian-doll caches: when a comment
+    changes, only its fragment and the ones around it render again.
+
+    Example use in template:
+        <%namespace name="dmp" module="django_mako_plus.tags"/>
+
+        <%dmp:cached key="${ ( article, article.comments.count() ) }" timeout="3600">
+            <h1>${ article.title }</h1>
+            %for comment in article.comments.all():
+                <%dmp:cached key="${ comment }">
+                    <%include file="comment.htm" args="comment=comment"/>
+                </%dmp:cached>
+            %endfor
+        </%dmp:cached>
+
+    The defaults of alias, timeout, and vary (request attributes, such as "user.pk")
+    come from the FRAGMENT_CACHE_ARGS option.  Give a name to keep the same key when
+    the template's lines move, or to share a fragment between defs.
+    '''
+    # the caller's context is the template's (the namespace's context doesn't have `self` and `local`)
+    caller = context['caller']
+    cache_tag(caller.context, caller.body, key, name, timeout, vary, alias)
+    return ''
@@ -1,4 +1,8 @@
 from .adapter import MakoTemplateAdapter
 from .loader import MakoTemplateLoader
-from .lexer import ExpressionPostProcessor
+from .registry import TEMPLATE_REGISTRY
+from .analysis import CONTEXT_ANALYSIS
+from .fragment_cache import FRAGMENT_CACHE
+from .lexer import ExpressionPostProcessor, expression_text, expression_filter
 from .util import template_inheritance, create_mako_context
+from .streaming import flush
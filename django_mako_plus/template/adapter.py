@@ -1,6 +1,11 @@
 from django.apps import apps
 from django.conf import settings
-from django.http import HttpResponse
+try:
+    from django.core.exceptions import SynchronousOnlyOperation
+except ImportError:  # Django < 3.0 doesn't check for sync operations in the event loop
+    class SynchronousOnlyOperation(Exception):
+        pass
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils.html import mark_safe
 from django.template import Context, RequestContext
 
@@ -9,8 +14,10 @@ from mako.exceptions import RichTraceback
 
 from ..exceptions import RedirectException
 from ..signals import dmp_signal_pre_render_template, dmp_signal_post_render_template, dmp_signal_redirect_exception
-from ..util import log
+from ..util import log, run_in_thread
+from .analysis import CONTEXT_ANALYSIS
 from .util import get_template_debug_info
+from .streaming import TemplateStream
 
 import logging
 import mimetypes
@@ -19,6 +26,16 @@ import os.path
 import sys
 
 
+# attribute set on Mako templates that have to render in a worker thread when called from async code
+RENDER_IN_THREAD_ATTR_NAME = 'dmp_render_in_thread'
+
+# attribute that holds the context processor output on requests that don't have their own request.dmp
+PROCESSOR_OUTPUT_ATTR_NAME = '_dmp_context_processor_output'
+
+# the variables Django puts in every context
+CONTEXT_BUILTINS = { 'True': True, 'False': False, 'None': None }
+
+
 
 class MakoTemplateAdapter(object):
     '''A thin wrapper for a Mako template object that provides the Django API methods.'''
@@ -63,6 +80,74 @@ class MakoTemplateAdapter(object):
                template object render.
         '''
         dmp = apps.get_app_config('django_mako_plus')
+        render_obj, context_dict, context = self._prepare_render(context, request, def_name)
+
+        # PRIMARY FUNCTION: render the template
+        content = self._render_unicode(render_obj, context_dict)
+
+        # send the post-render signal
+        if dmp.options['SIGNALS'] and request is not None:
+            for receiver, ret_content in dmp_signal_post_render_template.send(sender=self, request=request, context=context, template=self.mako_template, content=content):
+                if ret_content is not None:
+                    content = ret_content  # sets it to the last non-None return in the signal receiver chain
+
+        # return
+        return mark_safe(content)
+
+
+    def stream(self, context=None, request=None, def_name=None, charset=None, chunk_size=None, early_flush=None):
+        '''
+        Renders the template in streaming mode: returns an iterator of encoded chunks (bytes)
+        that are produced as the template runs (see streaming.py).  Memory stays small no
+        matter the size of the page, and the first chunk can go out before the template finishes.
+
+            @charset     The charset to encode the chunks with.  Defaults to settings.DEFAULT_CHARSET.
+            @chunk_size  The number of characters in each chunk.  Defaults to the STREAM_CHUNK_SIZE option.
+            @early_flush Whether to send the document head (through </head>) as soon as it's written,
+                         rather than waiting for a full chunk.  Defaults to the STREAM_EARLY_FLUSH option.
+
+        The other arguments are the same as render().  The pre-render signal is sent, but the
+        post-render signal isn't (there is no full content to replace).  Exceptions raised before
+        the first chunk are raised from this method; later ones are raised during iteration.
+
+        The template runs in a worker thread with its own database connection.  So that its queries
+        never leave a transaction, the page is rendered here in one chunk instead when a database
+        connection is in an atomic block (such as with ATOMIC_REQUESTS), and also when the
+        STREAM_MAX_THREADS option's number of streams are already running.
+        '''
+        dmp = apps.get_app_config('django_mako_plus')
+        render_obj, context_dict, context = self._prepare_render(context, request, def_name)
+        charset = charset or settings.DEFAULT_CHARSET
+        if not TemplateStream.reserve_thread():
+            return [ self._render_unicode(render_obj, context_dict).encode(charset) ]
+        return TemplateStream(
+            render_obj,
+            context_dict,
+            charset,
+            chunk_size or dmp.options['STREAM_CHUNK_SIZE'],
+            early_flush if early_flush is not None else dmp.options['STREAM_EARLY_FLUSH'],
+        ).start()
+
+
+    def _render_unicode(self, render_obj, context_dict):
+        '''Renders the template (or def) to a string, logging exceptions in debug mode'''
+        if settings.DEBUG:
+            try:
+                return render_obj.render_unicode(**context_dict)
+            except Exception as e:
+                e.template_debug = get_template_debug_info(e)
+                log.exception('exception raised during template rendering: %s', e)  # to the console
+                raise   # reraises the same error
+        # in non-DEBUG mode, we want to let the exception throw out of here (without having to re-raise it)
+        return render_obj.render_unicode(**context_dict)
+
+
+    def _prepare_render(self, context, request, def_name):
+        '''
+        Runs the steps before rendering: context processors, the pre-render signal, and the def lookup.
+        Returns ( render object, context dict, context ).
+        '''
+        dmp = apps.get_app_config('django_mako_plus')
         # set up the context dictionary, which is the variables available throughout the template
         context_dict = {}
         # if request is None, add some default items because the context processors won't happen
@@ -70,11 +155,18 @@ class MakoTemplateAdapter(object):
             context_dict['settings'] = settings
             context_dict['STATIC_URL'] = settings.STATIC_URL
         # let the context_processors add variables to the context.
-        if not isinstance(context, Context):
-            context = Context(context) if request is None else RequestContext(request, context)
-        with context.bind_template(self):
-            for d in context:
-                context_dict.update(d)
+        per_request = request is not None and not isinstance(context, Context) and dmp.options['CONTEXT_PROCESSORS_PER_REQUEST']
+        if per_request:
+            # the processors run below, once the pre-render signal has chosen the template
+            user_context = context
+            if dmp.options['SIGNALS']:
+                context = RequestContext(request, context)
+        else:
+            if not isinstance(context, Context):
+                context = Context(context) if request is None else RequestContext(request, context)
+            with context.bind_template(self):
+                for d in context:
+                    context_dict.update(d)
         context_dict.pop('self', None)  # some contexts have self in them, and it messes up render_unicode below because we get two selfs
 
         # send the pre-render signal
@@ -86,6 +178,13 @@ class MakoTemplateAdapter(object):
                     else:
                         self.mako_template = ret_template_obj                 # if something else, we assume it is a mako.template.Template, so use it as the template
 
+        if per_request:
+            # the processors ran already if this isn't the first render of the request
+            context_dict.update(get_context_processor_output(request, self.engine, self.mako_template))
+            if user_context is not None:
+                context_dict.update(user_context)
+            context_dict.pop('self', None)
+
         # do we need to limit down to a specific def?
         # this only finds within the exact template (won't go up the inheritance tree)
         # I wish I could make it do so, but can't figure this out
@@ -95,31 +194,13 @@ class MakoTemplateAdapter(object):
         if def_name:  # do we need to limit to just a def?
             render_obj = self.mako_template.get_def(def_name)
 
-        # PRIMARY FUNCTION: render the template
         template_name = '%s::%s' % (self.mako_template.filename or 'string', def_name or 'body')
         if log.isEnabledFor(logging.INFO):
             log.info('rendering template %s', template_name)
-        if settings.DEBUG:
-            try:
-                content = render_obj.render_unicode(**context_dict)
-            except Exception as e:
-                e.template_debug = get_template_debug_info(e)
-                log.exception('exception raised during template rendering: %s', e)  # to the console
-                raise   # reraises the same error
-        else:  # this is outside the above "try" loop because in non-DEBUG mode, we want to let the exception throw out of here (without having to re-raise it)
-            content = render_obj.render_unicode(**context_dict)
-
-        # send the post-render signal
-        if dmp.options['SIGNALS'] and request is not None:
-            for receiver, ret_content in dmp_signal_post_render_template.send(sender=self, request=request, context=context, template=self.mako_template, content=content):
-                if ret_content is not None:
-                    content = ret_content  # sets it to the last non-None return in the signal receiver chain
-
-        # return
-        return mark_safe(content)
+        return render_obj, context_dict, context
 
 
-    def render_to_response(self, context=None, request=None, def_name=None, content_type=None, status=None, charset=None):
+    def render_to_response(self, context=None, request=None, def_name=None, content_type=None, status=None, charset=None, stream=False, early_flush=None):
         '''
         Renders the template and returns an HttpRequest object containing its content.
 
@@ -138,9 +219,11 @@ class MakoTemplateAdapter(object):
                           or a Django Context object.
             @def_name     Limits output to a specific top-level Mako <%block> or <%def> section within the template.
                           For example, def_name="foo" will call <%block name="foo"></%block> or <%def name="foo()"></def> within the template.
-            @content_type The MIME type of the response.  Defaults to settings.DEFAULT_CONTENT_TYPE (usually 'text/html').
+            @content_type The MIME type of the response.  Defaults to settings.DEFAULT_CONTENT_TYPE (usually 'text/html', which Django 3.0+ always uses).
             @status       The HTTP response status code.  Defaults to 200 (OK).
             @charset      The charset to encode the processed template string (the output) with.  Defaults to settings.DEFAULT_CHARSET (usually 'utf-8').
+            @stream       If True, returns a StreamingHttpResponse that sends the page in chunks as the template runs (see stream()).
+            @early_flush  When streaming, whether to send the document head as soon as it's written (see stream()).
 
         The method triggers two signals:
             1. dmp_signal_pre_render_template: you can (optionally) return a new Mako Template object from a receiver to replace
@@ -149,24 +232,125 @@ class MakoTemplateAdapter(object):
                template object render.
         '''
         try:
-            if content_type is None:
-                content_type = mimetypes.types_map.get(os.path.splitext(self.mako_template.filename)[1].lower(), settings.DEFAULT_CONTENT_TYPE)
-            if charset is None:
-                charset = settings.DEFAULT_CHARSET
-            if status is None:
-                status = 200
-            content = self.render(context=context, request=request, def_name=def_name)
-            return HttpResponse(content.encode(charset), content_type='%s; charset=%s' % (content_type, charset), status=status)
-
-        except RedirectException: # redirect to another page
-            e = sys.exc_info()[1]
-            if request is None:
-                log.info('a template redirected processing to %s', e.redirect_to)
+            if stream:
+                content = self.stream(context=context, request=request, def_name=def_name, charset=charset, early_flush=early_flush)
             else:
-                log.info('view function %s.%s redirected processing to %s', request.dmp.module, request.dmp.function, e.redirect_to)
-            # send the signal
-            dmp = apps.get_app_config('django_mako_plus')
-            if dmp.options['SIGNALS']:
-                dmp_signal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=e)
-            # send the browser the redirect command
-            return e.get_response(request)
+                content = self.render(context=context, request=request, def_name=def_name)
+            return self._make_response(content, content_type, status, charset)
+
+        except RedirectException as e: # redirect to another page
+            return self._make_redirect_response(request, e)
+
+
+    async def arender(self, context=None, request=None, def_name=None, thread=None):
+        '''
+        Async version of render(), for `async def` views.
+
+        Mako rendering is synchronous, so a template that does I/O (such as evaluating
+        a lazy queryset) shouldn't run in the event loop.  By default, the template renders
+        directly in the event loop.  If Django raises SynchronousOnlyOperation during the
+        render, the template is rendered again in a worker thread -- and is always rendered
+        there from then on.  Set thread to True or False to choose explicitly.
+        '''
+        in_thread = thread if thread is not None else getattr(self.mako_template, RENDER_IN_THREAD_ATTR_NAME, False)
+        if not in_thread:
+            try:
+                return self.render(context=context, request=request, def_name=def_name)
+            except SynchronousOnlyOperation:
+                if thread is not None:
+                    raise
+                log.info('template %s needs a worker thread to render from async code', self.mako_template.filename)
+                setattr(self.mako_template, RENDER_IN_THREAD_ATTR_NAME, True)
+        return await run_in_thread(self.render, context=context, request=request, def_name=def_name)
+
+
+    async def arender_to_response(self, context=None, request=None, def_name=None, content_type=None, status=None, charset=None, thread=None):
+        '''Async version of render_to_response(), for `async def` views.  See arender() for the thread argument.'''
+        try:
+            content = await self.arender(context=context, request=request, def_name=def_name, thread=thread)
+            return self._make_response(content, content_type, status, charset)
+
+        except RedirectException as e: # redirect to another page
+            return self._make_redirect_response(request, e)
+
+
+    def _make_response(self, content, content_type=None, status=None, charset=None):
+        '''Returns an HttpResponse for rendered content, or a StreamingHttpResponse for a TemplateStream'''
+        if content_type is None:
+            content_type = mimetypes.types_map.get(os.path.splitext(self.mako_template.filename)[1].lower(), getattr(settings, 'DEFAULT_CONTENT_TYPE', 'text/html'))
+        if charset is None:
+            charset = settings.DEFAULT_CHARSET
+        if status is None:
+            status = 200
+        if isinstance(content, TemplateStream):
+            return StreamingHttpResponse(content, content_type='%s; charset=%s' % (content_type, charset), status=status)
+        return HttpResponse(content.encode(charset), content_type='%s; charset=%s' % (content_type, charset), status=status)
+
+
+    def _make_redirect_response(self, request, e):
+        '''Returns the browser redirect for a RedirectException raised during rendering'''
+        if request is None:
+            log.info('a template redirected processing to %s', e.redirect_to)
+        else:
+            log.info('view function %s.%s redirected processing to %s', request.dmp.module, request.dmp.function, e.redirect_to)
+        # send the signal
+        dmp = apps.get_app_config('django_mako_plus')
+        if dmp.options['SIGNALS']:
+            dmp_signal_redirect_exception.send(sender=sys.modules[__name__], request=request, exc=e)
+        # send the browser the redirect command
+        return e.get_response(request)
+
+
+
+def get_context_processor_output(request, engine, template=None):
+    '''
+    Returns the combined output of the engine's context processors for the request.
+    Each processor runs the first time it's needed in the request, and the output
+    is kept on request.dmp (or on the request if it doesn't have its own request.dmp,
+    such as when a non-DMP view renders a template).
+
+    If a Mako template is given and the CONTEXT_PROCESSORS_SKIP_UNUSED option is on,
+    processors whose variables the template can't read are skipped (see analysis.py).
+    '''
+    routing_data = getattr(request, 'dmp', None)
+    if routing_data is not None and routing_data.request is request:
+        holder, attr_name = routing_data, 'context_processor_output'
+    else:   # middleware's placeholder RoutingData is shared by all requests
+        holder, attr_name = request, PROCESSOR_OUTPUT_ATTR_NAME
+    output = getattr(holder, attr_name, None)
+    if output is None:
+        output = ProcessorOutput(CONTEXT_BUILTINS)
+        setattr(holder, attr_name, output)
+    processors = engine.template_context_processors
+    if template is not None:
+        dmp = apps.get_app_config('django_mako_plus')
+        if dmp.options['CONTEXT_PROCESSORS_SKIP_UNUSED']:
+            processors = CONTEXT_ANALYSIS.select(processors, template)
+    ran = getattr(output, 'ran', None)
+    if ran is not None:     # a dict assigned by the view is used as it is
+        for processor in processors:
+            if processor not in ran:
+                output.update(processor(request))
+                ran.add(processor)
+    return output
+
+
+def reset_context_processor_output(sender, request=None, **kwargs):
+    '''
+    Receiver of Django's user_logged_in and user_logged_out signals.  Logging in or out changes the
+    user, perms, and csrf token, so the context processors run again on the next render of the request.
+    '''
+    if request is None:
+        return
+    routing_data = getattr(request, 'dmp', None)
+    if routing_data is not None and routing_data.request is request:
+        routing_data.context_processor_output = None
+    if getattr(request, PROCESSOR_OUTPUT_ATTR_NAME, None) is not None:
+        setattr(request, PROCESSOR_OUTPUT_ATTR_NAME, None)
+
+
+class ProcessorOutput(dict):
+    '''The context processor output of a request, with the set of processors that have run'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ran = set()
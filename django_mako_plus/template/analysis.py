@@ -0,0 +1,260 @@
+from django.apps import apps
+from django.conf import settings
+from mako import parsetree
+from mako.lookup import TemplateLookup
+
+from ..util import log
+
+import io
+import logging
+import textwrap
+import threading
+import tokenize
+
+
+#########################################################
+###   Which context processors a template can use
+###
+###   Every render runs the context processors, even though many templates
+###   never read `user`, `perms`, `messages`, or `sql_queries`.
+###
+###   When DMPLexer compiles a template, it collects the names the template
+###   reads from the context (the undeclared identifiers of its expressions,
+###   code, control lines, and tags) and writes them into the compiled module,
+###   along with the files it inherits, includes, or imports as namespaces.
+###   At render time, the names of the template and those files are combined,
+###   and a processor is skipped when none of the variables it adds can be read.
+###
+###   Only processors whose variables are known are skipped: the ones in
+###   PROCESSOR_NAMES and the CONTEXT_PROCESSOR_NAMES option.  A template that
+###   can read any name (it uses `context`, `pageargs`, or `local`, reads the
+###   `context` of a namespace like `self`, uses a dynamic file name, or imports a
+###   Python module namespace) runs all processors.
+
+
+# module-level variables that DMPLexer writes into compiled templates
+NAMES_VAR = '_dmp_context_names'        # names the template reads from the context (None means any name)
+FILES_VAR = '_dmp_context_files'        # files the template inherits, includes, or imports as namespaces
+DIGEST_VAR = '_dmp_source_digest'       # digest of the template source (see fragment_cache.py)
+AUTOESCAPE_VAR = '_dmp_autoescape'      # the AUTOESCAPE option the template was compiled with (see loader.py)
+
+# attribute set on Mako templates that holds the names reachable through the template and its files
+REACHABLE_ATTR_NAME = 'dmp_reachable_names'
+
+# Mako's namespaces, which give the whole context through their `context` attribute.
+# calling their defs (self.content(), next.body()) and passing them to DMP's functions
+# (django_mako_plus.links(self)) is safe, so these only open the context when used otherwise.
+NAMESPACE_NAMES = { 'self', 'parent', 'next', 'caller' }
+NAMESPACE_SAFE_MODULE = 'django_mako_plus'
+
+# names that give the template's whole context to other code
+OPEN_CONTEXT_NAMES = { 'context', 'pageargs', 'local' } | NAMESPACE_NAMES
+
+# Python modules that can be imported as namespaces without reading other context variables
+KNOWN_NAMESPACE_MODULES = { 'django_mako_plus.tags' }
+
+# names DMP reads from the context on its own (such as the request in django_mako_plus.links())
+DMP_CONTEXT_NAMES = { 'request' }
+
+# the variables added by Django's and DMP's processors
+PROCESSOR_NAMES = {
+    'django.template.context_processors.csrf': ( 'csrf_token', ),
+    'django.template.context_processors.debug': ( 'debug', 'sql_queries' ),
+    'django.template.context_processors.i18n': ( 'LANGUAGES', 'LANGUAGE_CODE', 'LANGUAGE_BIDI' ),
+    'django.template.context_processors.media': ( 'MEDIA_URL', ),
+    'django.template.context_processors.request': ( 'request', ),
+    'django.template.context_processors.static': ( 'STATIC_URL', ),
+    'django.template.context_processors.tz': ( 'TIME_ZONE', ),
+    'django.contrib.auth.context_processors.auth': ( 'user', 'perms' ),
+    'django.contrib.messages.context_processors.messages': ( 'messages', 'DEFAULT_MESSAGE_LEVELS' ),
+    'django_mako_plus.context_processors.settings': ( 'settings', ),
+    'django_mako_plus.context_processors.csrf': ( 'csrf_input', 'csrf_token' ),
+}
+
+
+def find_context_names(template_node):
+    '''
+    Returns ( names, files ) for a parsed template (Mako's TemplateNode):
+    the names the template reads from the context, or None if it can read any name,
+    and the files of its <%inherit>, <%include>, and <%namespace> tags.
+    Called by DMPLexer during compilation.
+    '''
+    names = set()
+    files = []
+    open_context = False
+    seen = set()
+    stack = list(template_node.nodes)
+    while stack:
+        node = stack.pop()
+        # control lines list their body nodes again, so nodes can be reached twice
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.extend(getattr(node, 'nodes', ()))
+        if hasattr(node, 'undeclared_identifiers'):    # text and comments don't have identifiers
+            identifiers = set(node.undeclared_identifiers())
+            if identifiers & NAMESPACE_NAMES and namespaces_read_context(node):
+                open_context = True
+            names.update(identifiers - NAMESPACE_NAMES)     # safe uses of the namespaces
+        if isinstance(node, ( parsetree.InheritTag, parsetree.IncludeTag, parsetree.NamespaceTag )):
+            module = node.attributes.get('module')
+            if module is not None and module not in KNOWN_NAMESPACE_MODULES:
+                open_context = True
+            filename = node.attributes.get('file')
+            if filename is not None:
+                if '${' in filename:
+                    open_context = True
+                elif filename not in files:
+                    files.append(filename)
+    if open_context or names & OPEN_CONTEXT_NAMES:
+        return None, tuple(files)
+    return tuple(sorted(names)), tuple(files)
+
+
+def namespaces_read_context(node):
+    '''
+    Returns True if a parsed node reads the context through a Mako namespace (NAMESPACE_NAMES):
+    ${ self.context.get('user') }, or passing `self` to code that could do the same.  Attributes
+    of the namespaces (their defs) and DMP's own functions only read the names in the template files.
+    '''
+    if getattr(node, 'text', None) is not None:
+        sources = [ node.text ]
+    else:
+        sources = [ value for value in getattr(node, 'attributes', {}).values() if isinstance(value, str) ]
+    for source in sources:
+        try:
+            tokens = [ t.string for t in tokenize.generate_tokens(io.StringIO(textwrap.dedent(source)).readline) if t.string.strip() ]
+        except ( tokenize.TokenError, SyntaxError ):
+            return True
+        for i, token in enumerate(tokens):
+            if token not in NAMESPACE_NAMES or (i > 0 and tokens[i - 1] == '.'):
+                continue
+            # self.content() or next.body()
+            if tokens[i + 1:i + 2] == [ '.' ] and tokens[i + 2:i + 3] != [ 'context' ]:
+                continue
+            # django_mako_plus.links(self)
+            if i >= 4 and tokens[i - 4:i - 2] == [ NAMESPACE_SAFE_MODULE, '.' ] and tokens[i - 1] == '(' and tokens[i + 1:i + 2] == [ ')' ]:
+                continue
+            return True
+    return False
+
+
+def reachable_names(template):
+    '''
+    Returns a frozenset of the names a Mako template can read from the context,
+    including the names of the templates it inherits, includes, and imports.
+    Returns None if it can read any name (or wasn't compiled by DMPLexer).
+    '''
+    try:
+        return template.__dict__[REACHABLE_ATTR_NAME]
+    except KeyError:
+        pass
+    names = _reachable_names(template, set())
+    # in debug mode, the files might change (and be reloaded) without this template changing
+    if not settings.DEBUG:
+        setattr(template, REACHABLE_ATTR_NAME, names)
+    return names
+
+
+def _reachable_names(template, seen):
+    '''Returns the reachable names of a template and the files it uses that aren't in seen'''
+    seen.add(template.uri)
+    module = template.module
+    names = getattr(module, NAMES_VAR, None)
+    if names is None:
+        return None
+    names = set(names)
+    for filename in getattr(module, FILES_VAR, ()):
+        try:
+            uri = template.lookup.adjust_uri(filename, template.uri)
+            if uri in seen:
+                continue
+            file_names = _reachable_names(get_file_template(template, filename), seen)
+        except Exception as e:
+            log.debug('names of %s are unknown because %s could not be loaded: %s', template.uri, filename, e)
+            return None
+        if file_names is None:
+            return None
+        names.update(file_names)
+    return frozenset(names)
+
+
+def get_file_template(template, filename):
+    '''Returns the template for a file that a template inherits, includes, or imports'''
+    # Mako's method, so DMP's lookups don't count this in the usage profile
+    return TemplateLookup.get_template(template.lookup, template.lookup.adjust_uri(filename, template.uri))
+
+
+
+class ContextAnalysis(object):
+    '''
+    Chooses the context processors to run for a template, and keeps
+    a report of the processors skipped for each template.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processor_names = {}   # processor -> frozenset of the names it adds (None if unknown)
+        self.skipped = {}           # template filename -> tuple of skipped processor paths
+
+
+    def get_processor_names(self, processor):
+        '''Returns a frozenset of the variables a processor adds, or None if they aren't known'''
+        try:
+            return self.processor_names[processor]
+        except KeyError:
+            pass
+        dmp = apps.get_app_config('django_mako_plus')
+        path = processor_path(processor)
+        names = dmp.options['CONTEXT_PROCESSOR_NAMES'].get(path, PROCESSOR_NAMES.get(path))
+        names = frozenset(names) if names is not None else None
+        with self.lock:
+            self.processor_names[processor] = names
+        return names
+
+
+    def select(self, processors, template):
+        '''Returns the processors (from the given list) whose variables the template can read'''
+        names = reachable_names(template)
+        if names is None:
+            return processors
+        names = names | DMP_CONTEXT_NAMES
+        selected = []
+        skipped = []
+        for processor in processors:
+            processor_names = self.get_processor_names(processor)
+            if processor_names is None or not processor_names.isdisjoint(names):
+                selected.append(processor)
+            else:
+                skipped.append(processor_path(processor))
+        if skipped:
+            skipped = tuple(skipped)
+            if self.skipped.get(template.filename) != skipped:
+                with self.lock:
+                    self.skipped[template.filename] = skipped
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('template %s skips context processors it does not use: %s', template.filename, ', '.join(skipped))
+        return selected
+
+
+    def report(self):
+        '''Returns a dict of template filename -> list of the context processors skipped for it'''
+        with self.lock:
+            return { filename: list(skipped) for filename, skipped in sorted(self.skipped.items()) }
+
+
+    def clear(self):
+        '''Forgets the processor names (such as after changing the CONTEXT_PROCESSOR_NAMES option) and the report'''
+        with self.lock:
+            self.processor_names.clear()
+            self.skipped.clear()
+
+
+
+def processor_path(processor):
+    '''Returns the dotted path of a processor function'''
+    return '{}.{}'.format(getattr(processor, '__module__', None), getattr(processor, '__qualname__', type(processor).__name__))
+
+
+
+# chooses the processors for each render
+CONTEXT_ANALYSIS = ContextAnalysis()
@@ -0,0 +1,371 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models import Model
+import mako.cache
+
+from ..util import log, with_thread_state
+from .analysis import FILES_VAR, DIGEST_VAR, get_file_template
+from .parallel import PARALLEL_KEY
+from .util import template_inheritance
+
+import datetime
+import decimal
+import enum
+import hashlib
+import os.path
+import threading
+import time
+import uuid
+
+
+#########################################################
+###   Fragment caching in the Django cache
+###
+###   Mako caches the output of defs and blocks marked cached="True",
+###   but its default implementation (Beaker) isn't part of Django.
+###   Setting the FRAGMENT_CACHE_IMPL option to 'django' makes DMP's lookups
+###   use this implementation instead, which keeps fragments in a Django cache,
+###   so all processes share them:
+###
+###     <%block name="sidebar" cached="True" cache_timeout="300" cache_vary="user.pk">
+###
+###   Defaults for the cache_* attributes come from the FRAGMENT_CACHE_ARGS option.
+###
+###     - cache_alias:   the Django cache (in settings.CACHES)
+###     - cache_timeout: seconds the fragment is fresh (None for no expiration)
+###     - cache_vary:    comma-separated request attributes that get their own copies
+###                      of the fragment, such as "user.pk, LANGUAGE_CODE"
+###     - cache_stale:   seconds after the timeout that the old fragment is still served
+###                      while one process renders it again in a background thread
+###     - cache_key:     (from Mako) the key within the template; the default is the def name
+###
+###   Keys include the template's path and its dependency digest, so a changed
+###   template starts with new fragments.
+###
+###   Stale-while-revalidate renders the def or block on its own in a worker thread,
+###   with the data the page was rendered with (as template.get_def(name).render()
+###   would).  DMPLexer marks the defs and blocks this works for (top-level defs
+###   without arguments and named blocks) with a cache_def_name attribute.  Stale
+###   copies of the others are rendered again in the request, like a miss.
+###
+###   Russian-doll caching with <%dmp:cached> (see tags.py), which always uses
+###   the Django cache:
+###
+###     <%dmp:cached key="${ article }">
+###         ${ article.title }
+###         %for comment in article.comments.all():
+###             <%dmp:cached key="${ comment }"> ... </%dmp:cached>
+###         %endfor
+###     </%dmp:cached>
+###
+###   The tag's key combines the caller's key values (models give their label,
+###   pk, and updated_at), the tag's position, and the dependency digest of the
+###   template it's in and of each template in the `self` inheritance chain.
+###   A dependency digest combines the digest of the template's source, which
+###   DMPLexer computes at compile time, with the dependency digests of the files
+###   the template inherits, includes, or imports (also recorded at compile time).
+###   Changing a file only changes the keys of the fragments that use it, and
+###   changing an inner fragment's model only renders that fragment again, as long
+###   as the outer key changes too (such as with the article's updated_at when
+###   comments touch their article).
+
+
+# name of the plugin in Mako's cache plugin registry
+CACHE_IMPL_NAME = 'django'
+
+# seconds a process can hold the lock to refresh a stale fragment
+REFRESH_LOCK_TIMEOUT = 60
+
+# attributes set on Mako templates that hold their path (relative to BASE_DIR) and dependency digest
+PATH_ATTR_NAME = 'dmp_fragment_path'
+DEPENDENCY_ATTR_NAME = 'dmp_dependency_digest'
+
+
+class FragmentCache(object):
+    '''
+    Gets and sets fragments in the Django cache, and refreshes stale fragments
+    in background threads.  Used by DjangoCacheImpl, the Mako cache plugin.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.threads = set()
+        self.reset_stats()
+
+
+    def reset_stats(self):
+        '''Resets the counters'''
+        # the counters are updated by request threads and refresh threads, under self.lock
+        # number of fragments found fresh in the cache
+        self.hits = 0
+        # number of fragments rendered in the request because they weren't cached (or were too old)
+        self.misses = 0
+        # number of stale fragments served while they were rendered again
+        self.stale_hits = 0
+        # number of fragments rendered again in background threads
+        self.refreshes = 0
+
+
+    def count(self, counter):
+        '''Adds one to a counter'''
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+    def make_key(self, template, key, vary, request):
+        '''Returns the Django cache key for a fragment'''
+        parts = [ template_id(template), key ]
+        for name in split_names(vary):
+            parts.append('{}={!r}'.format(name, request_attribute(request, name)))
+        return 'dmp-fragment:' + hashlib.md5('\n'.join(map(str, parts)).encode('utf8')).hexdigest()
+
+
+    def get_or_create(self, template, key, creation_function, context=None, alias='default', timeout=DEFAULT_TIMEOUT, stale=0, vary='', def_name=None, **kwargs):
+        '''Returns the fragment from the cache, rendering it with creation_function if needed'''
+        request = context.get('request') if context is not None else None
+        cache_key = self.make_key(template, key, vary, request)
+        if getattr(self.local, 'refreshing', None) == cache_key:
+            # this is the background render of a stale fragment
+            return self.set(cache_key, creation_function(), alias, timeout, stale)
+
+        cache = caches[alias]
+        entry = cache.get(cache_key)
+        if entry is not None:
+            content, fresh_until = entry
+            if fresh_until is None or time.time() < fresh_until:
+                self.count('hits')
+                return content
+            if def_name is not None and context is not None and int(stale or 0) > 0:
+                self.count('stale_hits')
+                # one process renders it again; the others serve the stale copy until it's done
+                if cache.add(cache_key + ':refresh', 1, REFRESH_LOCK_TIMEOUT):
+                    self.start_refresh(template, cache_key, def_name, context.kwargs, alias)
+                return content
+
+        self.count('misses')
+        return self.set(cache_key, creation_function(), alias, timeout, stale)
+
+
+    def get_or_render(self, cache_key, render, alias='default', timeout=DEFAULT_TIMEOUT):
+        '''Returns a fragment of a <%dmp:cached> tag from the cache, rendering it with render() if needed'''
+        entry = caches[alias].get(cache_key)
+        if entry is not None:
+            content, fresh_until = entry
+            if fresh_until is None or time.time() < fresh_until:
+                self.count('hits')
+                return content
+        self.count('misses')
+        return self.set(cache_key, render(), alias, timeout)
+
+
+    def set(self, cache_key, content, alias='default', timeout=DEFAULT_TIMEOUT, stale=0):
+        '''Adds a fragment to the cache. Returns the content.'''
+        cache = caches[alias]
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = cache.default_timeout
+        if timeout is None:
+            cache.set(cache_key, ( content, None ), None)
+        else:
+            timeout = int(timeout)
+            stale = int(stale or 0)
+            cache.set(cache_key, ( content, time.time() + timeout ), timeout + stale)
+        return content
+
+
+    def start_refresh(self, template, cache_key, def_name, data, alias):
+        '''Renders a stale fragment again in a background thread'''
+        thread = threading.Thread(target=with_thread_state(self.refresh), args=( template, cache_key, def_name, dict(data), alias ), name='dmp-fragment-refresh', daemon=True)
+        with self.lock:
+            self.threads.add(thread)
+        thread.start()
+
+
+    def refresh(self, template, cache_key, def_name, data, alias):
+        '''Renders a def or block to refresh its stale fragment (runs in a background thread)'''
+        self.local.refreshing = cache_key
+        try:
+            template.get_def(def_name).render_unicode(**data)
+            self.count('refreshes')
+        except Exception as e:
+            log.warning('stale fragment %s of %s could not be refreshed: %s', def_name, template.filename, e)
+        finally:
+            self.local.refreshing = None
+            caches[alias].delete(cache_key + ':refresh')
+            with self.lock:
+                self.threads.discard(threading.current_thread())
+
+
+    def join(self, timeout=None):
+        '''Waits for the background refreshes that are running'''
+        with self.lock:
+            threads = list(self.threads)
+        for thread in threads:
+            thread.join(timeout)
+
+
+
+class DjangoCacheImpl(mako.cache.CacheImpl):
+    '''
+    The Mako cache plugin for the Django cache framework.  DMP's template lookups
+    use it when the FRAGMENT_CACHE_IMPL option is 'django'.
+    '''
+    pass_context = True
+
+    def get_or_create(self, key, creation_function, **kwargs):
+        return FRAGMENT_CACHE.get_or_create(self.cache.template, key, creation_function, **kwargs)
+
+    # the methods below are for template.cache (the fragment for no request, if it varies)
+
+    def set(self, key, value, alias='default', timeout=DEFAULT_TIMEOUT, stale=0, vary='', **kwargs):
+        FRAGMENT_CACHE.set(FRAGMENT_CACHE.make_key(self.cache.template, key, vary, None), value, alias, timeout, stale)
+
+    def get(self, key, alias='default', vary='', **kwargs):
+        entry = caches[alias].get(FRAGMENT_CACHE.make_key(self.cache.template, key, vary, None))
+        return entry[0] if entry is not None else None
+
+    def invalidate(self, key, alias='default', vary='', **kwargs):
+        caches[alias].delete(FRAGMENT_CACHE.make_key(self.cache.template, key, vary, None))
+
+
+
+def cache_tag(context, body, key=None, name=None, timeout=None, vary=None, alias=None):
+    '''Writes the output of a <%dmp:cached> tag's body, from the cache if it's there'''
+    dmp = apps.get_app_config('django_mako_plus')
+    args = dmp.options['FRAGMENT_CACHE_ARGS']
+    alias = alias or args.get('alias', 'default')
+    if timeout is None:
+        timeout = args.get('timeout', DEFAULT_TIMEOUT)
+    if vary is None:
+        vary = args.get('vary', '')
+
+    template = context.get('local').template
+    if name is None:
+        code = getattr(body, '__code__', None)
+        name = 'line {}'.format(code.co_firstlineno if code is not None else '?')
+    parts = [ template_id(template), name, key_text(key) ]
+    parts.extend(dependency_digest(t) for t in template_inheritance(context))
+    request = context.get('request')
+    for attr in split_names(vary):
+        parts.append('{}={!r}'.format(attr, request_attribute(request, attr)))
+    cache_key = 'dmp-cache:' + hashlib.md5('\n'.join(map(str, parts)).encode('utf8')).hexdigest()
+
+    def render():
+        # tasks of an enclosing <%dmp:parallel> would leave their markers in the cached
+        # content, so they render inline here
+        previous = getattr(context.caller_stack, PARALLEL_KEY, None)
+        setattr(context.caller_stack, PARALLEL_KEY, None)
+        context._push_buffer()
+        try:
+            body()
+        finally:
+            setattr(context.caller_stack, PARALLEL_KEY, previous)
+            content = context._pop_buffer().getvalue()
+        return content
+
+    context.write(FRAGMENT_CACHE.get_or_render(cache_key, render, alias, timeout))
+
+
+# <%dmp:cached> key values whose repr() is the same in every process
+KEY_REPR_TYPES = ( str, int, float, decimal.Decimal, uuid.UUID, enum.Enum, type(None), datetime.timedelta )
+
+def key_text(value):
+    '''
+    Returns the text of a <%dmp:cached> key: models are their label, pk, and updated_at (if they have one),
+    dates and times are their ISO format, and lists and tuples are their items.  Other values must be one of
+    KEY_REPR_TYPES.  Other types raise TypeError because their text might be different in each process
+    (such as an object's memory address) or cost a query (a queryset).
+    '''
+    if isinstance(value, Model):
+        return '{}:{}:{}'.format(value._meta.label, value.pk, getattr(value, 'updated_at', ''))
+    if isinstance(value, ( list, tuple )):
+        return '({})'.format(','.join(key_text(v) for v in value))
+    if isinstance(value, ( datetime.date, datetime.time )):
+        return value.isoformat()
+    if isinstance(value, KEY_REPR_TYPES):
+        return repr(value)
+    raise TypeError('<%dmp:cached> keys must be strings, numbers, models, dates, or lists or tuples of these, not {}: '
+                    'use a value that is the same in every process, such as an id or a count'.format(type(value).__name__))
+
+
+def template_id(template):
+    '''Returns an id for the template that's the same in every process: its path and its dependency digest'''
+    try:
+        filename = template.__dict__[PATH_ATTR_NAME]
+    except KeyError:
+        filename = template.filename
+        if filename is not None:
+            filename = os.path.relpath(filename, settings.BASE_DIR)
+        setattr(template, PATH_ATTR_NAME, filename)
+    return '{}:{}'.format(filename, dependency_digest(template))
+
+
+def source_digest(text):
+    '''Returns the digest of a template's source (DMPLexer writes it into the compiled module)'''
+    return hashlib.md5(text.encode('utf8')).hexdigest()
+
+
+def dependency_digest(template):
+    '''
+    Returns a digest of a Mako template's source and the sources of the files it inherits,
+    includes, or imports as namespaces (and the files they use).
+    '''
+    try:
+        return template.__dict__[DEPENDENCY_ATTR_NAME]
+    except KeyError:
+        pass
+    digest = _dependency_digest(template, set())
+    # in debug mode, the files might change (and be reloaded) without this template changing
+    if not settings.DEBUG:
+        setattr(template, DEPENDENCY_ATTR_NAME, digest)
+    return digest
+
+
+def _dependency_digest(template, seen):
+    '''Returns the dependency digest of a template, skipping the files in seen'''
+    seen.add(template.filename)
+    module = template.module
+    digest = getattr(module, DIGEST_VAR, None)
+    if digest is None:      # not compiled by DMPLexer
+        try:
+            digest = source_digest(template.source)
+        except (IOError, TypeError):
+            digest = module.__name__
+    parts = [ digest ]
+    for filename in getattr(module, FILES_VAR, ()):
+        try:
+            file_template = get_file_template(template, filename)
+        except Exception as e:
+            log.debug('dependency digest of %s leaves out %s because it could not be loaded: %s', template.uri, filename, e)
+            parts.append(filename)
+            continue
+        if file_template.filename not in seen:
+            parts.append(_dependency_digest(file_template, seen))
+    if len(parts) == 1:
+        return digest
+    return hashlib.md5('\n'.join(parts).encode('utf8')).hexdigest()
+
+
+def split_names(vary):
+    '''Returns the request attribute names in a cache_vary value ("user.pk, LANGUAGE_CODE" or a list)'''
+    if isinstance(vary, str):
+        vary = vary.split(',')
+    return [ name.strip() for name in vary or () if name.strip() ]
+
+
+def request_attribute(request, name):
+    '''Returns a dotted attribute of the request, such as "user.pk", or None if it doesn't exist'''
+    value = request
+    for attr in name.split('.'):
+        value = getattr(value, attr, None)
+        if value is None:
+            return None
+    return value
+
+
+
+# the fragments of all templates
+FRAGMENT_CACHE = FragmentCache()
+
+mako.cache.register_plugin(CACHE_IMPL_NAME, __name__, 'DjangoCacheImpl')
@@ -1,5 +1,5 @@
 from django.apps import apps
-from django.utils.html import conditional_escape
+from django.utils.html import conditional_escape, escape
 from django.utils.encoding import force_text
 
 from mako.lexer import Lexer
@@ -7,6 +7,10 @@ from mako import parsetree, ast
 
 from ..util import log
 from ..tags import is_autoescape
+from .analysis import find_context_names, NAMES_VAR, FILES_VAR, DIGEST_VAR, AUTOESCAPE_VAR
+from .fragment_cache import CACHE_IMPL_NAME, source_digest
+
+import re
 
 
 ###########################################################
@@ -18,16 +22,44 @@ from ..tags import is_autoescape
 ###  Django autoescapes by default, while Mako does not.
 ###  DMP injects autoescaping to be consistent with Django.
 ###
+###  The final filter is chosen at compile time, so rendering
+###  an expression doesn't create any objects:
+###
+###     - With the `n` filter, or with the AUTOESCAPE option off,
+###       it's expression_text(), which only converts to text.
+###     - Otherwise, it's a local variable that each def, block,
+###       and call body sets when it starts, from whether
+###       autoescaping is on at that point (see expression_filter()).
+###       The <%dmp:autoescape_on/off> tags change the setting for
+###       their bodies, which are separate functions in Mako.
+###
 
 MAKO_ESCAPE_REPLACEMENTS = {
     'h': 'django.utils.html.escape',  # uses Django's escape rather than Mako's, which works better with marks
 }
 
+# the final filter of expressions that are never escaped
+TEXT_FILTER = 'django_mako_plus.expression_text'
+
+# the final filter of expressions that are escaped when autoescaping is on
+ESCAPE_FILTER = '_dmp_escape'
+
+# the code at the start of each def, block, and call body with escaped expressions
+ESCAPE_FILTER_CODE = ESCAPE_FILTER + ' = django_mako_plus.expression_filter(context)'
+
+# the parse tree nodes that Mako compiles into separate functions (aside from the template itself)
+SCOPE_NODES = ( parsetree.DefTag, parsetree.BlockTag, parsetree.CallTag, parsetree.CallNamespaceTag )
+
+# def and block names that template.get_def() can render without arguments
+RE_DEF_WITHOUT_ARGS = re.compile(r'^\s*(\w+)\s*\(\s*\)\s*$')
+RE_BLOCK_NAME = re.compile(r'^\s*(\w+)\s*$')
+
+
 class DMPLexer(Lexer):
     '''
     Subclass of Mako's Lexer, which is used during compilation of
-    templates.  This subclass injects ExpressionPostProcessor
-    as the final filter on every expression.  Overriding append_node()
+    templates.  This subclass injects a DMP filter as the final filter
+    on every expression.  Overriding append_node()
     is a hack, but it's the only way I can find to hook into Mako's
     compile process without modifying Mako directly.
     '''
@@ -42,34 +74,109 @@ class DMPLexer(Lexer):
             except Exception as e:
                 log.warning('An error occurred when compiling the filters on an expression; allowing through so Mako can handle it (%s)', e)
                 filters = []
-            extra = {}  # extra info sent to the expression processor
-
-            # if we have the 'n' filter, send that to the expression processor
-            if 'n' in filters:
-                extra['n_filter_on'] = True
-
-            # add the expression processor as the last filter to be run
-            # then recreate the args tuple
-            filters.append('django_mako_plus.ExpressionPostProcessor(self' + \
-                           (", extra={}".format(extra) if len(extra) > 0 else '') + \
-                           ')')
+            # add the final filter, then recreate the args tuple
+            # the 'n' filter turns off our normal html escaping
+            dmp = apps.get_app_config('django_mako_plus')
+            if 'n' in filters or not dmp.options['AUTOESCAPE']:
+                filters.append(TEXT_FILTER)
+            else:
+                filters.append(ESCAPE_FILTER)
             args = args[:1] + (','.join(filters),) + args[2:]
+
+        elif nodecls == parsetree.Tag and args[0] in ( 'def', 'block' ) and 'cached' in args[1]:
+            # tell the fragment cache the def name if it can render the def again in the background
+            dmp = apps.get_app_config('django_mako_plus')
+            if dmp.options['FRAGMENT_CACHE_IMPL'] == CACHE_IMPL_NAME and 'cache_def_name' not in args[1]:
+                match = None
+                if args[0] == 'def' and not self.tag:   # only top-level defs are in template.get_def()
+                    match = RE_DEF_WITHOUT_ARGS.match(args[1].get('name', ''))
+                elif args[0] == 'block' and 'args' not in args[1]:
+                    match = RE_BLOCK_NAME.match(args[1].get('name', ''))
+                if match is not None:
+                    args = ( args[0], dict(args[1], cache_def_name=match.group(1)) ) + args[2:]
         return super().append_node(nodecls, *args, **kwargs)
 
 
+    def parse(self):
+        '''
+        Parses the template, then adds module-level code with the names the template
+        reads from the context (see analysis.py), a digest of its source (for the
+        fragment cache), and the AUTOESCAPE option its filters were chosen with (the
+        loader compiles it again if the option changes).  This is compiled into the module,
+        so it's available when the template loads from the cache directory.
+        '''
+        template_node = super().parse()
+        names, files = find_context_names(template_node)
+        if names is not None:   # the escape filter is a local variable
+            names = tuple(name for name in names if name != ESCAPE_FILTER)
+        self.add_escape_filter(template_node)
+        dmp = apps.get_app_config('django_mako_plus')
+        code = '{} = {!r}\n{} = {!r}\n{} = {!r}\n{} = {!r}\n'.format(
+            NAMES_VAR, names,
+            FILES_VAR, files,
+            DIGEST_VAR, source_digest(self.text),
+            AUTOESCAPE_VAR, bool(dmp.options['AUTOESCAPE']),
+        )
+        template_node.nodes.insert(0, parsetree.Code(code, True, source=self.text, lineno=1, pos=0, filename=self.filename))
+        return template_node
+
+
+    def add_escape_filter(self, scope):
+        '''
+        Sets the escape filter at the start of the template, def, block, or call body (scope)
+        if it has expressions that use it.  Nested scopes get their own.
+        '''
+        escaped = False
+        stack = list(scope.nodes)
+        while stack:
+            node = stack.pop()
+            if isinstance(node, SCOPE_NODES):
+                self.add_escape_filter(node)
+            elif isinstance(node, parsetree.Expression):
+                escaped = escaped or ESCAPE_FILTER in node.escapes_code.args
+            elif isinstance(node, parsetree.Tag):   # such as a namespace with defs inside
+                stack.extend(node.nodes)
+        if escaped:
+            lineno = getattr(scope, 'lineno', 1)
+            pos = getattr(scope, 'pos', 0)
+            scope.nodes.insert(0, parsetree.Code(ESCAPE_FILTER_CODE, False, source=self.text, lineno=lineno, pos=pos, filename=self.filename))
+
+
 # this is used read-only, so it can be in __init__ signature
 EMPTY_DICT = {}
 
+def expression_text(value):
+    '''The final filter on expressions that aren't escaped: converts the value to text'''
+    # DMP always creates unicode (see adapter.py where render_unicode() is used)
+    return force_text(value)
+
+
+# the replacements Django's escape() makes, for escaping plain strings without its wrappers
+HTML_ESCAPES = { ord(c): str(escape(c)) for c in '&<>"\'' }
+
+def escape_expression(value):
+    '''The final filter on expressions when autoescaping is on'''
+    if type(value) is str:  # not a SafeText or other subclass
+        return value.translate(HTML_ESCAPES)
+    return conditional_escape(force_text(value))  # internally, this honors mark_safe()
+
+
+def expression_filter(context):
+    '''
+    Returns the final filter for the escaped expressions of a def, block, or call body:
+    escape_expression() if autoescaping is on, otherwise expression_text().
+    '''
+    return escape_expression if is_autoescape(context) else expression_text
+
+
+
 class ExpressionPostProcessor(object):
     '''
     Object that is called as the final filter on every template
-    expression ${...}.
-
-    Right now this object does autoescaping. However, it is placed
-    on *every* expression so we have a hook for future post-processing
-    of expressions.
+    expression ${...} in templates compiled by earlier versions of DMP.
+    Templates compiled now use the filters above.
 
-    See the creation of this object in DMPLexer above for more info.
+    Right now this object does autoescaping.
     '''
     def __init__(self, tself, extra=EMPTY_DICT):
         # check whether it's on for this block
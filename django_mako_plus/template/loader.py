@@ -6,27 +6,122 @@ from mako.exceptions import CompileException, SyntaxException, TemplateLookupExc
 from mako.lookup import TemplateLookup
 from mako.template import Template
 
+from .analysis import AUTOESCAPE_VAR
 from .lexer import DMPLexer
 from .adapter import MakoTemplateAdapter
+from .registry import TEMPLATE_REGISTRY, RegistryCollection
+from ..usage import USAGE_PROFILE, profile_path
+from ..util import FileLock, log, write_file_atomic
+from ..watcher import FILE_WATCHER
 
 import os
 import os.path
+import zlib
+
+
+# compiles lock one of this many files in each cache directory, chosen by the template's path
+# (one lock per template would leave a lock file next to every compiled module)
+COMPILE_LOCK_STRIPES = 8
 
 
 class DMPTemplateLookup(TemplateLookup):
-    '''Small extension to Mako's template lookup to provide a link back to the MakoTemplateLoader'''
-    def __init__(self, template_loader, *args, **kwargs):
+    '''
+    Small extension to Mako's template lookup to provide a link back to the MakoTemplateLoader.
+    Unless registry is None, templates are shared with other lookups through the process-wide
+    registry (see registry.py).
+    '''
+    def __init__(self, template_loader, *args, registry=TEMPLATE_REGISTRY, **kwargs):
         super(DMPTemplateLookup, self).__init__(*args, **kwargs)
         self.template_loader = template_loader
+        self.registry = registry
+        if self.registry is not None:
+            self._collection = RegistryCollection(self.registry, self)
+        self.profile_dir = profile_path(template_loader.template_dir)
+
+
+    def is_checked(self, filename):
+        '''Returns True if the template file is checked on disk for changes'''
+        # the file watcher discards changed templates from the registry (see watcher.py), so the
+        # templates in its directories aren't checked.  Templates elsewhere, such as in a
+        # get_template_loader_for_path() directory, still are.
+        return self.filesystem_checks and not (self.registry is not None and FILE_WATCHER.is_watched(filename))
+
+
+    def _check(self, uri, template):
+        '''Overrides Mako's (private) method to skip the check for templates the file watcher covers'''
+        if not self.is_checked(template.filename):
+            return template
+        return super()._check(uri, template)
+
+
+    def get_template(self, uri):
+        '''Overrides Mako's method to record usage. Mako calls this for inherit, include, and namespace tags as well.'''
+        template = super().get_template(uri)
+        if USAGE_PROFILE.enabled and self.registry is not None:
+            USAGE_PROFILE.record('template', self.profile_dir, uri)
+        return template
+
+
+    def _load(self, filename, uri):
+        '''Overrides Mako's (private) load method to share templates and to wrap compilation in a file lock'''
+        if self.registry is None:
+            return self._load_locked(filename, uri)
+        # another lookup might already have this file.  The registry bounds the cache size, and
+        # it binds templates another lookup loaded first to this lookup, so their paths resolve
+        # through this lookup's directories.
+        template = self.registry.get(filename, self.is_checked(filename), duplicate=True, lookup=self)
+        if template is not None:
+            self._collection[uri] = template
+            return template
+        # Mako adds the new template to our collection (and so to the registry)
+        return self._load_locked(filename, uri)
+
+
+    def _load_locked(self, filename, uri):
+        '''Loads (compiling if needed) the template while holding the file lock for its module'''
+        # compiling is single-flight across processes: only one process (e.g. one of many gunicorn
+        # workers starting at once) compiles a template, and the others wait on the lock and then
+        # load the module it wrote.  Templates share a few lock files (COMPILE_LOCK_STRIPES), so
+        # the cache directory holds a fixed number of them.
+        # this mirrors the module path that Mako's Template constructor calculates
+        u_norm = os.path.normpath(uri[1:] if uri.startswith('/') else uri)
+        if self.module_directory is None or u_norm.startswith('..'):
+            return super()._load(filename, uri)
+        module_dir = os.path.abspath(os.path.normpath(self.module_directory))
+        module_path = os.path.join(module_dir, u_norm + '.py')
+        os.makedirs(os.path.dirname(module_path), exist_ok=True)
+        stripe = zlib.crc32(u_norm.encode('utf8')) % COMPILE_LOCK_STRIPES
+        with FileLock(os.path.join(module_dir, '.compile-{}.lock'.format(stripe))):
+            template = super()._load(filename, uri)
+            # escaping is chosen at compile time, so a module compiled with the other AUTOESCAPE
+            # setting (or by a version of DMP that didn't record it) is compiled again
+            dmp = apps.get_app_config('django_mako_plus')
+            if getattr(template.module, AUTOESCAPE_VAR, None) is not bool(dmp.options['AUTOESCAPE']):
+                log.info('compiling %s again because its cached module has a different AUTOESCAPE setting', filename)
+                self._collection.pop(uri, None)
+                os.remove(module_path)
+                template = super()._load(filename, uri)
+            return template
+
+
+def write_module(source, outputpath):
+    '''
+    Writes a compiled template module (used as Mako's module_writer).  The module is
+    renamed into place so other processes never import a half-written file.
+    '''
+    write_file_atomic(outputpath, source)
 
 
 class MakoTemplateLoader(object):
     '''Finds Mako templates for a Django app.'''
-    def __init__(self, app_path, template_subdir='templates'):
+    def __init__(self, app_path, template_subdir='templates', use_registry=True):
         '''
         The loader looks in the app_path/templates directory unless
         the template_subdir parameter overrides this default.
 
+        Unless use_registry is False, templates are shared with the other
+        loaders through the process-wide template registry.
+
         You should not normally create this object because it bypasses
         the DMP cache.  Instead, call get_template_loader() or
         get_template_loader_for_path().
@@ -54,16 +149,22 @@ class MakoTemplateLoader(object):
         self.template_search_dirs.append(settings.BASE_DIR)
 
         # create the actual Mako TemplateLookup, which does the actual work
+        # (a FRAGMENT_CACHE_IMPL of None leaves fragment caching to Mako's default, Beaker)
+        cache_impl = dmp.options['FRAGMENT_CACHE_IMPL']
         self.tlookup = DMPTemplateLookup(
             template_loader=self,
             directories=self.template_search_dirs,
             imports=dmp.template_imports,
             module_directory=self.cache_root,
-            collection_size=2000,
+            module_writer=write_module,
+            collection_size=-1 if use_registry else (dmp.options['TEMPLATES_CACHE_SIZE'] or -1),
             filesystem_checks=settings.DEBUG,
             input_encoding=dmp.options['DEFAULT_TEMPLATE_ENCODING'],
             default_filters=[],  # shouldn't be None because that causes Mako to add an html filter and override DMP's html_filter
             lexer_cls=DMPLexer,
+            cache_impl=cache_impl or 'beaker',
+            cache_args=dict(dmp.options['FRAGMENT_CACHE_ARGS']) if cache_impl is not None else None,
+            registry=TEMPLATE_REGISTRY if use_registry else None,
         )
 
 
@@ -77,6 +178,8 @@ class MakoTemplateLoader(object):
            This method corresponds to the Django templating system API.
            A Django exception is raised if the template is not found or cannot compile.
         '''
+        if def_name is not None and USAGE_PROFILE.enabled:
+            USAGE_PROFILE.record('def', self.tlookup.profile_dir, template, def_name)
         try:
             # wrap the mako template in an adapter that gives the Django template API
             return MakoTemplateAdapter(self.get_mako_template(template), def_name)
@@ -0,0 +1,150 @@
+from django.apps import apps
+from django.db import close_old_connections
+
+from ..util import log, with_thread_state
+
+import concurrent.futures
+import itertools
+import re
+import threading
+
+
+#########################################################
+###   Parallel rendering of independent defs
+###
+###   Dashboard-style pages often have several sections that each wait
+###   on their own I/O (queries, API calls).  Rendered one after another,
+###   the page takes the sum of their times.
+###
+###   Inside <%dmp:parallel>, each <%dmp:task name="..."/> starts rendering
+###   the named <%def> in a shared, bounded thread pool and leaves a marker
+###   in the output.  When the parallel body is done, the markers are replaced
+###   with the rendered defs (waiting on each), so the output is in document
+###   order and the page takes about as long as the slowest def.
+###
+###   Mako's runtime context is shared by everything in a render, so the defs
+###   can't run inside it.  Each def is rendered separately instead, with a copy
+###   of the data the template was rendered with (context.kwargs), as if by
+###   template.get_def(name).render().  Defs see those variables and their own
+###   arguments, but not local variables of the calling template.
+
+
+# marks where a task's output goes: \x02dmp-parallel:<number>\x03
+MARKER = '\x02dmp-parallel:{}\x03'
+RE_MARKER = re.compile('\x02dmp-parallel:(\\d+)\x03')
+
+# attribute on Mako's caller_stack (one object per render) that holds the current ParallelRun
+PARALLEL_KEY = '__dmp_parallel'
+
+
+class ParallelRun(object):
+    '''The tasks started by one <%dmp:parallel> tag'''
+    def __init__(self):
+        self.futures = []
+
+
+    def submit(self, def_template, data):
+        '''Starts rendering a def in the pool. Returns the marker to write in its place.'''
+        self.futures.append(PARALLEL_POOL.submit(def_template, data))
+        return MARKER.format(len(self.futures) - 1)
+
+
+    def stitch(self, content):
+        '''Returns the content with each marker replaced by its def's output (waiting as needed)'''
+        return RE_MARKER.sub(lambda match: self.futures[int(match.group(1))].result(), content)
+
+
+    def cancel(self):
+        '''Cancels the tasks that haven't started'''
+        for future in self.futures:
+            future.cancel()
+
+
+
+class ParallelPool(object):
+    '''
+    The thread pool shared by all parallel tags.  It's created on first use,
+    with PARALLEL_MAX_WORKERS threads.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.local = threading.local()
+
+
+    def submit(self, def_template, data):
+        '''Renders the def in a worker thread. Returns a Future of its output.'''
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    dmp = apps.get_app_config('django_mako_plus')
+                    self.executor = concurrent.futures.ThreadPoolExecutor(dmp.options['PARALLEL_MAX_WORKERS'], thread_name_prefix='dmp-parallel')
+        return self.executor.submit(with_thread_state(self.render), def_template, data)
+
+
+    def render(self, def_template, data):
+        '''Renders a def (runs in a worker thread)'''
+        self.local.active = True
+        try:
+            return def_template.render_unicode(**data)
+        finally:
+            self.local.active = False
+            # like the end of a request: close connections that are too old or broken
+            close_old_connections()
+
+
+    def in_worker(self):
+        '''Returns True when called from a pool thread, where tasks render inline (waiting on the pool could deadlock)'''
+        return getattr(self.local, 'active', False)
+
+
+
+def find_def(context, name):
+    '''
+    Returns the DefTemplate for the named <%def>, looking in the current
+    template and then up the inheritance chain (like self.name() would).
+    '''
+    for ns in itertools.chain(( context.get('local'), ), iter_inheritance(context.get('self'))):
+        if ns is not None and ns.template is not None and ns.template.has_def(name):
+            return ns.template.get_def(name)
+    raise AttributeError('<%dmp:task> could not find a def named "{}"'.format(name))
+
+
+def iter_inheritance(ns):
+    '''Iterates a `self` namespace and the ones it inherits from'''
+    while ns is not None:
+        yield ns
+        ns = ns.inherits
+
+
+def start_parallel(context):
+    '''Starts collecting tasks for a <%dmp:parallel> tag. Returns ( run, previous run ).'''
+    previous = getattr(context.caller_stack, PARALLEL_KEY, None)
+    run = ParallelRun()
+    setattr(context.caller_stack, PARALLEL_KEY, run)
+    return run, previous
+
+
+def end_parallel(context, previous):
+    '''Stops collecting tasks for a <%dmp:parallel> tag'''
+    setattr(context.caller_stack, PARALLEL_KEY, previous)
+
+
+def render_task(context, name, kwargs):
+    '''
+    Renders the named def for a <%dmp:task> tag: in the pool when inside <%dmp:parallel>
+    (returning a marker), otherwise right here (returning its output).
+    '''
+    def_template = find_def(context, name)
+    data = context.kwargs
+    data.update(kwargs)
+    run = getattr(context.caller_stack, PARALLEL_KEY, None)
+    if run is None or PARALLEL_POOL.in_worker():
+        log.debug('rendering task %s inline', name)
+        return def_template.render_unicode(**data)
+    return run.submit(def_template, data)
+
+
+
+# the pool for parallel tags
+PARALLEL_POOL = ParallelPool()
@@ -0,0 +1,258 @@
+from ..util import log
+
+from collections import OrderedDict
+import copy
+import logging
+import os
+import os.path
+import threading
+
+
+# A loaded template takes roughly four times the size of its compiled module
+# source in memory (code objects, module dict, Mako's Template and ModuleInfo).
+# This is only an estimate, but it's cheap and stable enough to budget with.
+MEMORY_PER_SOURCE_BYTE = 4
+
+
+class TemplateRegistry(object):
+    '''
+    A process-wide, least-recently-used cache of Mako templates, keyed by absolute filename.
+
+    DMP creates a template lookup for each app and subdir (templates, scripts, styles).
+    Shared templates, such as a base template inherited through `/homepage/templates/base.htm`,
+    are reachable from many lookups.  Every lookup stores its templates here (see RegistryCollection),
+    so each file is compiled and held in memory once per process, no matter how many lookups reach it.
+
+    Mako resolves <%inherit>, <%include>, and <%namespace> paths through the lookup of the
+    template being rendered, and lookups search different directories.  So every other lookup
+    that reaches a shared template gets its own bound copy of it (see bind_template), which
+    shares the compiled module but links back to that lookup.  The copies go with the template
+    when it is discarded or evicted.
+
+    The cache is bounded by number of templates and/or estimated memory (see the
+    TEMPLATES_CACHE_SIZE and TEMPLATES_CACHE_MEMORY options).  When a template is
+    evicted, the provider instances attached to it are cleared as well.
+    '''
+    def __init__(self, max_templates=None, max_memory=None):
+        self.lock = threading.RLock()
+        self.templates = OrderedDict()  # filename -> ( template, estimated memory )
+        self.bound = {}                 # filename -> { lookup: copy of the template bound to the lookup }
+        self.memory = 0
+        self.reset_stats()
+        self.configure(max_templates, max_memory)
+
+
+    def configure(self, max_templates=None, max_memory=None):
+        '''Sets the budget of the cache. None (or a value <= 0) means unbounded.'''
+        with self.lock:
+            self.max_templates = max_templates if max_templates is not None and max_templates > 0 else None
+            self.max_memory = max_memory if max_memory is not None and max_memory > 0 else None
+            self._evict()
+
+
+    def reset_stats(self):
+        '''Resets the counters'''
+        with self.lock:
+            # number of requests for a template that was already in memory
+            self.hits = 0
+            # number of templates loaded (compiled or read from the cache dir)
+            self.misses = 0
+            # number of loads avoided because another lookup had already loaded the template
+            self.duplicates = 0
+            # number of templates removed to stay within the budget
+            self.evictions = 0
+
+
+    def __len__(self):
+        return len(self.templates)
+
+
+    def __contains__(self, filename):
+        return os.path.abspath(filename) in self.templates
+
+
+    def get(self, filename, filesystem_checks=False, duplicate=False, lookup=None):
+        '''
+        Returns the template for the given filename, or None if it isn't in the cache.
+        If filesystem_checks is True, None is also returned when the file is newer
+        than the template.  Set duplicate=True when the caller is a lookup that hasn't
+        seen this template before (so a hit is a duplicate load avoided).  When lookup
+        is given, the template is bound to it.
+        '''
+        key = os.path.abspath(filename)
+        with self.lock:
+            try:
+                template, size = self.templates[key]
+            except KeyError:
+                return None
+            if filesystem_checks:
+                try:
+                    if template.module._modified_time < os.stat(key).st_mtime:
+                        return None
+                except OSError:
+                    return None
+            self.templates.move_to_end(key)
+            self.hits += 1
+            if duplicate:
+                self.duplicates += 1
+            if lookup is not None and template.lookup is not lookup:
+                bound = self.bound.setdefault(key, {})
+                try:
+                    template = bound[lookup]
+                except KeyError:
+                    template = bound[lookup] = bind_template(template, lookup)
+        if duplicate and log.isEnabledFor(logging.DEBUG):
+            log.debug('template registry reused %s (%s duplicate loads avoided)', key, self.duplicates)
+        return template
+
+
+    def register(self, filename, template):
+        '''Adds a newly-loaded template to the cache, evicting others if over budget'''
+        key = os.path.abspath(filename)
+        with self.lock:
+            current = self.templates.get(key)
+            # a bound copy shares the module of the registered template
+            if current is not None and current[0].module is template.module:
+                self.templates.move_to_end(key)
+                return
+            if current is not None:
+                self.memory -= current[1]
+                self.bound.pop(key, None)
+            size = self.estimate_memory(template)
+            self.templates[key] = ( template, size )
+            self.memory += size
+            self.misses += 1
+            self._evict()
+
+
+    def discard(self, filename):
+        '''Removes the template for the given filename, if it exists'''
+        with self.lock:
+            current = self.templates.pop(os.path.abspath(filename), None)
+            self.bound.pop(os.path.abspath(filename), None)
+            if current is not None:
+                self.memory -= current[1]
+                self.clear_providers(current[0])
+
+
+    def file_changed(self, filename):
+        '''Discards the template for a changed file (a file watcher listener)'''
+        if filename in self:
+            self.discard(filename)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('template registry discarded %s because it changed', filename)
+
+
+    def clear(self):
+        '''Removes all templates and resets the counters'''
+        with self.lock:
+            for template, size in self.templates.values():
+                self.clear_providers(template)
+            self.templates.clear()
+            self.bound.clear()
+            self.memory = 0
+            self.reset_stats()
+
+
+    def stats(self):
+        '''Returns a dictionary of cache statistics'''
+        with self.lock:
+            return {
+                'templates': len(self.templates),
+                'memory': self.memory,
+                'max_templates': self.max_templates,
+                'max_memory': self.max_memory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'duplicates': self.duplicates,
+                'evictions': self.evictions,
+            }
+
+
+    def estimate_memory(self, template):
+        '''Returns the estimated memory, in bytes, that a template uses'''
+        try:
+            return os.path.getsize(template.module.__file__) * MEMORY_PER_SOURCE_BYTE
+        except (AttributeError, TypeError, OSError):
+            return len(getattr(template, '_code', None) or '') * MEMORY_PER_SOURCE_BYTE
+
+
+    def clear_providers(self, template):
+        '''Removes the provider instances cached on a template'''
+        from ..provider.base import TEMPLATE_ATTR_NAME
+        template.__dict__.pop(TEMPLATE_ATTR_NAME, None)
+
+
+    def _evict(self):
+        '''Removes least-recently-used templates until we're within budget (the newest always stays)'''
+        while len(self.templates) > 1 and (
+                  (self.max_templates is not None and len(self.templates) > self.max_templates) or
+                  (self.max_memory is not None and self.memory > self.max_memory)):
+            key, ( template, size ) = self.templates.popitem(last=False)
+            self.bound.pop(key, None)
+            self.memory -= size
+            self.evictions += 1
+            self.clear_providers(template)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('template registry evicted %s (%s evictions)', key, self.evictions)
+
+
+
+def bind_template(template, lookup):
+    '''
+    Returns a copy of a shared template that uses the given lookup.  The copy shares the
+    compiled module.  Attributes that DMP and Mako cache on the template (such as the
+    providers and the names reachable through its files) are left for the copy to compute.
+    '''
+    bound = copy.copy(template)
+    for name in list(bound.__dict__):
+        if name == 'cache' or name.startswith(( 'dmp_', '_dmp_' )):
+            del bound.__dict__[name]
+    bound.lookup = lookup
+    return bound
+
+
+
+class RegistryCollection(object):
+    '''
+    Stands in for the template collection of a Mako TemplateLookup (its `_collection`
+    dict) so the lookup stores its templates in the registry.  This object only maps
+    the lookup's uris to filenames.  A uri whose template was evicted from the
+    registry is a KeyError, just like a template that was never loaded.
+    '''
+    def __init__(self, registry, lookup=None):
+        self.registry = registry
+        self.lookup = lookup
+        self.filenames = {}
+
+    def __getitem__(self, uri):
+        template = self.registry.get(self.filenames[uri], lookup=self.lookup)
+        if template is None:
+            raise KeyError(uri)
+        return template
+
+    def __setitem__(self, uri, template):
+        self.filenames[uri] = template.filename
+        self.registry.register(template.filename, template)
+
+    def __contains__(self, uri):
+        return uri in self.filenames and self.filenames[uri] in self.registry
+
+    def get(self, uri, default=None):
+        try:
+            return self[uri]
+        except KeyError:
+            return default
+
+    def pop(self, uri, default=None):
+        # templates stay in the registry because other lookups might be using them.
+        # stale templates are replaced when the new version is registered.
+        filename = self.filenames.pop(uri, None)
+        current = self.registry.templates.get(os.path.abspath(filename)) if filename is not None else None
+        return current[0] if current is not None else default
+
+
+
+# the registry used by all DMP template lookups
+# (the budget is set in apps.py from the TEMPLATES_CACHE_SIZE and TEMPLATES_CACHE_MEMORY options)
+TEMPLATE_REGISTRY = TemplateRegistry()
@@ -0,0 +1,243 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+import mako.runtime
+
+from ..util import log, with_thread_state
+from .util import get_template_debug_info
+
+import queue
+import threading
+
+
+#########################################################
+###   Streaming template output
+###
+###   render_to_response() builds the whole page with render_unicode() and
+###   then encodes it into a second full copy.  With large pages, that's two
+###   big strings per request, and the browser waits for all of it.
+###
+###   In streaming mode, the template writes into a buffer that encodes and
+###   hands off a chunk every STREAM_CHUNK_SIZE characters.  The chunks are
+###   sent to the browser (through a StreamingHttpResponse) while the template
+###   is still running.
+###
+###   Mako renders in one synchronous call, so the template runs in a worker
+###   thread that passes chunks to the response through a small queue.  When
+###   the queue is full (the client is reading slower than the template writes),
+###   the template waits -- so only a few chunks are ever in memory.
+###
+###   The worker thread has its own database connection, so its queries would run
+###   outside a transaction the view is in.  When a connection is in an atomic block,
+###   or when STREAM_MAX_THREADS streams are already running, the page is rendered
+###   in the request thread as a single chunk instead (see reserve_thread()).
+###
+###   With early flush, the buffer also sends a chunk right after the template
+###   writes </head>.  The head (with the css/js links from django_mako_plus.links())
+###   reaches the browser while the body is still rendering, so the browser fetches
+###   the static files in parallel with the server's work.  Templates can send what
+###   they have at other points with ${ django_mako_plus.flush(self) }.
+
+
+# the number of encoded chunks that can wait in the queue
+MAX_QUEUED_CHUNKS = 4
+
+# seconds between checks for a closed response while the queue is full
+PUT_INTERVAL = 0.1
+
+# early flush sends a chunk when the template writes this
+END_OF_HEAD = '</head>'
+
+
+class TemplateStream(object):
+    '''
+    An iterator of the encoded (bytes) chunks of a template render.
+    Created by MakoTemplateAdapter.stream().
+
+    The worker thread runs with the caller's active language, time zone, and
+    context variables.  Database queries in the template (such as lazy querysets)
+    use the worker thread's own connection, so streams only start outside of
+    transactions (see reserve_thread()).
+    '''
+    # the number of worker threads that are running (limited by the STREAM_MAX_THREADS option)
+    running = 0
+    running_lock = threading.Lock()
+
+    def __init__(self, render_obj, context_dict, charset, chunk_size, early_flush=False):
+        self.render_obj = render_obj
+        self.context_dict = context_dict
+        self.charset = charset
+        self.chunk_size = chunk_size
+        self.early_flush = early_flush
+        self.queue = queue.Queue(MAX_QUEUED_CHUNKS)
+        self.closed = False
+        self.first = None
+        self.thread = None
+
+
+    @classmethod
+    def reserve_thread(cls):
+        '''
+        Returns True, and counts a worker thread, if a stream can start: no database connection
+        is in an atomic block, and fewer than STREAM_MAX_THREADS streams are running.  start()
+        must be called after this returns True, since the thread releases the count when it ends.
+        '''
+        if any(( conn.in_atomic_block for conn in connections.all() )):
+            log.info('rendering a streamed template in one chunk because a database transaction is active')
+            return False
+        dmp = apps.get_app_config('django_mako_plus')
+        limit = dmp.options['STREAM_MAX_THREADS']
+        with cls.running_lock:
+            if limit is not None and cls.running >= limit:
+                log.info('rendering a streamed template in one chunk because %s streams are running', cls.running)
+                return False
+            cls.running += 1
+        return True
+
+
+    def start(self):
+        '''
+        Starts the template in the worker thread and waits for the first chunk.
+        Exceptions raised before the first chunk (such as a RedirectException at the
+        top of a template) are raised here, so they're handled like a normal render.
+        '''
+        self.thread = threading.Thread(target=with_thread_state(self.run), name='dmp-template-stream', daemon=True)
+        self.thread.start()
+        self.first = self.queue.get()
+        if isinstance(self.first, StreamError):
+            self.closed = True
+            raise self.first.exception
+        return self
+
+
+    def run(self):
+        '''Renders the template (runs in the worker thread)'''
+        try:
+            buf = StreamBuffer(self)
+            context = mako.runtime.Context(buf, **self.context_dict)
+            context._outputting_as_unicode = True
+            context._set_with_template(self.render_obj)
+            callable_ = self.render_obj.callable_
+            mako.runtime._render_context(self.render_obj, callable_, context, **mako.runtime._kwargs_for_callable(callable_, self.context_dict))
+            buf.flush()
+            self.put(END_OF_STREAM)
+        except StreamClosed:
+            log.info('template stream closed by the client before the template finished')
+        except Exception as e:
+            if settings.DEBUG:
+                e.template_debug = get_template_debug_info(e)
+                log.exception('exception raised during template rendering: %s', e)  # to the console
+            try:
+                self.put(StreamError(e))
+            except StreamClosed:
+                pass
+        finally:
+            # connections are per-thread, so this thread's connection is done
+            connections.close_all()
+            with self.running_lock:
+                TemplateStream.running -= 1
+
+
+    def put(self, item):
+        '''Adds a chunk to the queue, waiting while it is full. Raises StreamClosed if the response was closed.'''
+        while True:
+            if self.closed:
+                raise StreamClosed()
+            try:
+                self.queue.put(item, timeout=PUT_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+
+    def __iter__(self):
+        try:
+            item = self.first
+            while item is not END_OF_STREAM:
+                if isinstance(item, StreamError):
+                    raise item.exception
+                yield item
+                item = self.queue.get()
+        finally:
+            self.closed = True
+
+
+    def close(self):
+        '''Stops the template if it's still running (called when the response is closed)'''
+        self.closed = True
+
+
+
+class StreamBuffer(object):
+    '''
+    A Mako output buffer that sends an encoded chunk to the stream every chunk_size
+    characters (and after </head> with early flush)
+    '''
+    def __init__(self, stream):
+        self.stream = stream
+        self.data = []
+        self.size = 0
+        self.flush_after = END_OF_HEAD if stream.early_flush else None
+        # the end of the text written so far, since flush_after can be split across writes
+        self.tail = ''
+
+
+    def write(self, text):
+        if self.flush_after is not None:
+            tail = self.tail + text
+            i = tail.find(self.flush_after)
+            if i >= 0:
+                # the head goes out by itself
+                i += len(self.flush_after) - len(self.tail)
+                self.flush_after = None
+                self.data.append(text[:i])
+                self.flush()
+                text = text[i:]
+            else:
+                self.tail = tail[-(len(self.flush_after) - 1):]
+        self.data.append(text)
+        self.size += len(text)
+        if self.size >= self.stream.chunk_size:
+            self.flush()
+
+
+    def flush(self):
+        '''Sends the buffered text to the stream'''
+        if self.data:
+            chunk = ''.join(self.data).encode(self.stream.charset)
+            self.data = []
+            self.size = 0
+            self.stream.put(chunk)
+
+
+    def getvalue(self):
+        return ''.join(self.data)
+
+
+
+def flush(tself):
+    '''
+    Sends what the template has written so far to the browser, if the template
+    is being streamed.  Otherwise, it does nothing.  Call it from a template:
+
+        ${ django_mako_plus.flush(self) }
+    '''
+    buf = tself.context._buffer_stack[0]
+    if isinstance(buf, StreamBuffer):
+        buf.flush()
+    return ''
+
+
+
+class StreamError(object):
+    '''Carries an exception from the worker thread to the response iterator'''
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class StreamClosed(Exception):
+    '''Raised in the worker thread to stop the template when the response is closed'''
+
+
+# marks the end of the chunks
+END_OF_STREAM = object()
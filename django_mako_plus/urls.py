@@ -5,7 +5,7 @@ try:
 except ImportError:
     from django.conf.urls import url as re_path  # Django 1.x
 from django.views.static import serve
-from .router import app_resolver
+from .router import app_resolver, dispatch_resolver
 import os, os.path
 
 
@@ -30,15 +30,25 @@ urlpatterns.append(re_path(
     name='DMP webroot (for devel)',
 ))
 
-# add a DMP-style resolver for each app in the project directory
-for config in apps.get_app_configs():
-    if os.path.samefile(os.path.dirname(config.path), settings.BASE_DIR):
-        urlpatterns.append(app_resolver(config.name))
+# the apps in the project directory
+project_apps = [ config.name for config in apps.get_app_configs() if os.path.samefile(os.path.dirname(config.path), settings.BASE_DIR) ]
 
-# add a DMP-style resolver for the default app
+# does the default app exist?
+default_app = False
 if dmp.options['DEFAULT_APP']:
     try:
         apps.get_app_config(dmp.options['DEFAULT_APP'])
-        urlpatterns.append(app_resolver())
+        default_app = True
     except LookupError:
         pass  # the default app in dmp's TEMPLATES entry isn't an installed app, so skip it
+
+if dmp.options['DISPATCH_TABLE']:
+    # one pattern for all apps
+    urlpatterns.append(dispatch_resolver(project_apps, default_app))
+else:
+    # add a DMP-style resolver for each app in the project directory
+    for app_name in project_apps:
+        urlpatterns.append(app_resolver(app_name))
+    # add a DMP-style resolver for the default app
+    if default_app:
+        urlpatterns.append(app_resolver())
@@ -0,0 +1,188 @@
+from django.conf import settings
+
+from .util import FileLock, write_file_atomic, log
+
+import atexit
+import collections
+import json
+import os, os.path
+import threading
+import time
+
+
+#########################################################
+###   Usage profile
+###
+###   Records the templates, defs, and view functions that each process
+###   actually serves, with hit counts.  The counts are merged into a
+###   JSON file periodically, so the workers of a server build one shared
+###   profile.  The warmup (see warmup.py) can preload just the hottest
+###   entries of the profile rather than everything in the project.
+###
+###   Recording is on the request path, so each thread counts into its own
+###   Counter without a lock.  A background thread (and atexit) collects the
+###   counters and writes the file.  A hit recorded while its counter is being
+###   collected can be lost, which doesn't matter for a heat profile.
+###
+###   Entries are identified by a kind and a key (a tuple of strings):
+###
+###       ( 'template', template dir relative to BASE_DIR, template uri )
+###       ( 'def',      template dir relative to BASE_DIR, template name, def name )
+###       ( 'view',     module name, function name, fallback app, fallback template )
+
+PROFILE_VERSION = 1
+
+
+class UsageProfile(object):
+    '''
+    Collects hit counts in memory and merges them into the profile file.
+    The hits since the last save are added to the file, under a lock, so any
+    number of processes can share a file.
+
+    The DMP loaders and router call record() only when `enabled` is True,
+    so this costs nothing when the USAGE_PROFILE option is not set.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counters = []          # the Counter of each thread that recorded since the last save
+        self.generation = 0         # increases with each save, so threads start new counters
+        self.filename = None
+        self.interval = None
+        self.enabled = False
+        self.thread = None
+        self.stop_event = threading.Event()
+        self._atexit = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+
+    def configure(self, filename=None, interval=60):
+        '''
+        Starts recording to the given filename (None stops recording).
+        Hits are saved every `interval` seconds in a background thread (None saves only at exit).
+        '''
+        self.stop()
+        with self.lock:
+            self.filename = filename
+            self.interval = interval
+            self.counters = []
+            self.generation += 1
+            self.enabled = filename is not None
+        if self.enabled and not self._atexit:
+            atexit.register(self.save)
+            self._atexit = True
+        self.start()
+
+
+    def start(self):
+        '''Starts the thread that saves every `interval` seconds (if recording with an interval)'''
+        with self.lock:
+            if not self.enabled or self.interval is None or self.thread is not None:
+                return
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='dmp-usage-profile', daemon=True)
+            self.thread.start()
+
+
+    def stop(self):
+        '''Stops the saving thread'''
+        with self.lock:
+            self.stop_event.set()
+            thread, self.thread = self.thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+    def run(self):
+        '''Saving loop (runs in the background thread)'''
+        while not self.stop_event.wait(self.interval):
+            self.save()
+
+
+    def _after_fork(self):
+        '''In a forked worker, drops the parent's counts (the parent saves those) and restarts the saving thread'''
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.counters = []
+        self.thread = None
+        self.start()
+
+
+    def record(self, kind, *key):
+        '''Adds a hit for the given entry (in the current thread's counter)'''
+        local = self.local
+        if getattr(local, 'generation', None) != self.generation:
+            local.counter = collections.Counter()
+            local.generation = self.generation
+            with self.lock:
+                self.counters.append(local.counter)
+        local.counter[( kind, ) + key] += 1
+
+
+    def save(self):
+        '''Merges the hits since the last save into the profile file'''
+        with self.lock:
+            if self.filename is None or len(self.counters) == 0:
+                return
+            filename = self.filename
+            counters, self.counters = self.counters, []
+            self.generation += 1
+        pending = collections.Counter()
+        for counter in counters:
+            pending.update(counter)
+        if len(pending) == 0:
+            return
+        try:
+            with FileLock(filename + '.lock'):
+                counts = collections.Counter(self.read_counts(filename))
+                counts.update(pending)
+                write_file_atomic(filename, json.dumps({
+                    'version': PROFILE_VERSION,
+                    'saved': time.time(),
+                    'entries': [
+                        { 'kind': entry[0], 'key': entry[1:], 'hits': hits }
+                        for entry, hits in counts.most_common()
+                    ],
+                }, indent=1))
+        except OSError as e:
+            log.warning('could not save the usage profile to %s: %s', filename, e)
+
+
+    def read_counts(self, filename):
+        '''Returns a dict of ( kind, *key ) -> hits from the given profile file (empty if missing or invalid)'''
+        try:
+            with open(filename) as fin:
+                data = json.load(fin)
+            if data.get('version') != PROFILE_VERSION:
+                return {}
+            return { ( entry['kind'], ) + tuple(entry['key']): entry['hits'] for entry in data['entries'] }
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            log.warning('ignoring invalid usage profile %s: %s', filename, e)
+            return {}
+
+
+    def hottest(self, filename=None, size=None):
+        '''
+        Returns a list of ( kind, key tuple, hits ) from the profile file,
+        hottest first.  If size is given, only that many entries are returned.
+        '''
+        counts = self.read_counts(filename or self.filename)
+        entries = sorted(( ( entry[0], entry[1:], hits ) for entry, hits in counts.items() ), key=lambda e: -e[2])
+        return entries[:size] if size is not None else entries
+
+
+def profile_path(path):
+    '''Returns the path relative to BASE_DIR (so profiles survive a move), or the absolute path if outside it'''
+    relpath = os.path.relpath(os.path.abspath(path), settings.BASE_DIR)
+    if relpath.startswith('..'):
+        return os.path.abspath(path)
+    return relpath.replace(os.path.sep, '/')
+
+
+
+# the profile used by the DMP loaders and router
+# (configured in apps.py from the USAGE_PROFILE and USAGE_PROFILE_INTERVAL options)
+USAGE_PROFILE = UsageProfile()
@@ -1,9 +1,34 @@
 from django.apps import apps
+from django.utils import timezone, translation
 
+import asyncio
+import contextvars
 import os, os.path
 import collections
+import functools
+import inspect
+import tempfile
 import zlib
 from importlib import import_module
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+try:
+    from asgiref.sync import sync_to_async, async_to_sync
+except ImportError:  # asgiref comes with Django 3.0+
+    sync_to_async = async_to_sync = None
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
 
 
 # set up the logger
@@ -135,3 +160,115 @@ def qualified_name(obj):
     if module is None or module == str.__class__.__module__:
         return obj.__qualname__
     return '{}.{}'.format(module, obj.__qualname__)
+
+
+#######################################################
+###   Async helpers
+
+def is_async_view(func):
+    '''Returns True if func (or the function it decorates) is an `async def` view'''
+    return iscoroutinefunction(func) or iscoroutinefunction(inspect.unwrap(func))
+
+
+async def run_in_thread(func, *args, **kwargs):
+    '''
+    Calls a sync function from async code and returns its result.  With asgiref, it runs
+    in the thread Django uses for sync code (so database connections work as usual).
+    '''
+    if sync_to_async is not None:
+        return await sync_to_async(func)(*args, **kwargs)
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def run_async(func, *args, **kwargs):
+    '''Calls an async function from sync code and returns its result'''
+    if async_to_sync is not None:
+        return async_to_sync(func)(*args, **kwargs)
+    return asyncio.run(func(*args, **kwargs))
+
+
+def with_thread_state(func):
+    '''
+    Wraps func to run in another thread with the current thread's active language,
+    time zone, and context variables.  Each wrapper can run in one thread at a time.
+    '''
+    language = translation.get_language()
+    tz = timezone.get_current_timezone()
+    context = contextvars.copy_context()
+    def run(*args, **kwargs):
+        with translation.override(language), timezone.override(tz):
+            return func(*args, **kwargs)
+    return functools.partial(context.run, run)
+
+
+
+def write_file_atomic(filename, content):
+    '''
+    Writes content (str or bytes) to a file so other processes never see a
+    partially-written file.  The content is written to a temporary file in the
+    same directory (so it is on the same filesystem) and then renamed into place.
+    '''
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(content)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmpname, filename)
+    except:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+
+
+################################################################
+###   Cross-process file lock
+
+class FileLock(object):
+    '''
+    An exclusive lock on a file that is held across processes (and threads).
+    Use it as a context manager:
+
+        with FileLock('/path/to/something.lock'):
+            ...
+
+    The lock file is created if needed and left in place afterward.  This uses
+    flock() on Unix and msvcrt.locking() on Windows.  If neither is available,
+    the lock does nothing.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.fd = None
+
+    def __enter__(self):
+        self.fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            elif msvcrt is not None:
+                # LK_LOCK only retries for 10 seconds, so keep trying until we get it
+                while True:
+                    try:
+                        msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+        except:
+            os.close(self.fd)
+            self.fd = None
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
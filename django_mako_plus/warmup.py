@@ -0,0 +1,226 @@
+from django.apps import apps
+from django.conf import settings
+from django.views.generic import View
+
+from .router.decorators import view_function
+from .router.discover import get_view_function
+from .usage import USAGE_PROFILE
+from .util import log
+
+from mako.exceptions import MakoException
+import gc
+import inspect
+import os, os.path
+import pkgutil
+import time
+from importlib import import_module
+
+
+# the subdirectories of each app that hold Mako templates
+DEFAULT_SUBDIRS = [ 'templates', 'scripts', 'styles' ]
+
+# file extensions that are compiled as Mako templates
+DEFAULT_EXTENSIONS = [ '.htm', '.html', '.mako', '.jsm', '.cssm' ]
+
+
+#########################################################
+###   Pre-fork warmup
+###
+###   Servers like gunicorn (with --preload) import the project in a master
+###   process and then fork the workers.  Anything built before the fork is
+###   shared copy-on-write by all workers, so this loads the DMP state that is
+###   otherwise built lazily by the first requests of each worker:
+###
+###     - compiled templates (the template registry)
+###     - view functions and their parameter converters (CACHED_VIEW_FUNCTIONS)
+###     - provider instances for each template (ProviderRun.CONTENT_PROVIDERS)
+###
+###   Afterward, gc.freeze() moves everything to the permanent generation so
+###   the collector doesn't touch (and copy) those pages in the workers.
+###
+###   For large projects, loading everything can be too slow.  When a usage
+###   profile is given (see usage.py), only its hottest entries are loaded.
+
+
+def warmup(app_names=None, freeze=True, profile=None, size=None):
+    '''
+    Loads the templates, views, and providers of the given apps (all project apps if None).
+    This is run automatically at the end of DMP's ready() when the WARMUP option is True,
+    or it can be called directly (e.g. from wsgi.py or a gunicorn `on_starting` hook).
+
+    If profile is the filename of a usage profile, only the `size` hottest entries
+    in it are loaded (all of them if size is None) rather than everything in the apps.
+
+    Note that view functions and provider instances are only cached when DEBUG is False.
+
+    Returns a dictionary describing what was loaded, how long it took, and how many
+    objects it created.
+    '''
+    start = time.perf_counter()
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    report = {
+        'apps': [],
+        'templates': 0,
+        'views': 0,
+        'providers': 0,
+        'errors': [],
+    }
+
+    # loading things here shouldn't count as usage
+    recording, USAGE_PROFILE.enabled = USAGE_PROFILE.enabled, False
+    try:
+        if profile is not None:
+            warmup_profile(report, app_names, profile, size)
+        else:
+            warmup_apps(report, app_names)
+    finally:
+        USAGE_PROFILE.enabled = recording
+
+    # move everything we created to the permanent generation
+    gc.collect()
+    report['frozen'] = 0
+    if freeze and hasattr(gc, 'freeze'):   # Python 3.7+
+        gc.freeze()
+        report['frozen'] = gc.get_freeze_count()
+
+    # report
+    report['seconds'] = time.perf_counter() - start
+    report['objects'] = len(gc.get_objects()) + report['frozen'] - objects_before
+    log.info('warmup loaded %s templates, %s views, and %s providers in %s app(s) in %.3f seconds (%s new objects, %s frozen)',
+        report['templates'], report['views'], report['providers'], len(report['apps']), report['seconds'], report['objects'], report['frozen'])
+    for error in report['errors']:
+        log.warning('warmup failed: %s', error)
+    return report
+
+
+def warmup_apps(report, app_names=None):
+    '''Loads everything in the given apps, adding the counts to report'''
+    dmp = apps.get_app_config('django_mako_plus')
+    # register the apps (normally done in urls.py, which hasn't been imported yet)
+    for app in get_warmup_apps(app_names):
+        dmp.register_app(app)
+        report['apps'].append(app.name)
+
+        # templates and their providers
+        for subdir in DEFAULT_SUBDIRS:
+            loader = dmp.engine.get_template_loader(app, subdir, create=True)
+            for template_name in find_template_names(os.path.join(app.path, subdir), DEFAULT_EXTENSIONS):
+                try:
+                    template = loader.get_mako_template(template_name)
+                except MakoException as e:
+                    report['errors'].append('{}/{}/{}: {}'.format(app.name, subdir, template_name, e))
+                    continue
+                report['templates'] += 1
+                if subdir == 'templates':
+                    report['providers'] += warmup_providers(template)
+
+        # view functions
+        for module_name, function_name in find_view_names(app, report['errors']):
+            try:
+                get_view_function(module_name, function_name, app.name)
+                report['views'] += 1
+            except Exception as e:
+                report['errors'].append('{}.{}: {}'.format(module_name, function_name, e))
+
+
+def warmup_profile(report, app_names, profile, size=None):
+    '''Loads the hottest entries of a usage profile, adding the counts to report'''
+    dmp = apps.get_app_config('django_mako_plus')
+    for app in get_warmup_apps(app_names):
+        dmp.register_app(app)
+        report['apps'].append(app.name)
+
+    for kind, key, hits in USAGE_PROFILE.hottest(profile, size):
+        try:
+            if kind == 'template' or kind == 'def':
+                template_dir, template_name = key[:2]
+                loader = dmp.engine.get_template_loader_for_path(os.path.join(settings.BASE_DIR, template_dir))
+                template = loader.get_mako_template(template_name)
+                if kind == 'def':
+                    template.get_def(key[2])
+                else:
+                    report['templates'] += 1
+                    if os.path.basename(template_dir) == 'templates':
+                        report['providers'] += warmup_providers(template)
+            elif kind == 'view':
+                get_view_function(*key)
+                report['views'] += 1
+        except Exception as e:
+            report['errors'].append('{} {}: {}'.format(kind, '/'.join(( str(k) for k in key )), e))
+
+
+def get_warmup_apps(app_names=None):
+    '''
+    Returns the AppConfigs to warm up.  If app_names is None, this is the same
+    set of apps that DMP's urls.py registers: the apps in the project directory
+    and the DEFAULT_APP.
+    '''
+    dmp = apps.get_app_config('django_mako_plus')
+    if app_names is not None:
+        return [ apps.get_app_config(name) for name in app_names ]
+    enapps = []
+    for config in apps.get_app_configs():
+        if os.path.samefile(os.path.dirname(config.path), settings.BASE_DIR):
+            enapps.append(config)
+    if dmp.options['DEFAULT_APP']:
+        try:
+            config = apps.get_app_config(dmp.options['DEFAULT_APP'])
+            if config not in enapps:
+                enapps.append(config)
+        except LookupError:
+            pass  # the default app isn't an installed app, so skip it
+    return enapps
+
+
+def find_template_names(path, extensions):
+    '''
+    Generator of template names (relative to path) in the given directory.
+    Any files or subdirectories starting with double-underscores (e.g. __dmpcache__) are skipped.
+    '''
+    if not os.path.isdir(path):
+        return
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(( d for d in dirs if not d.startswith('__') ))
+        for filename in sorted(files):
+            if filename.startswith('__') or os.path.splitext(filename)[1].lower() not in extensions:
+                continue
+            yield os.path.relpath(os.path.join(root, filename), path).replace(os.path.sep, '/')
+
+
+def find_view_names(app, errors):
+    '''
+    Generator of ( module name, function name ) for the view functions and
+    class-based views in app/views/*.py.  Import errors are appended to errors.
+    '''
+    package_name = '{}.views'.format(app.name)
+    try:
+        package = import_module(package_name)
+    except ImportError:
+        return  # no views package
+    for module_info in pkgutil.iter_modules(package.__path__):
+        if module_info.ispkg:
+            continue
+        module_name = '{}.{}'.format(package_name, module_info.name)
+        try:
+            module = import_module(module_name)
+        except Exception as e:
+            errors.append('{}: {}'.format(module_name, e))
+            continue
+        for name, obj in sorted(vars(module).items()):
+            # views imported from other modules are found in their own modules
+            if getattr(obj, '__module__', None) != module_name:
+                continue
+            if inspect.isclass(obj):
+                if issubclass(obj, View):
+                    yield module_name, name
+            elif callable(obj) and view_function.is_decorated(obj):
+                yield module_name, name
+
+
+def warmup_providers(template):
+    '''Creates (and caches) the provider instances for a template. Returns the number created.'''
+    from .provider.runner import ProviderRun
+    for pci in ProviderRun.CONTENT_PROVIDERS:
+        pci.cls.instance_for_template(template, pci.options)
+    return len(ProviderRun.CONTENT_PROVIDERS)
@@ -0,0 +1,196 @@
+from .util import log
+
+import logging
+import os, os.path
+import threading
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+#########################################################
+###   File watcher for DEBUG mode
+###
+###   Without a watcher, DEBUG mode turns several caches off so changes show
+###   up on the next request: view functions are found again, provider
+###   instances are recreated (which stats and CRCs static files), and
+###   Mako stats each template.  That's a lot of syscalls per page.
+###
+###   When the watcher is active, these caches stay on in DEBUG mode.
+###   The watcher tells its listeners when a file changes, and each
+###   listener invalidates exactly the entries that depend on the file:
+###
+###     - the template registry discards the template (registry.py)
+###     - the router drops cached view functions (router/discover.py)
+###     - providers that watch the file are cleared (provider/base.py)
+###
+###   watchdog (inotify, FSEvents, etc.) is used when installed.  Otherwise,
+###   a background thread polls the watched directories.
+
+
+class FileWatcher(object):
+    '''
+    Watches directories (recursively) and calls listeners with the
+    absolute path of each file that is created, modified, or deleted.
+    Files and directories starting with a period or double-underscore
+    (e.g. __pycache__, __dmpcache__, and temp files) are ignored.
+    '''
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.directories = set()
+        self.listeners = []
+        self.active = False
+        self.interval = 1.0
+        self.observer = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.snapshot = {}
+
+
+    def add_listener(self, listener):
+        '''Adds a function that is called as listener(path) when a file changes'''
+        with self.lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+
+    def add_directory(self, path):
+        '''Watches the given directory and its subdirectories'''
+        path = os.path.abspath(path)
+        with self.lock:
+            if path in self.directories or any(( path.startswith(d + os.path.sep) for d in self.directories )):
+                return
+            self.directories.add(path)
+            if self.observer is not None:
+                self.observer.schedule(WatchdogHandler(self), path, recursive=True)
+            elif self.active:
+                self.snapshot.update(self.scan(path))
+
+
+    def start(self, interval=1.0, use_watchdog=True):
+        '''
+        Starts watching.  Uses watchdog if installed (and use_watchdog is True),
+        otherwise polls every `interval` seconds in a background thread.
+        '''
+        with self.lock:
+            if self.active:
+                return
+            self.interval = interval
+            self.stop_event.clear()
+            if use_watchdog and Observer is not None:
+                self.observer = Observer()
+                for path in self.directories:
+                    self.observer.schedule(WatchdogHandler(self), path, recursive=True)
+                self.observer.daemon = True
+                self.observer.start()
+            else:
+                self.snapshot = {}
+                for path in self.directories:
+                    self.snapshot.update(self.scan(path))
+                self.thread = threading.Thread(target=self.run, name='dmp-file-watcher', daemon=True)
+                self.thread.start()
+            self.active = True
+        log.info('file watcher started (%s)', 'watchdog' if self.observer is not None else 'polling every {}s'.format(interval))
+
+
+    def stop(self):
+        '''Stops watching. The caches go back to the normal DEBUG behavior.'''
+        with self.lock:
+            self.active = False
+            self.stop_event.set()
+            observer, self.observer = self.observer, None
+            thread, self.thread = self.thread, None
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
+    def notify(self, path):
+        '''Tells the listeners that the given file changed'''
+        path = os.path.abspath(path)
+        if self.is_ignored(path):
+            return
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('file watcher: %s changed', path)
+        for listener in list(self.listeners):
+            try:
+                listener(path)
+            except Exception:
+                log.exception('file watcher listener %s failed for %s', listener, path)
+
+
+    def is_watched(self, path):
+        '''Returns True if the watcher is active and the file is in one of the watched directories'''
+        if not self.active:
+            return False
+        path = os.path.abspath(path)
+        return any(( path.startswith(d + os.path.sep) for d in self.directories ))
+
+
+    def is_ignored(self, path):
+        '''Returns True if the path is a hidden, temporary, or cache file (such as in __pycache__, but not __init__.py)'''
+        return any(( part.startswith('.') or (part.startswith('__') and not part.endswith('.py')) for part in path.split(os.path.sep) if part ))
+
+
+    ### Polling ###
+
+    def run(self):
+        '''Polling loop (runs in the background thread)'''
+        while not self.stop_event.wait(self.interval):
+            self.poll()
+
+
+    def poll(self):
+        '''Scans the watched directories once, notifying listeners of any changes'''
+        with self.lock:
+            current = {}
+            for path in self.directories:
+                current.update(self.scan(path))
+            previous, self.snapshot = self.snapshot, current
+        for path in previous.keys() - current.keys():
+            self.notify(path)
+        for path, stat in current.items():
+            if previous.get(path) != stat:
+                self.notify(path)
+
+
+    def scan(self, path):
+        '''Returns a dict of filename -> ( mtime, size ) for the files in the given directory tree'''
+        files = {}
+        for root, dirs, filenames in os.walk(path):
+            dirs[:] = [ d for d in dirs if not d.startswith('.') and not d.startswith('__') ]
+            for filename in filenames:
+                if filename.startswith('.') or filename.startswith('__'):
+                    continue
+                fullpath = os.path.join(root, filename)
+                try:
+                    st = os.stat(fullpath)
+                except OSError:
+                    continue  # deleted during the scan
+                files[fullpath] = ( st.st_mtime_ns, st.st_size )
+        return files
+
+
+
+class WatchdogHandler(FileSystemEventHandler):
+    '''Forwards watchdog events to the file watcher'''
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        self.watcher.notify(event.src_path)
+        if getattr(event, 'dest_path', None):
+            self.watcher.notify(event.dest_path)
+
+
+
+# the watcher used by DMP (started in apps.py when DEBUG and the FILE_WATCHER option are True)
+FILE_WATCHER = FileWatcher()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+'''
+Benchmarks for DMP's performance features.  They time code paths and print the
+results, so they aren't part of the test suite (see runtests.py).  They run in the
+test project with a test database.
+
+    python3 runbenchmarks.py                   # all benchmarks
+    python3 runbenchmarks.py dispatch_table    # just the named ones
+'''
+import os
+import sys
+import timeit
+
+
+BENCHMARKS = {}
+
+def benchmark(func):
+    '''Registers a benchmark function'''
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def report(title, rows):
+    '''Prints a benchmark's results'''
+    print(title)
+    for row in rows:
+        print('    ' + row)
+    print()
+
+
+
+#####################################################
+###   URL dispatch
+
+@benchmark
+def dispatch_table():
+    '''Resolve time stays flat with the dispatch table as apps grow (the per-app resolvers grow linearly)'''
+    from django.urls import include, re_path
+    from django.urls.resolvers import RegexPattern, URLResolver
+    from django_mako_plus import app_resolver, dispatch_resolver
+    path = '/homepage/index.basic/1/2/'
+    timings = {}
+    for num_apps in ( 5, 200 ):
+        # stand-in apps (their resolvers are only checked, never matched)
+        names = [ 'app{}'.format(i) for i in range(num_apps - 1) ]
+        legacy = URLResolver(RegexPattern(r'^/'), [ re_path('^{}/?'.format(name), include(( [], name ))) for name in names ] + [ app_resolver('homepage') ])
+        pattern = dispatch_resolver([ 'homepage' ], default_app=False)
+        pattern.app_names.update(( name, name ) for name in names)
+        dispatch = URLResolver(RegexPattern(r'^/'), [ pattern ])
+        for name, resolver in ( ( 'legacy', legacy ), ( 'dispatch', dispatch ) ):
+            resolver.resolve(path)
+            timings[name, num_apps] = min(timeit.repeat(lambda: resolver.resolve(path), number=200, repeat=5)) / 200
+    report(dispatch_table.__doc__, [
+        '{:>8} resolver, {:>3} apps: {:.1f} us per resolve'.format(key[0], key[1], seconds * 1e6)
+        for key, seconds in sorted(timings.items())
+    ])
+
+
+
+#####################################################
+###   Routing data
+
+@benchmark
+def routing_data():
+    '''Per-request allocation of RoutingData (the prototype and view are shared)'''
+    from django_mako_plus.router import RoutingData
+    import tracemalloc
+    def allocate(count, use_urlparams):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            routes = [ RoutingData('homepage', 'index', 'basic', '1/a%20b/3') for i in range(count) ]
+            if use_urlparams:
+                [ rd.urlparams for rd in routes ]
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        return sum(( stat.size_diff for stat in after.compare_to(before, 'filename') )) / count
+    RoutingData('homepage', 'index', 'basic', '1/a%20b/3')
+    report(routing_data.__doc__, [
+        '{:>16}: {:.0f} bytes per request'.format('lazy urlparams', allocate(1000, False)),
+        '{:>16}: {:.0f} bytes per request'.format('parsed urlparams', allocate(1000, True)),
+    ])
+
+
+
+#####################################################
+###   Parameter conversion
+
+@benchmark
+def converter_plan():
+    '''The precomputed binding plan beats looking up each converter per request'''
+    from django.test import RequestFactory
+    from django_mako_plus.converter import ParameterConverter
+    from django_mako_plus.router.data import RoutingData
+    class WalkingConverter(ParameterConverter):
+        # overriding convert_value() turns the plan off (the pre-plan behavior)
+        def convert_value(self, value, parameter, request):
+            return super().convert_value(value, parameter, request)
+
+    timings = {}
+    for num_params in ( 1, 5, 10 ):
+        names = [ 'p{}'.format(i) for i in range(num_params) ]
+        namespace = {}
+        exec('def view(request, {}): pass'.format(', '.join(( '{}:int'.format(n) for n in names ))), namespace)
+        request = RequestFactory().get('/')
+        request.dmp = RoutingData()
+        request.dmp.urlparams = [ str(i) for i in range(num_params) ]
+        for name, cls in ( ( 'plan', ParameterConverter ), ( 'walking', WalkingConverter ) ):
+            converter = cls(namespace['view'])
+            converter.convert_parameters(request)
+            timings[name, num_params] = min(timeit.repeat(lambda: converter.convert_parameters(request), number=500, repeat=5)) / 500
+    report(converter_plan.__doc__, [
+        '{:>8} converter, {:>2} int parameters: {:.1f} us per request'.format(key[0], key[1], seconds * 1e6)
+        for key, seconds in sorted(timings.items())
+    ])
+
+
+
+@benchmark
+def datetime_formats():
+    '''The format classifier and ISO fast path beat trying every format with strptime'''
+    from django.conf import settings
+    from django_mako_plus.converter.formats import InputFormats
+    import datetime
+    parser = InputFormats('DATETIME_INPUT_FORMATS')
+    formats = settings.DATETIME_INPUT_FORMATS
+    def strptime_loop(value):
+        for fmt in formats:
+            try:
+                return datetime.datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+    timings = {}
+    for value in ( '2026-10-25 14:30:59', '2026-10-25', '10/25/26 14:30' ):
+        for name, func in ( ( 'strptime loop', strptime_loop ), ( 'classifier', parser.parse ) ):
+            timings[name, value] = min(timeit.repeat(lambda: func(value), number=500, repeat=5)) / 500
+    report(datetime_formats.__doc__, [
+        '{:>13}: {:>22}: {:.1f} us'.format(key[0], key[1], seconds * 1e6)
+        for key, seconds in sorted(timings.items(), key=lambda item: item[0][::-1])
+    ])
+
+
+
+#####################################################
+###   Async views
+
+@benchmark
+def async_views():
+    '''Concurrent async views overlap their waits (each request sleeps 0.2s)'''
+    from django.test import RequestFactory
+    from django_mako_plus.router import RequestViewWrapper
+    from django_mako_plus.router.data import RoutingData
+    from django_mako_plus.util import run_async
+    import asyncio
+    import django
+    import time
+    num_requests, delay = 100, 0.2
+    path = '/homepage/async_views.sleeper/{}/'.format(delay)
+
+    async def direct():
+        views = []
+        for i in range(num_requests):
+            routing_data = RoutingData('homepage', 'async_views', 'sleeper', [ str(delay) ])
+            routing_data.request = RequestFactory().get(path)
+            views.append(( RequestViewWrapper(routing_data), routing_data.request ))
+        await asyncio.gather(*( wrapper(request) for wrapper, request in views ))
+
+    async def asgi():
+        from django.core.handlers.asgi import ASGIHandler
+        handler = ASGIHandler()
+        async def get():
+            scope = {
+                'type': 'http', 'asgi': { 'version': '3.0' }, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': path, 'raw_path': path.encode('ascii'), 'query_string': b'', 'root_path': '',
+                'headers': [ ( b'host', b'testserver' ) ], 'server': ( 'testserver', 80 ), 'client': ( '127.0.0.1', 50000 ),
+            }
+            received = asyncio.Queue()
+            received.put_nowait({ 'type': 'http.request', 'body': b'', 'more_body': False })
+            async def send(message):
+                pass
+            await handler(scope, received.get, send)
+        await asyncio.gather(*( get() for i in range(num_requests) ))
+
+    rows = []
+    for name, func in ( ( 'view wrapper', direct ), ( 'ASGI handler', asgi ) ):
+        if func is asgi and django.VERSION < ( 3, 1 ):
+            rows.append('{:>12}: skipped (async views under ASGI require Django 3.1+)'.format(name))
+            continue
+        start = time.perf_counter()
+        run_async(func)
+        rows.append('{:>12}: {} concurrent requests in {:.2f}s (sequentially: {:.0f}s)'.format(name, num_requests, time.perf_counter() - start, num_requests * delay))
+    report(async_views.__doc__, rows)
+
+
+
+#####################################################
+###   Streaming
+
+@benchmark
+def streaming():
+    '''Streaming sends the first bytes sooner and holds much less memory than a full render'''
+    from django.apps import apps
+    import time
+    import tracemalloc
+    dmp = apps.get_app_config('django_mako_plus')
+    template = dmp.engine.get_template_loader('homepage').get_template('report.html')
+    context = { 'rows': 25000, 'redirect_to': None }
+    rows = []
+    for stream in ( False, True ):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = template.render_to_response(context, stream=stream)
+        first = None
+        size = 0
+        for chunk in response:
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(chunk)
+        total = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        response.close()
+        rows.append('{:>9}: {:.1f} MB page, first byte {:.1f} ms, complete {:.1f} ms, peak memory {:.1f} MB'.format(
+            'streaming' if stream else 'buffered', size / 1e6, first * 1e3, total * 1e3, peak / 1e6))
+    report(streaming.__doc__, rows)
+
+
+
+#####################################################
+###   Parallel sections
+
+@benchmark
+def parallel():
+    '''Parallel sections take about as long as the slowest one, rather than the sum of them'''
+    from django.apps import apps
+    import time
+    dmp = apps.get_app_config('django_mako_plus')
+    template = dmp.engine.get_template_loader('homepage').get_template('parallel.html')
+    delay = 0.2
+    start = time.perf_counter()
+    template.render({ 'delay': delay, 'wait': lambda d: time.sleep(d) or '' })
+    report(parallel.__doc__, [
+        '3 sections of {:.0f} ms each: {:.0f} ms'.format(delay * 1e3, (time.perf_counter() - start) * 1e3),
+    ])
+
+
+
+#####################################################
+###   Context processors
+
+@benchmark
+def context_processors_per_request():
+    '''Rendering 50 partials in a request is cheaper when the processors run once'''
+    from django.apps import apps
+    from django.test import RequestFactory
+    from django_mako_plus.router.data import RoutingData
+    dmp = apps.get_app_config('django_mako_plus')
+    template = dmp.engine.get_template_loader('homepage').get_template('partial.htm')
+    request = RequestFactory().get('/homepage/index/')
+    request.dmp = RoutingData()
+    request.dmp.request = request
+    def render_partials():
+        request.dmp.context_processor_output = None
+        for i in range(50):
+            template.render({ 'name': i }, request)
+    timings = {}
+    option = dmp.options['CONTEXT_PROCESSORS_PER_REQUEST']
+    try:
+        for per_request in ( False, True ):
+            dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'] = per_request
+            timings[per_request] = min(timeit.repeat(render_partials, number=5, repeat=5)) / 250
+    finally:
+        dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'] = option
+    report(context_processors_per_request.__doc__, [
+        'processors {:>11}: {:.1f} us per partial'.format('per request' if per_request else 'per render', seconds * 1e6)
+        for per_request, seconds in sorted(timings.items())
+    ])
+
+
+
+@benchmark
+def context_processors_skip_unused():
+    '''A template that reads none of the processor variables skips the processors'''
+    from django.apps import apps
+    from django.test import RequestFactory
+    from django_mako_plus.router.data import RoutingData
+    dmp = apps.get_app_config('django_mako_plus')
+    template = dmp.engine.get_template_loader('homepage').get_template('index.basic.html')
+    def render():
+        request = RequestFactory().get('/homepage/index/')
+        request.dmp = RoutingData()
+        request.dmp.request = request
+        template.render(None, request)
+    timings = {}
+    options = dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'], dmp.options['CONTEXT_PROCESSORS_SKIP_UNUSED']
+    try:
+        dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'] = True
+        for skip in ( False, True ):
+            dmp.options['CONTEXT_PROCESSORS_SKIP_UNUSED'] = skip
+            timings[skip] = min(timeit.repeat(render, number=50, repeat=5)) / 50
+    finally:
+        dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'], dmp.options['CONTEXT_PROCESSORS_SKIP_UNUSED'] = options
+    report(context_processors_skip_unused.__doc__, [
+        '{:>14}: {:.1f} us per render'.format('skip unused' if skip else 'all processors', seconds * 1e6)
+        for skip, seconds in sorted(timings.items())
+    ])
+
+
+
+#####################################################
+###   Autoescaping
+
+@benchmark
+def escaping():
+    '''A 10,000 cell table renders faster without a post-processor object per expression'''
+    from django.apps import apps
+    from django_mako_plus.template.lexer import DMPLexer
+    from mako.lexer import Lexer
+    from mako.template import Template
+    dmp = apps.get_app_config('django_mako_plus')
+    text = '<table>\n% for row in rows:\n<tr>\n% for cell in row:\n<td>${ cell }</td>\n% endfor\n</tr>\n% endfor\n</table>'
+    rows = [ [ '<cell {}:{}>'.format(i, j) for j in range(10) ] for i in range(1000) ]
+    templates = {
+        # how templates compiled before: an ExpressionPostProcessor for every expression
+        'post-processor object': Template(text.replace('${ cell }', '${ cell | django_mako_plus.ExpressionPostProcessor(self) }'), lexer_cls=Lexer, imports=dmp.template_imports, default_filters=[]),
+        'compiled filter': Template(text, lexer_cls=DMPLexer, imports=dmp.template_imports, default_filters=[]),
+    }
+    timings = {}
+    for name, template in templates.items():
+        timings[name] = min(timeit.repeat(lambda: template.render_unicode(rows=rows), number=3, repeat=3)) / 3
+    report(escaping.__doc__, [
+        '{:>21}: {:.1f} ms per 10,000 cells'.format(name, seconds * 1000)
+        for name, seconds in timings.items()
+    ])
+
+
+
+#####################################################
+###   Main
+
+if __name__ == "__main__":
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests_project'))
+    sys.path.insert(0, os.getcwd())
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'tests_project.settings'
+    import django
+    django.setup()
+    from django.test.utils import setup_test_environment, teardown_test_environment, get_runner
+    from django.urls import get_resolver
+    from django.conf import settings
+    import logging
+    # the test project logs DMP's debug messages, which would bury the results
+    logging.getLogger('django_mako_plus').setLevel(logging.WARNING)
+
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [ name for name in names if name not in BENCHMARKS ]
+    if unknown:
+        sys.exit('Unknown benchmarks: {}. Choose from: {}'.format(', '.join(unknown), ', '.join(BENCHMARKS)))
+    setup_test_environment()
+    # loads the project urls, which registers the DMP apps
+    get_resolver().url_patterns
+    runner = get_runner(settings)(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        for name in names:
+            BENCHMARKS[name]()
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
@@ -7,6 +7,27 @@ class IceCream(models.Model):
     rating = models.IntegerField(default=0)
 
 
+class FavoriteIceCream(IceCream):
+    '''A proxy model, used in testing the model cache'''
+    class Meta:
+        proxy = True
+
+
+class FrozenYogurt(IceCream):
+    '''A multi-table child, used in testing the model cache'''
+    culture = models.TextField(default='')
+
+
+class Topping(models.Model):
+    name = models.TextField()
+
+
+class Sundae(models.Model):
+    name = models.TextField()
+    ice_cream = models.ForeignKey(IceCream, on_delete=models.CASCADE)
+    toppings = models.ManyToManyField(Topping)
+
+
 
 class MyInt(int):
     '''Used in testing for specialized types'''
@@ -0,0 +1,117 @@
+from django.apps import apps
+from django.http import Http404
+from django.test import TestCase, RequestFactory
+
+import django
+from django_mako_plus.converter import ParameterConverter
+from django_mako_plus.router import RequestViewWrapper
+from django_mako_plus.router.data import RoutingData
+from django_mako_plus.router.decorators import CONVERTER_ATTRIBUTE_NAME
+from django_mako_plus.util import iscoroutinefunction, run_async
+from homepage.models import IceCream
+
+import asyncio
+
+
+def get_view(function, *urlparams, request=None):
+    '''Returns ( wrapper, request ) for a view in homepage/views/async_views.py, as the resolver and middleware would'''
+    routing_data = RoutingData('homepage', 'async_views', function, list(urlparams))
+    if request is None:
+        request = RequestFactory().get('/homepage/async_views.{}/{}'.format(function, '/'.join(urlparams)))
+    routing_data.request = request
+    return RequestViewWrapper(routing_data), request
+
+
+class Tester(TestCase):
+    fixtures = [ 'ice_cream.json' ]
+
+    def test_async_view(self):
+        wrapper, request = get_view('sleeper', '0.01')
+        self.assertTrue(iscoroutinefunction(wrapper))
+        response = run_async(wrapper, request)
+        self.assertEqual(response.content, b'slept 0.01')
+        self.assertEqual(request.dmp.converted_params['delay'], 0.01)
+        # sync views keep their sync wrapper
+        self.assertFalse(iscoroutinefunction(get_view('from_sync')[0]))
+
+
+    def test_concurrency(self):
+        # each view waits for the other 19, so they only return if they run concurrently
+        views = [ get_view('rendezvous', 'concurrency', '20') for i in range(20) ]
+        async def run_all():
+            return await asyncio.gather(*( wrapper(request) for wrapper, request in views ))
+        responses = run_async(run_all)
+        self.assertEqual([ r.content for r in responses ], [ b'met 20' ] * 20)
+
+
+    def test_async_converter(self):
+        # int, float, etc. convert in the event loop; models need a thread for the query
+        wrapper, request = get_view('sleeper')
+        self.assertFalse(getattr(wrapper.routing_data.callable, CONVERTER_ATTRIBUTE_NAME).plans[None].blocking)
+        wrapper, request = get_view('ice_cream', '2')
+        self.assertTrue(getattr(wrapper.routing_data.callable, CONVERTER_ATTRIBUTE_NAME).plans[None].blocking)
+        response = run_async(wrapper, request)
+        self.assertEqual(response.content.decode('utf8'), IceCream.objects.get(id=2).name)
+        wrapper, request = get_view('ice_cream', '5')
+        with self.assertRaises(Http404):
+            run_async(wrapper, request)
+
+
+    def test_arender(self):
+        wrapper, request = get_view('page')
+        response = run_async(wrapper, request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Hello world, this is DMP.', response.content)
+        dmp = apps.get_app_config('django_mako_plus')
+        template = dmp.engine.get_template_loader('homepage').get_template('index.basic.html')
+        async def render_both():
+            return await template.arender(), await template.arender(thread=True)
+        for content in run_async(render_both):
+            self.assertIn('Hello world, this is DMP.', content)
+
+
+    def test_internal_redirects(self):
+        # async view -> sync view
+        wrapper, request = get_view('to_sync')
+        self.assertEqual(run_async(wrapper, request).content, b'sync target')
+        # sync view -> async view
+        wrapper, request = get_view('from_sync')
+        self.assertEqual(wrapper(request).content, b'slept 0.05')
+
+
+    def test_asgi_load(self):
+        if django.VERSION < ( 3, 1 ):
+            self.skipTest('async views under ASGI require Django 3.1+')
+        from django.core.handlers.asgi import ASGIHandler
+        handler = ASGIHandler()
+
+        async def get(path):
+            scope = {
+                'type': 'http',
+                'asgi': { 'version': '3.0' },
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode('ascii'),
+                'query_string': b'',
+                'root_path': '',
+                'headers': [ ( b'host', b'testserver' ) ],
+                'server': ( 'testserver', 80 ),
+                'client': ( '127.0.0.1', 50000 ),
+            }
+            received = asyncio.Queue()
+            received.put_nowait({ 'type': 'http.request', 'body': b'', 'more_body': False })
+            messages = []
+            async def send(message):
+                messages.append(message)
+            await handler(scope, received.get, send)
+            return messages[0]['status'], b''.join(( m.get('body', b'') for m in messages[1:] ))
+
+        # through DMP's urls and middleware; each request waits for the others, so they
+        # only return if ASGI runs them concurrently (a sync view would be capped by the thread pool)
+        num_requests = 100
+        async def load():
+            return await asyncio.gather(*( get('/homepage/async_views.rendezvous/asgi/{}/'.format(num_requests)) for i in range(num_requests) ))
+        results = run_async(load)
+        self.assertEqual(results, [ ( 200, 'met {}'.format(num_requests).encode('utf8') ) ] * num_requests)
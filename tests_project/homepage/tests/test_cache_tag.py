@@ -0,0 +1,82 @@
+from django.apps import apps
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from mako.lookup import TemplateLookup
+
+from django_mako_plus.template import FRAGMENT_CACHE
+from django_mako_plus.template.fragment_cache import dependency_digest, key_text, source_digest
+from homepage.models import IceCream
+from django_mako_plus.template.lexer import DMPLexer
+
+import datetime
+import decimal
+import itertools
+import os
+import re
+import tempfile
+
+
+@override_settings(CACHES={ 'default': { 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache' } })
+class Tester(TestCase):
+
+    def setUp(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        self.template = dmp.engine.get_template_loader('homepage').get_template('dolls.html')
+        self.counter = itertools.count(1)
+        caches['default'].clear()
+        FRAGMENT_CACHE.reset_stats()
+
+    def render(self, version, items):
+        content = self.template.render({ 'counter': lambda: next(self.counter), 'version': version, 'items': items })
+        return re.search(r'list render (\d+)', content).group(1), re.findall(r'item (\w+=\w+) render (\d+)', content)
+
+
+    def test_russian_doll(self):
+        self.assertEqual(self.render(1, [ ( 1, 'a' ), ( 2, 'b' ) ]), ( '1', [ ( '1=a', '2' ), ( '2=b', '3' ) ] ))
+        self.assertEqual(self.render(1, [ ( 1, 'a' ), ( 2, 'b' ) ]), ( '1', [ ( '1=a', '2' ), ( '2=b', '3' ) ] ))
+        self.assertEqual(( FRAGMENT_CACHE.hits, FRAGMENT_CACHE.misses ), ( 1, 3 ))
+        # a changed item renders again with the list around it; the other item comes from the cache
+        self.assertEqual(self.render(2, [ ( 1, 'a' ), ( 2, 'c' ) ]), ( '4', [ ( '1=a', '2' ), ( '2=c', '5' ) ] ))
+        self.assertEqual(( FRAGMENT_CACHE.hits, FRAGMENT_CACHE.misses ), ( 2, 5 ))
+
+
+    def test_key_text(self):
+        ice_cream = IceCream(id=3, name='Vanilla')
+        self.assertEqual(key_text(( ice_cream, 'a', 2, decimal.Decimal('1.50'), None )), "(homepage.IceCream:3:,'a',2,Decimal('1.50'),None)")
+        self.assertEqual(key_text([ datetime.date(2026, 10, 18) ]), '(2026-10-18)')
+        # values without a stable text
+        with self.assertRaises(TypeError):
+            key_text(object())
+        with self.assertNumQueries(0), self.assertRaises(TypeError):
+            key_text(IceCream.objects.all())
+        with self.assertRaises(TypeError):
+            key_text(( 1, { 'a': object() } ))
+
+
+    def test_dependency_digest(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            def write(filename, text):
+                with open(os.path.join(tempdir, filename), 'w') as fout:
+                    fout.write(text)
+            def digests():
+                # a new lookup each time, since the digests are kept on the templates
+                lookup = TemplateLookup(directories=[ tempdir ], lexer_cls=DMPLexer)
+                return { name: dependency_digest(lookup.get_template(name)) for name in ( 'outer.htm', 'other.htm' ) }
+
+            write('outer.htm', '<%inherit file="base.htm"/>outer <%include file="inner.htm"/>')
+            write('other.htm', '<%inherit file="base.htm"/>other')
+            write('base.htm', 'base ${ self.body() }')
+            write('inner.htm', 'inner 1')
+            first = digests()
+            self.assertNotEqual(first['outer.htm'], source_digest('<%inherit file="base.htm"/>outer <%include file="inner.htm"/>'))
+
+            # only the templates that use a changed file get a new digest
+            write('inner.htm', 'inner 2')
+            second = digests()
+            self.assertNotEqual(second['outer.htm'], first['outer.htm'])
+            self.assertEqual(second['other.htm'], first['other.htm'])
+
+            write('base.htm', 'new base ${ self.body() }')
+            third = digests()
+            self.assertNotEqual(third['outer.htm'], second['outer.htm'])
+            self.assertNotEqual(third['other.htm'], second['other.htm'])
@@ -7,10 +7,14 @@ from django.test import TestCase
 from django.template import TemplateDoesNotExist, TemplateSyntaxError
 
 from django_mako_plus import get_template
+from django_mako_plus.template.loader import MakoTemplateLoader
 
 from io import StringIO
+from unittest import mock
 import os, os.path, sys
+import json
 import shutil
+import tempfile
 
 class Tester(TestCase):
 
@@ -73,6 +77,43 @@ class Tester(TestCase):
         result = self.subcommand('dmp_makemessages', '--ignore-template-errors', '--verbose')
 
 
+    def test_precompile(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        cache_dir = os.path.join(settings.BASE_DIR, 'homepage', 'templates', dmp.options['TEMPLATES_CACHE_DIR'])
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = os.path.join(tmpdir, 'manifest.json')
+            # a good app compiles in the process pool
+            self.subcommand('dmp_precompile', 'homepage', '--workers=2', '--manifest={}'.format(manifest))
+            self.assertTrue(os.path.exists(os.path.join(cache_dir, 'index.basic.html.py')))
+            with open(manifest) as fin:
+                data = json.load(fin)
+            self.assertEqual(data['errors'], 0)
+            self.assertIn('index.basic.html', [ t['template'] for t in data['templates'] ])
+            # an app with a syntax error fails the command
+            self.assertRaises(SystemExit, self.subcommand, 'dmp_precompile', 'errorsapp', '--manifest={}'.format(manifest))
+            with open(manifest) as fin:
+                data = json.load(fin)
+            self.assertEqual(data['errors'], 1)
+            self.assertEqual(data['templates'][0]['template'], 'syntax_error.html')
+            # any exception is a failure of that template; the others still compile
+            get_mako_template = MakoTemplateLoader.get_mako_template
+            def fail_basic(loader, template, *args, **kwargs):
+                if template == 'index.basic.html':
+                    raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+                return get_mako_template(loader, template, *args, **kwargs)
+            with mock.patch.object(MakoTemplateLoader, 'get_mako_template', fail_basic):
+                self.assertRaises(SystemExit, self.subcommand, 'dmp_precompile', 'homepage', '--manifest={}'.format(manifest))
+            with open(manifest) as fin:
+                data = json.load(fin)
+            self.assertEqual(data['errors'], 1)
+            self.assertGreater(data['compiled'], 0)
+            failed = [ t for t in data['templates'] if t['error'] is not None ]
+            self.assertEqual(failed[0]['template'], 'index.basic.html')
+            self.assertTrue(failed[0]['error'].startswith('UnicodeDecodeError'))
+
+
     def test_startapp(self):
         appdir = os.path.join(settings.BASE_DIR, 'teststartapp1')
         if os.path.exists(appdir):
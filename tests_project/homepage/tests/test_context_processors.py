@@ -0,0 +1,136 @@
+from django.apps import apps
+from django.contrib.auth import login, logout
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.test import TestCase, RequestFactory
+
+from django_mako_plus.router.data import RoutingData
+from django_mako_plus.template import MakoTemplateAdapter
+from django_mako_plus.template.analysis import CONTEXT_ANALYSIS, processor_path
+from django_mako_plus.template.lexer import DMPLexer
+from mako.template import Template
+
+
+class Tester(TestCase):
+
+    def setUp(self):
+        self.dmp = apps.get_app_config('django_mako_plus')
+        self.template = self.dmp.engine.get_template_loader('homepage').get_template('partial.htm')
+        # count the processor runs
+        self.calls = []
+        self.processors = self.dmp.engine.template_context_processors
+        self.dmp.engine.template_context_processors = self.processors + ( self.counting_processor, )
+        self.dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'] = True
+
+    def tearDown(self):
+        self.dmp.engine.template_context_processors = self.processors
+        self.dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'] = False
+        self.dmp.options['CONTEXT_PROCESSORS_SKIP_UNUSED'] = False
+        self.dmp.options['CONTEXT_PROCESSOR_NAMES'] = {}
+        CONTEXT_ANALYSIS.clear()
+
+    def counting_processor(self, request):
+        self.calls.append(request)
+        return { 'name': 'from the processor' }
+
+    def get_request(self):
+        request = RequestFactory().get('/homepage/index/')
+        request.dmp = RoutingData()
+        request.dmp.request = request
+        return request
+
+
+    def test_once_per_request(self):
+        request = self.get_request()
+        for i in range(5):
+            content = self.template.render({ 'name': 'partial{}'.format(i) }, request)
+            # the render's own context still wins over the processors
+            self.assertIn('partial{} /static/ AnonymousUser'.format(i), content)
+        self.assertEqual(len(self.calls), 1)
+        self.assertIn('user', request.dmp.context_processor_output)
+        self.assertIn('from the processor', self.template.render(None, request))
+        # resetting runs them again
+        request.dmp.context_processor_output = None
+        self.template.render(None, request)
+        self.assertEqual(len(self.calls), 2)
+        # requests without their own request.dmp keep the output on the request
+        request = RequestFactory().get('/')
+        self.template.render(None, request)
+        self.template.render(None, request)
+        self.assertEqual(len(self.calls), 3)
+        # each request runs them
+        self.template.render(None, self.get_request())
+        self.assertEqual(len(self.calls), 4)
+
+
+    def test_per_render_option(self):
+        self.dmp.options['CONTEXT_PROCESSORS_PER_REQUEST'] = False
+        request = self.get_request()
+        for i in range(3):
+            self.template.render({ 'name': 'partial' }, request)
+        self.assertEqual(len(self.calls), 3)
+
+
+    def test_login_resets_output(self):
+        # logging in or out changes the user and csrf token, so the processors run again
+        request = self.get_request()
+        request.session = SessionStore()
+        request.user = AnonymousUser()
+        self.assertIn('AnonymousUser', self.template.render(None, request))
+        login(request, User.objects.create_user('someone'))
+        self.assertIsNone(request.dmp.context_processor_output)
+        self.assertIn('/static/ someone', self.template.render(None, request))
+        logout(request)
+        self.assertIn('AnonymousUser', self.template.render(None, request))
+        self.assertEqual(len(self.calls), 3)
+
+
+    def test_context_names(self):
+        def names(text):
+            module = Template(text, lexer_cls=DMPLexer).module
+            return module._dmp_context_names, module._dmp_context_files
+        self.assertEqual(names('<%inherit file="base.htm"/>\n% for item in items:\n${ item.name | h }\n% endfor'), (( 'django', 'item', 'items' ), ( 'base.htm', )))
+        self.assertEqual(names('<% x = 1 %>${ x }'), (( 'x', ), ()))
+        # templates that can read any name
+        self.assertEqual(names('${ context.get("user") }')[0], None)
+        self.assertEqual(names('<%include file="${ name }"/>')[0], None)
+        self.assertEqual(names('<%namespace name="helpers" module="homepage.views.index"/>')[0], None)
+        self.assertIsNotNone(names('<%namespace name="dmp" module="django_mako_plus.tags"/>')[0])
+        # the namespaces can call defs and DMP's functions, but their context is open
+        self.assertEqual(names('${ django_mako_plus.links(self) }\n${ next.body() }\n<%self:content/>\n% if parent.attr.x:\n% endif')[0], ( 'django_mako_plus', ))
+        self.assertEqual(names('<%def name="box()">${ caller.body() }</%def>\n<%call expr="self.box()">${ user }</%call>')[0], ( 'user', ))
+        self.assertEqual(names("${ self.context.get('user') }")[0], None)
+        self.assertEqual(names("<% ctx = caller.context %>")[0], None)
+        self.assertEqual(names("${ helper(self) }")[0], None)
+        self.assertEqual(names("${ django_mako_plus.links(self, parent) }")[0], None)
+
+
+    def test_skip_unused(self):
+        self.dmp.options['CONTEXT_PROCESSORS_SKIP_UNUSED'] = True
+        self.dmp.options['CONTEXT_PROCESSOR_NAMES'] = { processor_path(self.counting_processor): [ 'name' ] }
+        loader = self.dmp.engine.get_template_loader('homepage')
+        request = self.get_request()
+        # index.basic.html and base.htm only read the request (through links())
+        content = loader.get_template('index.basic.html').render(None, request)
+        self.assertIn('Hello world', content)
+        self.assertIn('request', request.dmp.context_processor_output)
+        self.assertNotIn('user', request.dmp.context_processor_output)
+        self.assertEqual(len(self.calls), 0)
+        skipped = CONTEXT_ANALYSIS.report()[loader.get_mako_template('index.basic.html').filename]
+        self.assertIn('django.contrib.auth.context_processors.auth', skipped)
+        self.assertNotIn('django.template.context_processors.request', skipped)
+        # a later render in the request runs the processors it needs
+        self.assertIn('from the processor', self.template.render(None, request))
+        self.assertIn('user', request.dmp.context_processor_output)
+        self.assertEqual(len(self.calls), 1)
+        # a template reading self.context runs them all
+        template = MakoTemplateAdapter(Template("${ self.context.get('user') }", lexer_cls=DMPLexer, imports=self.dmp.template_imports))
+        request = self.get_request()
+        self.assertEqual(template.render(None, request), 'AnonymousUser')
+        self.assertEqual(len(self.calls), 2)
+        # the option turns it off
+        self.dmp.options['CONTEXT_PROCESSORS_SKIP_UNUSED'] = False
+        request = self.get_request()
+        loader.get_template('index.basic.html').render(None, request)
+        self.assertIn('user', request.dmp.context_processor_output)
+
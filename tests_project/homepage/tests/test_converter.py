@@ -1,9 +1,17 @@
-from django.test import TestCase
+from django.apps import apps
+from django.core.cache import caches
+from django.conf import settings
+from django.test import TestCase, RequestFactory, override_settings
 
+from django_mako_plus.converter import ParameterConverter, Cached, Fetch, MODEL_CACHE
+from django_mako_plus.converter.formats import InputFormats
+from django_mako_plus.router.data import RoutingData
 from django_mako_plus.util import log
-from homepage.models import IceCream, MyInt
+from homepage.models import IceCream, FavoriteIceCream, FrozenYogurt, MyInt, Sundae, Topping
 import datetime
 import decimal
+import threading
+from unittest import mock
 
 
 class Tester(TestCase):
@@ -94,6 +102,139 @@ class Tester(TestCase):
         resp = self.client.get('/homepage/converter/s/3/4/1/abc/')
         self.assertEqual(resp.status_code, 404)
 
+    def test_model_queries(self):
+        # all three objects come from one query
+        with self.assertNumQueries(1):
+            resp = self.client.get('/homepage/converter.models/1/2/3/')
+        self.assertEqual(resp.status_code, 200)
+        req = resp.wsgi_request
+        self.assertEqual([ req.dmp.converted_params[n].id for n in ( 'ic', 'ic2', 'ic3' ) ], [ 1, 2, 3 ])
+        self.assertIs(req.dmp.identity_map[IceCream, 1], req.dmp.converted_params['ic'])
+        # repeated ids and defaults aren't queried
+        with self.assertNumQueries(1):
+            resp = self.client.get('/homepage/converter.models/2/2/-/')
+        self.assertIs(resp.wsgi_request.dmp.converted_params['ic'], resp.wsgi_request.dmp.converted_params['ic2'])
+        self.assertIsNone(resp.wsgi_request.dmp.converted_params['ic3'])
+        # missing objects are 404 without another query
+        with self.assertNumQueries(1):
+            resp = self.client.get('/homepage/converter.models/1/5/')
+        self.assertEqual(resp.status_code, 404)
+        # the redirected view finds the first object in the identity map
+        with self.assertNumQueries(2):
+            resp = self.client.get('/homepage/converter.models_redirect/1/2/3/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, b'model conversion tests')
+        self.assertEqual(resp.wsgi_request.dmp.converted_params['ic3'].id, 3)
+
+    def test_model_fetch(self):
+        sundae = Sundae.objects.create(name='Banana Split', ice_cream=IceCream.objects.get(id=1))
+        sundae.toppings.set([ Topping.objects.create(name='Nuts'), Topping.objects.create(name='Fudge') ])
+        # without hints: the sundae, then its ice cream and toppings during the view
+        with self.assertNumQueries(3):
+            resp = self.client.get('/homepage/converter.sundae/{}/'.format(sundae.id))
+        self.assertEqual(resp.content, b'Banana Split with Mint Chocolate Chip and Nuts, Fudge')
+        # with hints: the sundae joined to its ice cream, then the toppings
+        with self.assertNumQueries(2):
+            resp = self.client.get('/homepage/converter.sundae_fetch/{}/'.format(sundae.id))
+        self.assertEqual(resp.content, b'Banana Split with Mint Chocolate Chip and Nuts, Fudge')
+        # only() defers the other fields, and the plain parameter is loaded separately
+        with self.assertNumQueries(2):
+            resp = self.client.get('/homepage/converter.sundae_only/{0}/{0}/'.format(sundae.id))
+        params = resp.wsgi_request.dmp.converted_params
+        self.assertEqual(params['sundae'].get_deferred_fields(), { 'ice_cream_id' })
+        self.assertEqual(params['plain'].get_deferred_fields(), set())
+        self.assertIsNot(params['sundae'], params['plain'])
+
+    def test_model_cache(self):
+        caches['default'].clear()
+        sundae = Sundae.objects.create(name='Banana Split', ice_cream=IceCream.objects.get(id=1))
+        # a Cached hint loads through the cache
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/homepage/converter.sundae_cached/{}/'.format(sundae.id)).content, b'Banana Split')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/homepage/converter.sundae_cached/{}/'.format(sundae.id)).content, b'Banana Split')
+        # saving invalidates
+        sundae.name = 'Hot Fudge'
+        sundae.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/homepage/converter.sundae_cached/{}/'.format(sundae.id)).content, b'Hot Fudge')
+
+        # models in the MODEL_CACHE option are always cached
+        dmp = apps.get_app_config('django_mako_plus')
+        MODEL_CACHE.configure({ 'homepage.IceCream': 60 })
+        try:
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/homepage/converter.models/1/2/3/').status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get('/homepage/converter.models/1/2/3/').status_code, 200)
+            # deleting invalidates (and missing objects aren't cached)
+            IceCream.objects.filter(id=3).first().delete()
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/homepage/converter.models/1/2/3/').status_code, 404)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/homepage/converter.models/1/2/3/').status_code, 404)
+        finally:
+            MODEL_CACHE.configure(dmp.options['MODEL_CACHE'], dmp.options['MODEL_CACHE_ALIAS'], dmp.options['MODEL_CACHE_LOCK_TIMEOUT'])
+
+    def test_model_cache_related_models(self):
+        cache = caches['default']
+        cache.clear()
+        dmp = apps.get_app_config('django_mako_plus')
+        MODEL_CACHE.configure({ 'homepage.IceCream': 60, 'homepage.FrozenYogurt': 60 })
+        try:
+            # saving through a proxy deletes the concrete model's entry
+            self.assertEqual(MODEL_CACHE.get_many(IceCream.objects, [ 1 ], Cached()), { 1: IceCream.objects.get(id=1) })
+            self.assertIsNotNone(cache.get(MODEL_CACHE.make_key(IceCream, 1)))
+            FavoriteIceCream.objects.get(id=1).save()
+            self.assertIsNone(cache.get(MODEL_CACHE.make_key(IceCream, 1)))
+            # saving a multi-table child deletes its parent's entry, and the other way around
+            yogurt = FrozenYogurt.objects.create(name='Tart', culture='live')
+            MODEL_CACHE.get_many(IceCream.objects, [ yogurt.pk ], Cached())
+            MODEL_CACHE.get_many(FrozenYogurt.objects, [ yogurt.pk ], Cached())
+            yogurt.save()
+            self.assertIsNone(cache.get(MODEL_CACHE.make_key(IceCream, yogurt.pk)))
+            MODEL_CACHE.get_many(IceCream.objects, [ yogurt.pk ], Cached())
+            IceCream.objects.get(pk=yogurt.pk).save()
+            self.assertIsNone(cache.get(MODEL_CACHE.make_key(FrozenYogurt, yogurt.pk)))
+            # a Fetch that loads related objects isn't cached
+            sundae = Sundae.objects.create(name='Banana Split', ice_cream=IceCream.objects.get(id=1))
+            fetch = Fetch(select_related=[ 'ice_cream' ])
+            for i in range(2):
+                with self.assertNumQueries(1):
+                    MODEL_CACHE.get_many(fetch.apply(Sundae.objects.all()), [ sundae.id ], Cached(), fetch)
+            self.assertIsNone(cache.get(MODEL_CACHE.make_key(Sundae, sundae.id)))
+        finally:
+            MODEL_CACHE.configure(dmp.options['MODEL_CACHE'], dmp.options['MODEL_CACHE_ALIAS'], dmp.options['MODEL_CACHE_LOCK_TIMEOUT'])
+            cache.clear()
+
+    def test_model_cache_stampede(self):
+        cache = caches['default']
+        cache.clear()
+        key = MODEL_CACHE.make_key(IceCream, 1)
+        lock_timeout, MODEL_CACHE.lock_timeout = MODEL_CACHE.lock_timeout, 0.5
+        MODEL_CACHE.reset_stats()
+        try:
+            # another process is loading the object: wait for it rather than querying
+            cache.add(key + '::lock', 1)
+            ice_cream = IceCream.objects.get(id=1)
+            def load():
+                cache.set(key, { '': ice_cream })
+                cache.delete(key + '::lock')
+            timer = threading.Timer(0.1, load)
+            timer.start()
+            with self.assertNumQueries(0):
+                self.assertEqual(MODEL_CACHE.get_many(IceCream.objects, [ 1 ], Cached()), { 1: ice_cream })
+            timer.join()
+            # the other process never finishes: load from the database after the lock timeout
+            cache.clear()
+            cache.add(key + '::lock', 1)
+            with self.assertNumQueries(1):
+                self.assertEqual(MODEL_CACHE.get_many(IceCream.objects, [ 1 ], Cached()), { 1: ice_cream })
+            self.assertEqual(( MODEL_CACHE.hits, MODEL_CACHE.misses, MODEL_CACHE.timeouts ), ( 1, 0, 1 ))
+        finally:
+            MODEL_CACHE.lock_timeout = lock_timeout
+            cache.clear()
+
     def test_empty_more(self):
         resp = self.client.get('/homepage/converter.more_testing/')
         self.assertEqual(resp.status_code, 200)
@@ -105,6 +246,33 @@ class Tester(TestCase):
         self.assertIsNone(req.dmp.converted_params['dt'])
         self.assertIsNone(req.dmp.converted_params['dttm'])
 
+    def test_sources(self):
+        resp = self.client.get('/homepage/converter.sources/1,2,3/?page=2&tag=4&tag=5&since=2026-10-25', HTTP_X_API_VERSION='3')
+        self.assertEqual(resp.status_code, 200)
+        params = resp.wsgi_request.dmp.converted_params
+        self.assertEqual(params['since'], datetime.date(2026, 10, 25))
+        self.assertEqual(params['ids'], [ 1, 2, 3 ])
+        self.assertEqual(params['page'], 2)
+        self.assertEqual(params['tags'], [ 4, 5 ])
+        self.assertIsNone(params['flavors'])
+        self.assertEqual(params['version'], 3)
+        # missing values use the defaults (None for Optional, [] for List)
+        resp = self.client.get('/homepage/converter.sources/')
+        self.assertEqual(resp.status_code, 200)
+        params = resp.wsgi_request.dmp.converted_params
+        self.assertEqual(( params['since'], params['ids'], params['page'], params['tags'], params['version'] ), ( None, [], 1, None, 1 ))
+        # bad values are 404 before the view runs
+        for url in ( '/homepage/converter.sources/?page=abc', '/homepage/converter.sources/?since=abc', '/homepage/converter.sources/1,x/', '/homepage/converter.sources/?tag=1&tag=x' ):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        # ... and before the models are loaded
+        with self.assertNumQueries(0):
+            resp = self.client.post('/homepage/converter.sources/?page=abc', { 'flavor': [ 1, 2, 3 ] })
+        self.assertEqual(resp.status_code, 404)
+        # lists of models load together
+        with self.assertNumQueries(1):
+            resp = self.client.post('/homepage/converter.sources/', { 'flavor': [ 1, 2, 3 ] })
+        self.assertEqual([ ic.id for ic in resp.wsgi_request.dmp.converted_params['flavors'] ], [ 1, 2, 3 ])
+
     def test_datetime(self):
         resp = self.client.get('/homepage/converter.more_testing/1.23/2026-10-25/2026-10-25%2014:30:59/3/')
         self.assertEqual(resp.status_code, 200)
@@ -118,6 +286,35 @@ class Tester(TestCase):
         resp = self.client.get('/homepage/converter.more_testing/1.23/2026-10-25/abcd/3/')
         self.assertEqual(resp.status_code, 404)
 
+    def test_datetime_formats(self):
+        def strptime_loop(value, formats):
+            for fmt in formats:
+                try:
+                    return datetime.datetime.strptime(value, fmt)
+                except ValueError:
+                    continue
+            return None
+        def parse(parser, value):
+            try:
+                return parser.parse(value)
+            except ValueError:
+                return None
+        values = [
+            '2026-10-25', '2026-1-5', '2026-10-25 14:30', '2026-10-25 14:30:59', '2026-10-25 14:30:59.5', '2026-10-25  4:30',
+            '2026-10-25T14:30', '2026-13-25', '10/25/2026', '10/25/26 14:30:59.123456', '1/5/26', 'Oct 25 2026', '25 October, 2026',
+            'oct 25, 2026', '', 'abcd', '2026-10-25 14:30:59+00:00', '20261025',
+        ]
+        # same results as trying each format in order
+        for setting in ( 'DATETIME_INPUT_FORMATS', 'DATE_INPUT_FORMATS' ):
+            parser = InputFormats(setting)
+            for value in values:
+                self.assertEqual(parse(parser, value), strptime_loop(value, getattr(settings, setting)), value)
+        # the regex is rebuilt when the setting changes
+        parser = InputFormats('DATE_INPUT_FORMATS')
+        with override_settings(DATE_INPUT_FORMATS=[ '%d/%m/%Y', '%Y-%m-%d' ]):
+            self.assertEqual(parser.parse('05/01/2026'), datetime.datetime(2026, 1, 5))
+        self.assertEqual(parser.parse('05/01/2026'), datetime.datetime(2026, 5, 1))
+
     def test_decimal(self):
         resp = self.client.get('/homepage/converter.more_testing/1.23/2026-10-25/2026-10-25%2014:30:59/3/')
         self.assertEqual(resp.status_code, 200)
@@ -166,3 +363,26 @@ class Tester(TestCase):
         self.assertEqual(req.dmp.converted_params['f'], 4.0)
         self.assertTrue(req.dmp.converted_params['b'])
         self.assertEqual(req.dmp.converted_params['ic'], IceCream.objects.get(pk=2))
+
+    def test_plan(self):
+        '''The precomputed binding plan gives the same values as looking up each converter, without the lookups'''
+        class WalkingConverter(ParameterConverter):
+            # overriding convert_value() turns the plan off (the pre-plan behavior)
+            def convert_value(self, value, parameter, request):
+                return super().convert_value(value, parameter, request)
+
+        for num_params in ( 1, 5, 10 ):
+            names = [ 'p{}'.format(i) for i in range(num_params) ]
+            namespace = {}
+            exec('def view(request, {}): pass'.format(', '.join(( '{}:int'.format(n) for n in names ))), namespace)
+            request = RequestFactory().get('/')
+            request.dmp = RoutingData()
+            request.dmp.urlparams = [ str(i) for i in range(num_params) ]
+            expected = { n: i for i, n in enumerate(names) }
+            self.assertEqual(WalkingConverter(namespace['view']).convert_parameters(request)[1], expected)
+            converter = ParameterConverter(namespace['view'])
+            self.assertEqual(converter.convert_parameters(request)[1], expected)
+            # the plan was made on the first request
+            with mock.patch.object(ParameterConverter, '_bind_converter') as bind_converter:
+                self.assertEqual(converter.convert_parameters(request)[1], expected)
+            bind_converter.assert_not_called()
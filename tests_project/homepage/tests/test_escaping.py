@@ -0,0 +1,85 @@
+from django.apps import apps
+from django.test import TestCase
+from django.utils.html import mark_safe
+from django.utils.translation import gettext_lazy
+
+from django_mako_plus.template import MakoTemplateLoader
+from django_mako_plus.template.lexer import DMPLexer
+from mako.template import Template
+
+import os
+import tempfile
+
+
+class Tester(TestCase):
+
+    def get_template(self, text, lexer_cls=DMPLexer):
+        dmp = apps.get_app_config('django_mako_plus')
+        return Template(text, lexer_cls=lexer_cls, imports=dmp.template_imports, default_filters=[])
+
+
+    def test_escaping(self):
+        template = self.get_template('''
+            <%namespace name="dmp" module="django_mako_plus.tags"/>
+            <%def name="cell(value)"><td>${ value }</td></%def>
+            1:${ tag }
+            2:${ tag | n }
+            3:${ tag | h }
+            4:${ safe }
+            5:${ lazy }
+            6:${ number }
+            7:${ cell(tag) }
+            <%dmp:autoescape_off>
+                8:${ tag }
+                9:${ cell(tag) }
+                <%dmp:autoescape_on>10:${ tag }</%dmp:autoescape_on>
+                11:${ tag | h }
+            </%dmp:autoescape_off>
+            12:${ tag }
+        ''')
+        content = template.render_unicode(tag='<b>', safe=mark_safe('<i>'), lazy=gettext_lazy('Hello'), number=42)
+        lines = { line.split(':', 1)[0]: line.split(':', 1)[1] for line in content.split() if ':' in line }
+        self.assertEqual(lines['1'], '&lt;b&gt;')
+        self.assertEqual(lines['2'], '<b>')
+        self.assertEqual(lines['3'], '&lt;b&gt;')
+        self.assertEqual(lines['4'], '<i>')
+        self.assertEqual(lines['5'], 'Hello')
+        self.assertEqual(lines['6'], '42')
+        self.assertEqual(lines['7'], '<td>&lt;b&gt;</td>')
+        self.assertEqual(lines['8'], '<b>')
+        self.assertEqual(lines['9'], '<td><b></td>')
+        self.assertEqual(lines['10'], '&lt;b&gt;')
+        self.assertEqual(lines['11'], '&lt;b&gt;')
+        self.assertEqual(lines['12'], '&lt;b&gt;')
+        # the filter is chosen once per body, not created per expression
+        self.assertNotIn('ExpressionPostProcessor', template.code)
+        self.assertIn('django_mako_plus.expression_text', template.code)
+
+
+    def test_autoescape_option(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        dmp.options['AUTOESCAPE'] = False
+        try:
+            template = self.get_template('${ tag } ${ tag | h }')
+        finally:
+            dmp.options['AUTOESCAPE'] = True
+        self.assertEqual(template.render_unicode(tag='<b>'), '<b> &lt;b&gt;')
+        self.assertNotIn('_dmp_escape', template.code)
+
+
+    def test_autoescape_recompile(self):
+        # a cached module compiled with the other setting is compiled again
+        dmp = apps.get_app_config('django_mako_plus')
+        with tempfile.TemporaryDirectory() as template_dir:
+            with open(os.path.join(template_dir, 'tag.html'), 'w') as fout:
+                fout.write('${ tag }')
+            def render():
+                loader = MakoTemplateLoader(template_dir, None, use_registry=False)
+                return loader.get_template('tag.html').render({ 'tag': '<b>' })
+            self.assertEqual(render(), '&lt;b&gt;')
+            dmp.options['AUTOESCAPE'] = False
+            try:
+                self.assertEqual(render(), '<b>')
+            finally:
+                dmp.options['AUTOESCAPE'] = True
+            self.assertEqual(render(), '&lt;b&gt;')
@@ -0,0 +1,64 @@
+from django.apps import apps
+from django.core.cache import caches
+from django.test import TestCase, RequestFactory, override_settings
+
+from django_mako_plus.template import FRAGMENT_CACHE
+
+import itertools
+import re
+import tempfile
+import time
+
+
+class Tester(TestCase):
+
+    def setUp(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        self.template = dmp.engine.get_template_loader('homepage').get_template('fragments.html')
+        self.counter = itertools.count(1)
+        FRAGMENT_CACHE.reset_stats()
+
+    def render(self, username):
+        request = RequestFactory().get('/homepage/fragments/')
+        request.user = User(username)
+        content = self.template.render({ 'counter': lambda: next(self.counter) }, request)
+        return re.search(r'Hello (\w+), render (\d+)', content).groups(), re.search(r'headlines (\d+)', content).group(1)
+
+
+    def test_locmem(self):
+        with override_settings(CACHES={ 'default': { 'BACKEND': 'django.core.cache.backends.locmem.LocMemCache' } }):
+            self.check_fragments()
+
+
+    def test_filebased(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            with override_settings(CACHES={ 'default': { 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempdir } }):
+                self.check_fragments()
+
+
+    def check_fragments(self):
+        caches['default'].clear()
+        # the greeting varies by user; the headlines don't
+        self.assertEqual(self.render('alice'), (( 'alice', '1' ), '2' ))
+        self.assertEqual(self.render('alice'), (( 'alice', '1' ), '2' ))
+        self.assertEqual(self.render('bob'), (( 'bob', '3' ), '2' ))
+        self.assertEqual(( FRAGMENT_CACHE.hits, FRAGMENT_CACHE.misses ), ( 3, 3 ))
+
+        # after the timeout, the stale headlines are served while a thread renders them again
+        time.sleep(1.1)
+        self.assertEqual(self.render('alice'), (( 'alice', '1' ), '2' ))
+        FRAGMENT_CACHE.join(5)
+        self.assertEqual(( FRAGMENT_CACHE.stale_hits, FRAGMENT_CACHE.refreshes ), ( 1, 1 ))
+        self.assertEqual(self.render('alice'), (( 'alice', '1' ), '4' ))
+
+        # Mako's template.cache reaches the same entries
+        mako_template = self.template.mako_template
+        mako_template.cache.invalidate_def('headlines')
+        self.assertEqual(self.render('bob'), (( 'bob', '3' ), '5' ))
+
+
+
+class User(object):
+    '''A stand-in for the request user'''
+    def __init__(self, username):
+        self.username = username
@@ -0,0 +1,138 @@
+from django.apps import apps
+from django.test import TestCase
+
+from django_mako_plus.provider.base import TEMPLATE_ATTR_NAME
+from django_mako_plus.template import MakoTemplateLoader, TEMPLATE_REGISTRY
+import django_mako_plus.template.loader
+
+import multiprocessing
+import os, os.path
+import tempfile
+import unittest
+
+
+NUM_PROCESSES = 8
+NUM_TEMPLATES = 10
+
+
+def compile_tree(template_dir, template_names, counter_path, barrier):
+    '''Runs in a child process: compiles every template in the tree at the same time as the other children'''
+    # count the compiled modules that are written (across all processes)
+    original_write_module = django_mako_plus.template.loader.write_module
+    def counting_write_module(source, outputpath):
+        original_write_module(source, outputpath)
+        with open(counter_path, 'a') as fout:
+            fout.write('{}\n'.format(outputpath))
+    django_mako_plus.template.loader.write_module = counting_write_module
+    # a fresh loader, then everyone starts at once
+    loader = MakoTemplateLoader(template_dir, None)
+    barrier.wait()
+    for name in template_names:
+        content = loader.get_mako_template(name).render_unicode().strip()
+        if content != 'base {}'.format(name):
+            os._exit(1)
+    os._exit(0)
+
+
+class Tester(TestCase):
+
+    def test_single_flight_compile(self):
+        try:
+            ctx = multiprocessing.get_context('fork')
+        except ValueError:
+            raise unittest.SkipTest('the stress test requires the fork start method')
+        with tempfile.TemporaryDirectory() as template_dir:
+            # a tree of templates that all inherit from a base
+            with open(os.path.join(template_dir, 'base.htm'), 'w') as fout:
+                fout.write('base ${ self.body() }')
+            template_names = [ 'page{}.html'.format(i) for i in range(NUM_TEMPLATES) ]
+            for name in template_names:
+                with open(os.path.join(template_dir, name), 'w') as fout:
+                    fout.write('<%inherit file="base.htm" />{}'.format(name))
+            counter_path = os.path.join(template_dir, 'counter.txt')
+            open(counter_path, 'w').close()
+
+            # many processes compile the same tree at the same time
+            barrier = ctx.Barrier(NUM_PROCESSES)
+            processes = [ ctx.Process(target=compile_tree, args=(template_dir, template_names, counter_path, barrier)) for i in range(NUM_PROCESSES) ]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join(60)
+                self.assertEqual(p.exitcode, 0)
+
+            # each module was written exactly once, and no temp files were left behind
+            with open(counter_path) as fin:
+                written = fin.read().splitlines()
+            self.assertEqual(len(written), NUM_TEMPLATES + 1)   # +1 for base.htm
+            self.assertEqual(len(set(written)), NUM_TEMPLATES + 1)
+            for root, dirs, files in os.walk(os.path.join(template_dir, '__dmpcache__')):
+                self.assertFalse([ fn for fn in files if fn.endswith('.tmp') ])
+
+
+    def test_registry(self):
+        TEMPLATE_REGISTRY.clear()
+        homepage_loader = MakoTemplateLoader(apps.get_app_config('homepage').path)
+        errorsapp_loader = MakoTemplateLoader(apps.get_app_config('errorsapp').path)
+        # the same file reached through two lookups (and two uris) is loaded once
+        base1 = homepage_loader.get_mako_template('base.htm')
+        base2 = errorsapp_loader.get_mako_template('/homepage/templates/base.htm')
+        self.assertIs(base1.module, base2.module)
+        stats = TEMPLATE_REGISTRY.stats()
+        self.assertEqual(( stats['templates'], stats['misses'], stats['duplicates'] ), ( 1, 1, 1 ))
+        # each lookup resolves the template's paths through its own directories
+        self.assertIs(base1.lookup, homepage_loader.tlookup)
+        self.assertIs(base2.lookup, errorsapp_loader.tlookup)
+        self.assertIs(errorsapp_loader.get_mako_template('/homepage/templates/base.htm'), base2)
+        # loaders that opt out get their own copy
+        private_loader = MakoTemplateLoader(apps.get_app_config('homepage').path, use_registry=False)
+        self.assertIsNot(private_loader.get_mako_template('base.htm'), base1)
+        self.assertEqual(TEMPLATE_REGISTRY.stats()['duplicates'], 1)
+
+
+    def test_registry_lookup_dirs(self):
+        '''A shared template resolves its paths the same way no matter which lookup loaded it first'''
+        TEMPLATE_REGISTRY.clear()
+        with tempfile.TemporaryDirectory() as root:
+            for name, text in ( ( 'shared/page.html', 'page <%include file="/part.htm"/>' ), ( 'a/part.htm', 'A' ), ( 'b/part.htm', 'B' ) ):
+                os.makedirs(os.path.join(root, os.path.dirname(name)), exist_ok=True)
+                with open(os.path.join(root, name), 'w') as fout:
+                    fout.write(text)
+            loaders = {}
+            for name in ( 'a', 'b' ):
+                loaders[name] = MakoTemplateLoader(os.path.join(root, name), None)
+                loaders[name].tlookup.directories = [ os.path.join(root, name), os.path.join(root, 'shared') ]
+            self.assertEqual(loaders['a'].get_mako_template('page.html').render_unicode(), 'page A')
+            self.assertEqual(loaders['b'].get_mako_template('page.html').render_unicode(), 'page B')
+            self.assertEqual(loaders['a'].get_mako_template('page.html').render_unicode(), 'page A')
+            self.assertEqual(TEMPLATE_REGISTRY.stats()['duplicates'], 1)
+
+
+    def test_registry_eviction(self):
+        TEMPLATE_REGISTRY.clear()
+        loader = MakoTemplateLoader(apps.get_app_config('homepage').path)
+        try:
+            TEMPLATE_REGISTRY.configure(max_templates=2)
+            base = loader.get_mako_template('base.htm')
+            setattr(base, TEMPLATE_ATTR_NAME, { 'provider': object() })
+            loader.get_mako_template('index.html')
+            loader.get_mako_template('base.htm')   # now index.html is least recently used
+            loader.get_mako_template('filters.html')
+            stats = TEMPLATE_REGISTRY.stats()
+            self.assertEqual(( stats['templates'], stats['hits'], stats['misses'], stats['evictions'] ), ( 2, 1, 3, 1 ))
+            self.assertIs(loader.get_mako_template('base.htm'), base)
+            self.assertTrue(hasattr(base, TEMPLATE_ATTR_NAME))
+            # index.html was evicted, so it reloads (pushing out filters.html)
+            loader.get_mako_template('index.html')
+            self.assertEqual(TEMPLATE_REGISTRY.stats()['misses'], 4)
+            # base.htm is now the oldest, so it goes next (along with its providers)
+            loader.get_mako_template('filters.html')
+            self.assertNotIn(base.filename, TEMPLATE_REGISTRY)
+            self.assertFalse(hasattr(base, TEMPLATE_ATTR_NAME))
+            # the memory budget works the same way
+            TEMPLATE_REGISTRY.configure(max_memory=1)
+            self.assertEqual(len(TEMPLATE_REGISTRY), 1)
+            self.assertGreater(TEMPLATE_REGISTRY.stats()['memory'], 1)
+        finally:
+            dmp = apps.get_app_config('django_mako_plus')
+            TEMPLATE_REGISTRY.configure(dmp.options['TEMPLATES_CACHE_SIZE'], dmp.options['TEMPLATES_CACHE_MEMORY'])
@@ -0,0 +1,44 @@
+from django.apps import apps
+from django.test import TestCase
+
+import re
+import threading
+
+
+class Tester(TestCase):
+
+    def render(self, delay, wait):
+        dmp = apps.get_app_config('django_mako_plus')
+        template = dmp.engine.get_template_loader('homepage').get_template('parallel.html')
+        return template.render({ 'delay': delay, 'wait': wait })
+
+
+    def test_parallel(self):
+        # the three sections wait for each other, so they only finish if they run at the same time
+        barrier = threading.Barrier(3, timeout=5)
+        def wait(delay):
+            if delay:
+                barrier.wait()
+            return ''
+        content = self.render(1, wait)
+        # document order, with the task outside <%dmp:parallel> rendered inline
+        self.assertEqual(re.findall(r'<p>(\w+)', content), [ 'first', 'second', 'third', 'inline' ])
+        self.assertNotIn('dmp-parallel', content)
+
+
+    def test_parallel_threads(self):
+        threads = []
+        def wait(delay):
+            threads.append(threading.current_thread().name)
+            return ''
+        self.render(0, wait)
+        self.assertEqual(len(threads), 4)
+        self.assertTrue(all(( name.startswith('dmp-parallel') for name in threads[:3] )))
+        self.assertEqual(threads[3], threading.current_thread().name)
+
+
+    def test_parallel_error(self):
+        def wait(delay):
+            raise ValueError('section failed')
+        with self.assertRaises(ValueError):
+            self.render(0, wait)
@@ -1,5 +1,14 @@
+from django.apps import apps
 from django.test import TestCase
 
+from django_mako_plus.router import RoutingData
+from django_mako_plus.router.data import ROUTE_PROTOTYPES
+from django_mako_plus.router.discover import NOT_FOUND_VIEWS, view_file_changed
+import django_mako_plus.router.discover
+
+import os.path
+import tracemalloc
+from unittest import mock
 
 
 
@@ -30,6 +39,71 @@ class Tester(TestCase):
         self.assertEqual(resp.status_code, 404)
 
 
+    def test_not_found_cache(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        NOT_FOUND_VIEWS.clear()
+        key = ( 'homepage.views.wp_login', 'process_request' )
+        with mock.patch.object(django_mako_plus.router.discover, 'find_spec', wraps=django_mako_plus.router.discover.find_spec) as find_spec:
+            try:
+                for i in range(3):
+                    self.assertEqual(self.client.get('/wp-login/').status_code, 404)
+                self.assertEqual(find_spec.call_count, 1)
+                stats = NOT_FOUND_VIEWS.stats()
+                self.assertEqual(( stats['entries'], stats['misses'], stats['hits'] ), ( 1, 1, 2 ))
+
+                # a new template in the app (seen by the file watcher) clears the entry
+                view_file_changed(os.path.join(apps.get_app_config('homepage').path, 'templates', 'wp-login.html'))
+                self.assertNotIn(key, NOT_FOUND_VIEWS)
+
+                # entries expire
+                NOT_FOUND_VIEWS.configure(max_size=1, ttl=0)
+                self.assertEqual(self.client.get('/wp-login/').status_code, 404)
+                self.assertEqual(self.client.get('/wp-login/').status_code, 404)
+                self.assertEqual(find_spec.call_count, 3)
+                self.assertEqual(NOT_FOUND_VIEWS.stats()['expirations'], 1)
+
+                # the size is bounded
+                NOT_FOUND_VIEWS.configure(max_size=1, ttl=None)
+                self.assertEqual(self.client.get('/admin.php/').status_code, 404)
+                self.assertEqual(( len(NOT_FOUND_VIEWS), NOT_FOUND_VIEWS.stats()['evictions'] ), ( 1, 1 ))
+            finally:
+                NOT_FOUND_VIEWS.configure(dmp.options['VIEW_NOT_FOUND_CACHE_SIZE'], dmp.options['VIEW_NOT_FOUND_CACHE_TTL'])
+
+
+    def test_route_prototypes(self):
+        rd = RoutingData('homepage', 'index', 'basic', '1/a%20b/3')
+        proto = ROUTE_PROTOTYPES[( 'homepage', 'index', 'basic' )]
+        self.assertEqual(( rd.module, rd.function, rd.callable ), ( proto.module, proto.function, proto.callable ))
+        # urlparams are parsed on first use
+        self.assertIsNone(rd._urlparams)
+        self.assertEqual(rd.urlparams, [ '1', 'a b', '3' ])
+        rd.urlparams = [ 'x' ]
+        self.assertEqual(rd.urlparams, [ 'x' ])
+
+        # later requests copy the prototype without finding the view again
+        with mock.patch('django_mako_plus.router.data.get_view_function') as get_view_function:
+            rd2 = RoutingData('homepage', 'index', 'basic', '4')
+        get_view_function.assert_not_called()
+        self.assertIs(rd2.callable, proto.callable)
+        self.assertIsNone(rd2._urlparams)
+
+        # a RoutingData is about two blocks (the object and its dict); parsing the urlparams
+        # or finding the view again would add more per object.  The extra block per object is margin.
+        count = 1000
+        objects = [ None ] * count
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            for i in range(count):
+                objects[i] = RoutingData('homepage', 'index', 'basic', '4')
+            after = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+        self.assertLess(blocks, 3 * count)
+        self.assertTrue(all(rd._urlparams is None for rd in objects))
+
+
     def test_bad_response(self):
         resp = self.client.get('/homepage/index.bad_response/1/2/3/')
         self.assertEqual(resp.status_code, 500)
@@ -2,6 +2,8 @@ from django.apps import apps
 from django.test import TestCase
 from django.test.utils import override_settings
 
+from django_mako_plus.template import TEMPLATE_REGISTRY
+
 class Tester(TestCase):
 
     def setUp(self):
@@ -9,6 +11,7 @@ class Tester(TestCase):
         # during testing, and providers load differently for each
         dmp = apps.get_app_config('django_mako_plus')
         dmp.engine.template_loaders = {}
+        TEMPLATE_REGISTRY.clear()
 
 
     @override_settings(DEBUG=True)
@@ -0,0 +1,99 @@
+from django.apps import apps
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.test import TransactionTestCase
+
+import threading
+
+
+# streams don't start inside a transaction, which TestCase wraps around each test
+class Tester(TransactionTestCase):
+
+    def get_template(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        return dmp.engine.get_template_loader('homepage').get_template('report.html')
+
+
+    def test_streaming(self):
+        template = self.get_template()
+        context = { 'rows': 2000, 'redirect_to': None }
+        expected = template.render(context).encode('utf8')
+        chunks = list(template.stream(context, chunk_size=1000))
+        self.assertGreater(len(chunks), 50)
+        self.assertEqual(b''.join(chunks), expected)
+        response = template.render_to_response(context, stream=True)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertEqual(b''.join(response.streaming_content), expected)
+
+
+    def test_one_chunk_fallback(self):
+        # inside a transaction, the template renders in this thread (its queries stay in the transaction)
+        template = self.get_template()
+        context = { 'rows': 2000, 'redirect_to': None }
+        expected = template.render(context).encode('utf8')
+        with transaction.atomic():
+            self.assertEqual(template.stream(context, chunk_size=1000), [ expected ])
+        # and when the stream threads are all busy
+        dmp = apps.get_app_config('django_mako_plus')
+        dmp.options['STREAM_MAX_THREADS'] = 1
+        try:
+            stream = template.stream(context, chunk_size=1000)
+            self.assertEqual(template.stream(context, chunk_size=1000), [ expected ])
+            self.assertEqual(b''.join(stream), expected)
+            stream.thread.join(5)
+            self.assertGreater(len(list(template.stream(context, chunk_size=1000))), 1)
+        finally:
+            dmp.options['STREAM_MAX_THREADS'] = 16
+
+
+    def test_streaming_view(self):
+        # @view_function(stream=True) streams request.dmp.render()
+        response = self.client.get('/homepage/report/100/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content).count(b'<tr>'), 100)
+        response = self.client.get('/homepage/report.buffered/100/')
+        self.assertFalse(response.streaming)
+        # exceptions before the first chunk are handled as usual
+        response = self.client.get('/homepage/report/100/?redirect_to=/elsewhere/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/elsewhere/')
+
+
+    def test_early_flush(self):
+        dmp = apps.get_app_config('django_mako_plus')
+        template = dmp.engine.get_template_loader('homepage').get_template('early.html')
+        # the slow part waits until the head has been sent, so stream() only returns in time with early flush
+        head_sent = threading.Event()
+        context = { 'slow': lambda: '' if head_sent.wait(5) else 'Timed out' }
+        stream = template.stream(context, early_flush=True)
+        head_sent.set()
+        chunks = list(stream)
+        self.assertNotIn(b'Timed out', b''.join(chunks))
+        # the head (with the provider links) is the first chunk, then the body up to flush()
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].rstrip().endswith(b'</head>'))
+        self.assertIn(b'DMP_CONTEXT', chunks[0])
+        self.assertTrue(chunks[1].rstrip().endswith(b'Before the slow part</p>'))
+        self.assertIn(b'After the slow part', chunks[2])
+        # without early flush, the head waits for a full chunk
+        self.assertEqual(len(list(template.stream(context, early_flush=False))), 2)
+
+
+    def test_early_flush_split(self):
+        # Mako writes expressions separately, so </head> can be split across writes
+        dmp = apps.get_app_config('django_mako_plus')
+        template = dmp.engine.from_string('<html><head><${ "/" | n }head><body>${ "<p>body</p>" | n }</body></html>')
+        chunks = list(template.stream(early_flush=True))
+        self.assertEqual(chunks, [ b'<html><head></head>', b'<body><p>body</p></body></html>' ])
+
+
+    def test_closed_stream(self):
+        # closing the response (e.g. the client went away) stops the template
+        stream = self.get_template().stream({ 'rows': 100000, 'redirect_to': None }, chunk_size=100)
+        next(iter(stream))
+        stream.close()
+        stream.thread.join(5)
+        self.assertFalse(stream.thread.is_alive())
+
@@ -1,4 +1,9 @@
 from django.test import TestCase
+from django.urls.exceptions import Resolver404
+from django.urls.resolvers import RegexPattern, URLResolver
+
+from django_mako_plus import app_resolver, dispatch_resolver
+
 
 
 
@@ -95,3 +100,37 @@ class Tester(TestCase):
         resp = self.client.get('/')
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp.wsgi_request.resolver_match.url_name, PATTERN_NAME)
+
+
+    ###  Dispatch table
+
+    def resolve_routing(self, resolver, path):
+        '''Returns the routing data and url info for a path (or None if 404)'''
+        try:
+            match = resolver.resolve(path)
+        except Resolver404:
+            return None
+        rd = match.func.routing_data
+        return ( match.url_name, match.app_names, rd.app, rd.page, rd.function, rd.module, rd.callable, rd.view_type, list(rd.urlparams) )
+
+    def test_dispatch_table(self):
+        legacy = URLResolver(RegexPattern(r'^/'), [ app_resolver('homepage'), app_resolver() ])
+        dispatch = URLResolver(RegexPattern(r'^/'), [ dispatch_resolver([ 'homepage' ]) ])
+        for path in (
+            '/', '/homepage', '/homepage/', '/homepage/index', '/homepage/index/', '/homepage/index/1/2/3/',
+            '/homepage/index/1/2/3', '/homepage/index.basic/', '/homepage/index.basic/1/%20x/', '/homepage/index.class_based/',
+            '/index', '/index/', '/index/1/', '/index.basic/1/2', '/index.process_request/', '/homepage/homepage/',
+            '/homepage/index.does_not_exist/1/', '/homepage/nope/', '/homepage//', '/wp-login/', '/admin.php', '/a/b/c/',
+        ):
+            self.assertEqual(self.resolve_routing(dispatch, path), self.resolve_routing(legacy, path), path)
+        self.assertIsNone(self.resolve_routing(dispatch, '/homepage/nope/'))
+
+    def test_dispatch_table_many_apps(self):
+        '''Paths still resolve to their app when the dispatch table knows many apps'''
+        names = [ 'app{}'.format(i) for i in range(200) ]
+        pattern = dispatch_resolver([ 'homepage' ], default_app=False)
+        pattern.app_names.update(( name, name ) for name in names)
+        dispatch = URLResolver(RegexPattern(r'^/'), [ pattern ])
+        routing = self.resolve_routing(dispatch, '/homepage/index.basic/1/2/')
+        self.assertEqual(routing[2:5], ( 'homepage', 'index', 'basic' ))
+        self.assertEqual(routing[-1], [ '1', '2' ])
@@ -0,0 +1,112 @@
+from django.apps import apps
+from django.test import TestCase, Client
+
+from django_mako_plus import warmup
+from django_mako_plus.provider.base import TEMPLATE_ATTR_NAME
+from django_mako_plus.router.discover import CACHED_VIEW_FUNCTIONS
+from django_mako_plus.template import TEMPLATE_REGISTRY
+from django_mako_plus.usage import USAGE_PROFILE
+import homepage.views.index
+import homepage.views.report
+
+import gc
+import json
+import os, os.path
+import tempfile
+import threading
+from unittest import mock
+
+
+class Tester(TestCase):
+
+    def test_warmup(self):
+        TEMPLATE_REGISTRY.clear()
+        CACHED_VIEW_FUNCTIONS.clear()
+        # a view imported into another module
+        with mock.patch.object(homepage.views.report, 'decorated', homepage.views.index.decorated, create=True):
+            report = warmup(['homepage'], freeze=False)
+        self.assertEqual(report['apps'], [ 'homepage' ])
+        self.assertEqual(report['errors'], [])
+        self.assertEqual(report['frozen'], 0)
+        self.assertGreater(report['objects'], 0)
+        # templates are compiled and have their providers
+        self.assertEqual(report['templates'], len(TEMPLATE_REGISTRY))
+        index_path = os.path.join(apps.get_app_config('homepage').path, 'templates', 'index.html')
+        self.assertIn(index_path, TEMPLATE_REGISTRY)
+        self.assertTrue(hasattr(TEMPLATE_REGISTRY.get(index_path), TEMPLATE_ATTR_NAME))
+        # function and class-based views are cached
+        self.assertEqual(report['views'], len(CACHED_VIEW_FUNCTIONS))
+        self.assertIn(( 'homepage.views.index', 'process_request' ), CACHED_VIEW_FUNCTIONS)
+        self.assertIn(( 'homepage.views.index', 'class_based' ), CACHED_VIEW_FUNCTIONS)
+        self.assertNotIn(( 'homepage.views.index', 'View' ), CACHED_VIEW_FUNCTIONS)
+        # views imported into another module are only warmed in their own module
+        self.assertIn(( 'homepage.views.index', 'decorated' ), CACHED_VIEW_FUNCTIONS)
+        self.assertNotIn(( 'homepage.views.report', 'decorated' ), CACHED_VIEW_FUNCTIONS)
+
+
+    def test_warmup_errors(self):
+        report = warmup(['errorsapp'], freeze=False)
+        self.assertTrue(any(( 'syntax_error.html' in e for e in report['errors'] )))
+
+
+    def test_warmup_freeze(self):
+        if not hasattr(gc, 'freeze'):
+            self.skipTest('gc.freeze() requires Python 3.7+')
+        try:
+            report = warmup(['homepage'])
+            self.assertGreater(report['frozen'], 0)
+            self.assertGreater(gc.get_freeze_count(), 0)
+        finally:
+            gc.unfreeze()
+
+
+    def test_usage_profile(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            profile = os.path.join(tempdir, 'usage.json')
+            USAGE_PROFILE.configure(profile, interval=None)
+            try:
+                client = Client()
+                for i in range(3):
+                    client.get('/homepage/index.basic/')
+                client.get('/homepage/index/')
+                USAGE_PROFILE.save()
+                # a second worker merges its counts into the same file
+                client.get('/homepage/index.basic/')
+                USAGE_PROFILE.save()
+            finally:
+                USAGE_PROFILE.configure(None)
+            with open(profile) as fin:
+                hits = { ( e['kind'], ) + tuple(e['key']): e['hits'] for e in json.load(fin)['entries'] }
+            self.assertEqual(hits[( 'view', 'homepage.views.index', 'basic', 'homepage', 'index.basic.html' )], 4)
+            self.assertEqual(hits[( 'template', 'homepage/templates', 'index.basic.html' )], 4)
+            self.assertEqual(hits[( 'template', 'homepage/templates', 'index.html' )], 1)
+            # base.htm is pulled in through <%inherit>
+            self.assertEqual(hits[( 'template', 'homepage/templates', 'base.htm' )], 5)
+
+            # warmup loads only the hottest entries
+            TEMPLATE_REGISTRY.clear()
+            CACHED_VIEW_FUNCTIONS.clear()
+            report = warmup(['homepage'], freeze=False, profile=profile, size=3)
+            self.assertEqual(report['errors'], [])
+            self.assertEqual(( report['templates'], report['views'] ), ( 2, 1 ))
+            self.assertEqual(list(CACHED_VIEW_FUNCTIONS), [ ( 'homepage.views.index', 'basic' ) ])
+            self.assertEqual(len(TEMPLATE_REGISTRY), 2)
+
+
+    def test_usage_profile_thread(self):
+        '''Recording doesn't touch the file; saving merges the counts of every thread'''
+        with tempfile.TemporaryDirectory() as tempdir:
+            profile = os.path.join(tempdir, 'usage.json')
+            USAGE_PROFILE.configure(profile, interval=60)
+            try:
+                self.assertTrue(USAGE_PROFILE.thread.is_alive())
+                threads = [ threading.Thread(target=lambda: [ USAGE_PROFILE.record('template', 'app', 'page.html') for i in range(100) ]) for i in range(4) ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertFalse(os.path.exists(profile))
+                USAGE_PROFILE.save()
+            finally:
+                USAGE_PROFILE.configure(None)
+            self.assertEqual(USAGE_PROFILE.read_counts(profile), { ( 'template', 'app', 'page.html' ): 400 })
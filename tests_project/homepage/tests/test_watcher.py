@@ -0,0 +1,102 @@
+from django.apps import apps
+from django.test import TestCase, override_settings
+
+from django_mako_plus.provider.base import TEMPLATE_ATTR_NAME
+from django_mako_plus.provider.runner import ProviderRun
+from django_mako_plus.router.discover import get_view_function, CACHED_VIEW_FUNCTIONS
+from django_mako_plus.template import TEMPLATE_REGISTRY
+from django_mako_plus.watcher import FileWatcher, FILE_WATCHER
+
+import os, os.path
+import sys
+import tempfile
+
+
+class Tester(TestCase):
+
+    def test_polling(self):
+        changed = []
+        with tempfile.TemporaryDirectory() as tempdir:
+            watcher = FileWatcher()
+            watcher.add_directory(tempdir)
+            watcher.add_listener(changed.append)
+            watcher.snapshot = watcher.scan(tempdir)
+            filename = os.path.join(tempdir, 'index.html')
+            with open(filename, 'w') as fout:
+                fout.write('one')
+            os.makedirs(os.path.join(tempdir, '__dmpcache__'))
+            for ignored in ( '.index.html.tmp', '__dmpcache__/index.html.py' ):
+                with open(os.path.join(tempdir, ignored), 'w') as fout:
+                    fout.write('ignored')
+            watcher.poll()
+            self.assertEqual(changed, [ filename ])
+            watcher.poll()
+            self.assertEqual(changed, [ filename ])
+            with open(filename, 'w') as fout:
+                fout.write('three')
+            watcher.poll()
+            os.remove(filename)
+            watcher.poll()
+            self.assertEqual(changed, [ filename ] * 3)
+
+
+    @override_settings(DEBUG=True)
+    def test_invalidation(self):
+        started = not FILE_WATCHER.active
+        if started:
+            FILE_WATCHER.start(interval=3600, use_watchdog=False)
+        try:
+            homepage = apps.get_app_config('homepage')
+            dmp = apps.get_app_config('django_mako_plus')
+
+            # views stay cached in debug mode until their module changes
+            key = ( 'homepage.views.index', 'basic' )
+            CACHED_VIEW_FUNCTIONS.pop(key, None)
+            get_view_function(*key)
+            self.assertIn(key, CACHED_VIEW_FUNCTIONS)
+            FILE_WATCHER.notify(os.path.join(homepage.path, 'views', 'redirects.py'))
+            FILE_WATCHER.notify(os.path.join(homepage.path, 'views', 'index_old.py'))
+            self.assertIn(key, CACHED_VIEW_FUNCTIONS)
+            module = sys.modules['homepage.views.index']
+            FILE_WATCHER.notify(os.path.join(homepage.path, 'views', 'index.py'))
+            self.assertNotIn(key, CACHED_VIEW_FUNCTIONS)
+            # the module isn't reloaded under running requests (runserver restarts for code changes)
+            self.assertIs(sys.modules['homepage.views.index'], module)
+            # a changed package drops the views of its modules
+            get_view_function(*key)
+            FILE_WATCHER.notify(os.path.join(homepage.path, 'views', '__init__.py'))
+            self.assertNotIn(key, CACHED_VIEW_FUNCTIONS)
+
+            # templates aren't checked on disk, but are discarded when they change
+            loader = dmp.engine.get_template_loader('homepage')
+            template = loader.get_mako_template('index.basic.html')
+            self.assertFalse(loader.tlookup.is_checked(template.filename))
+            self.assertIs(loader.get_mako_template('index.basic.html'), template)
+
+            # providers stay cached until their static files change
+            TEMPLATE_REGISTRY.clear_providers(template)
+            for pci in ProviderRun.CONTENT_PROVIDERS:
+                pci.cls.instance_for_template(template, pci.options)
+            self.assertEqual(len(getattr(template, TEMPLATE_ATTR_NAME)), len(ProviderRun.CONTENT_PROVIDERS))
+            FILE_WATCHER.notify(os.path.join(homepage.path, 'styles', 'index.basic.css'))
+            self.assertFalse(hasattr(template, TEMPLATE_ATTR_NAME))
+
+            FILE_WATCHER.notify(template.filename)
+            self.assertNotIn(template.filename, TEMPLATE_REGISTRY)
+            self.assertIsNot(loader.get_mako_template('index.basic.html'), template)
+
+            # templates outside the watched directories are still checked on disk
+            with tempfile.TemporaryDirectory() as tempdir:
+                filename = os.path.join(tempdir, 'page.html')
+                with open(filename, 'w') as fout:
+                    fout.write('one')
+                path_loader = dmp.engine.get_template_loader_for_path(tempdir)
+                self.assertEqual(path_loader.get_mako_template('page.html').render_unicode(), 'one')
+                with open(filename, 'w') as fout:
+                    fout.write('two')
+                mtime = os.stat(filename).st_mtime + 10
+                os.utime(filename, ( mtime, mtime ))
+                self.assertEqual(path_loader.get_mako_template('page.html').render_unicode(), 'two')
+        finally:
+            if started:
+                FILE_WATCHER.stop()
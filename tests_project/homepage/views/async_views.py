@@ -0,0 +1,53 @@
+from django.http import HttpResponse
+from django_mako_plus import view_function, InternalRedirectException
+
+from homepage.models import IceCream
+
+import asyncio
+
+
+###  Async view function endpoints  ###
+
+@view_function
+async def sleeper(request, delay:float=0.05):
+    await asyncio.sleep(delay)
+    return HttpResponse('slept {}'.format(delay))
+
+# futures of the requests waiting in each rendezvous group
+RENDEZVOUS = {}
+
+@view_function
+async def rendezvous(request, group:str, size:int):
+    # returns once `size` requests of the group are waiting, so they only finish when they run concurrently
+    waiting = RENDEZVOUS.setdefault(group, [])
+    future = asyncio.get_event_loop().create_future()
+    waiting.append(future)
+    if len(waiting) == size:
+        for f in RENDEZVOUS.pop(group):
+            f.set_result(True)
+    try:
+        await asyncio.wait_for(future, 10)
+    except asyncio.TimeoutError:
+        RENDEZVOUS.pop(group, None)
+        return HttpResponse('timed out', status=504)
+    return HttpResponse('met {}'.format(size))
+
+@view_function
+async def ice_cream(request, ic:IceCream):
+    return HttpResponse(ic.name)
+
+@view_function
+async def page(request):
+    return await request.dmp.arender('index.basic.html')
+
+@view_function
+async def to_sync(request):
+    raise InternalRedirectException('homepage.views.async_views', 'sync_target')
+
+# should not be decorated with @view_function because a target of internal redirect
+def sync_target(request):
+    return HttpResponse('sync target')
+
+@view_function
+def from_sync(request):
+    raise InternalRedirectException('homepage.views.async_views', 'sleeper')
@@ -1,12 +1,13 @@
 from django.conf import settings
 from django.http import HttpResponse
 from django.views.generic import View
-from django_mako_plus import view_function, parameter_converter
+from django_mako_plus import view_function, parameter_converter, InternalRedirectException, Fetch, Cached, QueryParam, PostParam, HeaderParam
 
-from homepage.models import IceCream, MyInt
+from homepage.models import IceCream, MyInt, Sundae
 
 from . import view_function
 
+from typing import Annotated, List, Optional
 import decimal, datetime
 
 
@@ -20,6 +21,39 @@ def process_request(request, s:str='', i:int=1, f:float=2, b:bool=False, ic:IceC
 def more_testing(request, d:decimal.Decimal=None, dt:datetime.date=None, dttm:datetime.datetime=None, mi:MyInt=None):
     return HttpResponse('more parameter conversion tests')
 
+@view_function
+def models(request, ic:IceCream=None, ic2:IceCream=None, ic3:IceCream=None, **kwargs):
+    return HttpResponse('model conversion tests')
+
+@view_function
+def models_redirect(request, first:IceCream):
+    raise InternalRedirectException('homepage.views.converter', 'models')
+
+def describe_sundae(sundae):
+    return HttpResponse('{} with {} and {}'.format(sundae.name, sundae.ice_cream.name, ', '.join(t.name for t in sundae.toppings.all())))
+
+@view_function
+def sundae(request, sundae:Sundae):
+    return describe_sundae(sundae)
+
+@view_function
+def sundae_fetch(request, sundae:Annotated[Sundae, Fetch(select_related=[ 'ice_cream' ], prefetch_related=[ 'toppings' ])]):
+    return describe_sundae(sundae)
+
+@view_function
+def sundae_cached(request, sundae:Annotated[Sundae, Cached(timeout=60)]):
+    return HttpResponse(sundae.name)
+
+@view_function
+def sources(request, since:Annotated[Optional[datetime.date], QueryParam()], ids:List[int], page:Annotated[int, QueryParam()]=1,
+            tags:Annotated[List[int], QueryParam('tag')]=None, flavors:Annotated[List[IceCream], PostParam('flavor')]=None,
+            version:Annotated[int, HeaderParam('X-Api-Version')]=1):
+    return HttpResponse('parameter source tests')
+
+@view_function
+def sundae_only(request, sundae:Annotated[Sundae, Fetch(only=[ 'name' ])], plain:Sundae=None):
+    return HttpResponse(sundae.name)
+
 
 ###  Custom converter function  ###
 
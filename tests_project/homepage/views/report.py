@@ -0,0 +1,10 @@
+from django_mako_plus import view_function
+
+
+@view_function(stream=True)
+def process_request(request, rows:int=10):
+    return request.dmp.render('report.html', { 'rows': rows, 'redirect_to': request.GET.get('redirect_to') })
+
+@view_function
+def buffered(request, rows:int=10):
+    return request.dmp.render('report.html', { 'rows': rows, 'redirect_to': None })
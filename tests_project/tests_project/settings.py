@@ -44,6 +44,8 @@ TEMPLATES = [
                 'from django_mako_plus import django_syntax, jinja2_syntax, alternate_syntax',
             ],
             'PARAMETER_CONVERTER': 'homepage.views.RecordingConverter',
+            # the fragment cache tests use the Django cache plugin
+            'FRAGMENT_CACHE_IMPL': 'django',
         },
     },
     {